@@ -0,0 +1,433 @@
+"""
+Calculator Benchmark
+====================
+
+Load generator for the calculator server and the WebSocket bridges.
+
+Starts a server (and optionally a bridge) in subprocesses, drives it with a
+mix of expressions at one or more concurrency levels, and reports throughput
+and latency percentiles as JSON so runs can be compared on the same footing.
+
+    python benchmark.py --mode asyncio --concurrency 1,8,64 --requests 5000
+    python benchmark.py --bridge simple --connection both
+    python benchmark.py --port 8888 --mix scientific   # an already running server
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from protocol import MessageReader, encode_message
+
+MIXES = {
+    "basic": [
+        "2 + 3 * 4",
+        "(1 + 2) * (3 + 4)",
+        "10 / 4",
+        "2 ** 10",
+        "17 % 5",
+    ],
+    "scientific": [
+        "sin(pi/4) + cos(pi/3)",
+        "sqrt(2) * log(100)",
+        "exp(1.5) - ln(10)",
+        "atan(1) * 4",
+        "factorial(20) / factorial(18)",
+        "sinh(0.5) + tanh(0.25)",
+    ],
+    "heavy": [
+        "factorial(1500) % 1000003",
+        "2 ** 20000 % 1000007",
+        "pow(3, 100000, 1000000007)",
+    ],
+}
+MIXES["mixed"] = MIXES["basic"] + MIXES["scientific"]
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STARTUP_TIMEOUT = 15.0
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    # The smallest rank covering the fraction; the slack absorbs float error such as 0.95 * 20
+    rank = max(1, math.ceil(fraction * len(sorted_values) - 1e-9))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Throughput and latency statistics for one run, latencies in milliseconds"""
+    latencies = sorted(value * 1000.0 for value in latencies)
+    completed = len(latencies)
+    return {
+        "requests": completed + errors,
+        "errors": errors,
+        "duration": round(elapsed, 4),
+        "throughput": round(completed / elapsed, 1) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "min": round(latencies[0], 3) if latencies else 0.0,
+            "mean": round(sum(latencies) / completed, 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+
+
+def free_port(host: str) -> int:
+    """Ask the OS for an unused TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def make_requests(expressions: List[str], unique: bool) -> Callable[[int], Dict[str, Any]]:
+    """Return a function building the i-th request of a run"""
+    def build(index: int) -> Dict[str, Any]:
+        expression = expressions[index % len(expressions)]
+        if unique:
+            # Distinct text per request so the expression cache cannot help
+            expression = f"({expression}) + 0 * {index}"
+        return {"command": "calculate", "expression": expression}
+    return build
+
+
+# --- calculator socket targets -------------------------------------------------
+
+def open_socket(host: str, port: int, encoding: str):
+    """Connect to the calculator server and negotiate the encoding"""
+    sock = socket.create_connection((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    reader = MessageReader(sock)
+    if encoding != 'json':
+        sock.sendall(encode_message({"command": "hello", "encoding": encoding}))
+        response = reader.read()
+        if not response or not response.get("success"):
+            sock.close()
+            raise ConnectionError(f"Server refused {encoding} encoding")
+        reader.encoding = encoding
+    return sock, reader
+
+
+def exchange(sock, reader, request: Dict[str, Any]) -> Dict[str, Any]:
+    """Send one request and wait for its response"""
+    sock.sendall(encode_message(request, reader.encoding))
+    response = reader.read()
+    if response is None:
+        raise ConnectionError("Connection closed by server")
+    return response
+
+
+def run_socket(host: str, port: int, build: Callable, total: int, concurrency: int,
+               persistent: bool, encoding: str) -> Dict[str, Any]:
+    """Drive the server directly with one thread per concurrent client"""
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        local_latencies = []
+        local_errors = 0
+        connection = None
+        try:
+            while True:
+                index = next(counter)
+                if index >= total:
+                    break
+                request = build(index)
+                started = time.perf_counter()
+                try:
+                    if connection is None:
+                        connection = open_socket(host, port, encoding)
+                    response = exchange(*connection, request)
+                    ok = response.get("success", False)
+                except (OSError, ValueError):
+                    ok = False
+                    if connection is not None:
+                        connection[0].close()
+                    connection = None
+                if not persistent and connection is not None:
+                    connection[0].close()
+                    connection = None
+                if ok:
+                    local_latencies.append(time.perf_counter() - started)
+                else:
+                    local_errors += 1
+        finally:
+            if connection is not None:
+                connection[0].close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+# --- WebSocket bridge targets --------------------------------------------------
+
+async def _run_websocket(url: str, build: Callable, total: int, concurrency: int,
+                         persistent: bool) -> Dict[str, Any]:
+    import websockets
+
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def connect():
+        websocket = await websockets.connect(url, max_size=None)
+        await websocket.recv()  # welcome message
+        return websocket
+
+    async def worker():
+        nonlocal errors
+        websocket = None
+        try:
+            while True:
+                index = next(counter)
+                if index >= total:
+                    break
+                request = build(index)
+                started = time.perf_counter()
+                try:
+                    if websocket is None:
+                        websocket = await connect()
+                    await websocket.send(json.dumps(request))
+                    ok = json.loads(await websocket.recv()).get("success", False)
+                except (OSError, ValueError, websockets.exceptions.WebSocketException):
+                    ok = False
+                    websocket = None
+                if not persistent and websocket is not None:
+                    await websocket.close()
+                    websocket = None
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+        finally:
+            if websocket is not None:
+                await websocket.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def run_websocket(url: str, build: Callable, total: int, concurrency: int, persistent: bool) -> Dict[str, Any]:
+    """Drive a bridge with one coroutine per concurrent browser"""
+    return asyncio.run(_run_websocket(url, build, total, concurrency, persistent))
+
+
+# --- process management --------------------------------------------------------
+
+def wait_for_server(host: str, port: int, process: Optional[subprocess.Popen]):
+    """Block until the calculator server answers a ping"""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Calculator server exited with code {process.returncode}")
+        try:
+            sock, reader = open_socket(host, port, 'json')
+            try:
+                if exchange(sock, reader, {"command": "ping"}).get("success"):
+                    return
+            finally:
+                sock.close()
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Calculator server did not start in time")
+
+
+def wait_for_bridge(url: str, process: subprocess.Popen):
+    """Block until the bridge accepts a WebSocket connection"""
+    import websockets
+
+    async def probe():
+        websocket = await websockets.connect(url)
+        await websocket.close()
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Bridge exited with code {process.returncode}")
+        try:
+            asyncio.run(probe())
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Bridge did not start in time")
+
+
+def start_server(args, port: int) -> subprocess.Popen:
+    command = [sys.executable, os.path.join(BASE_DIR, "server.py"),
+               "--host", args.host, "--port", str(port), "--mode", args.mode]
+    if args.workers:
+        command += ["--workers", str(args.workers)]
+    if args.processes is not None:
+        command += ["--processes", str(args.processes)]
+    return subprocess.Popen(command, cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def start_bridge(args, socket_port: int, websocket_port: int, stderr=subprocess.DEVNULL) -> subprocess.Popen:
+    if args.bridge == "simple":
+        factory = "from simple_bridge import SimpleWebSocketBridge as Bridge"
+    else:
+        factory = "from websocket_bridge import WebSocketToSocketBridge as Bridge"
+    # Configure logging as the bridges' main() does, so --log-sample-rate has records to sample
+    code = (f"import bridge_logging; bridge_logging.configure_logging(); "
+            f"{factory}; Bridge(websocket_host={args.host!r}, websocket_port={websocket_port}, "
+            f"socket_host={args.host!r}, socket_port={socket_port}, "
+            f"upstream_encoding={args.encoding!r}, log_sample_rate={args.log_sample_rate!r}).run()")
+    return subprocess.Popen([sys.executable, "-c", code], cwd=BASE_DIR,
+                            stdout=subprocess.DEVNULL, stderr=stderr)
+
+
+def stop(process: Optional[subprocess.Popen]):
+    if process is None:
+        return
+    process.terminate()
+    try:
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def load_expressions(args) -> List[str]:
+    if args.expressions:
+        with open(args.expressions, encoding="utf-8") as handle:
+            expressions = [line.strip() for line in handle if line.strip() and not line.startswith("#")]
+        if not expressions:
+            raise SystemExit(f"No expressions found in {args.expressions}")
+        return expressions
+    return MIXES[args.mix]
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the calculator server and WebSocket bridges")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=None,
+                        help="benchmark an already running server instead of starting one")
+    parser.add_argument("--mode", choices=["threaded", "asyncio"], default="threaded",
+                        help="server mode to start")
+    parser.add_argument("--workers", type=int, default=None, help="evaluation threads (asyncio mode)")
+    parser.add_argument("--processes", type=int, nargs="?", const=0, default=None,
+                        help="start the server with a process pool")
+    parser.add_argument("--bridge", choices=["none", "simple", "websocket"], default="none",
+                        help="drive the server through a WebSocket bridge")
+    parser.add_argument("--connection", choices=["persistent", "per-request", "both"], default="both",
+                        help="reuse one connection per client or open one per request")
+    parser.add_argument("--concurrency", default="1,8,32",
+                        help="comma-separated numbers of concurrent clients")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per run")
+    parser.add_argument("--warmup", type=int, default=100, help="untimed requests before each run")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed", help="built-in expression mix")
+    parser.add_argument("--expressions", help="file with one expression per line, overrides --mix")
+    parser.add_argument("--unique", action="store_true", help="make every expression distinct to bypass the cache")
+    parser.add_argument("--encoding", choices=["json", "binary"], default="json",
+                        help="encoding for calculator socket connections, including a bridge's upstream")
+    parser.add_argument("--log-sample-rate", type=float, default=1.0,
+                        help="fraction of messages the bridge logs")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    try:
+        levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    except ValueError:
+        parser.error("--concurrency must be a comma-separated list of integers")
+    if not levels or min(levels) < 1:
+        parser.error("--concurrency levels must be positive")
+
+    expressions = load_expressions(args)
+    build = make_requests(expressions, args.unique)
+    connections = ["persistent", "per-request"] if args.connection == "both" else [args.connection]
+
+    server = bridge = None
+    port = args.port
+    try:
+        if port is None:
+            port = free_port(args.host)
+            server = start_server(args, port)
+        wait_for_server(args.host, port, server)
+
+        if args.bridge != "none":
+            websocket_port = free_port(args.host)
+            bridge = start_bridge(args, port, websocket_port)
+            url = f"ws://{args.host}:{websocket_port}"
+            wait_for_bridge(url, bridge)
+            target = f"{args.bridge}-bridge"
+        else:
+            target = "server"
+
+        results = []
+        for connection in connections:
+            persistent = connection == "persistent"
+            for concurrency in levels:
+                if args.bridge != "none":
+                    if args.warmup:
+                        run_websocket(url, build, args.warmup, concurrency, True)
+                    summary = run_websocket(url, build, args.requests, concurrency, persistent)
+                else:
+                    if args.warmup:
+                        run_socket(args.host, port, build, args.warmup, concurrency, True, args.encoding)
+                    summary = run_socket(args.host, port, build, args.requests, concurrency,
+                                         persistent, args.encoding)
+                result = {"target": target, "connection": connection, "concurrency": concurrency}
+                result.update(summary)
+                results.append(result)
+                print(f"{target} {connection} c={concurrency}: {summary['throughput']} req/s, "
+                      f"p50 {summary['latency_ms']['p50']} ms, p99 {summary['latency_ms']['p99']} ms, "
+                      f"{summary['errors']} errors", file=sys.stderr)
+    finally:
+        stop(bridge)
+        stop(server)
+
+    report = {
+        "config": {
+            "server": "external" if args.port is not None else args.mode,
+            "processes": args.processes,
+            "bridge": args.bridge,
+            "log_sample_rate": args.log_sample_rate,
+            "encoding": args.encoding,
+            "mix": "file" if args.expressions else args.mix,
+            "expressions": len(expressions),
+            "unique": args.unique,
+            "requests": args.requests,
+            "warmup": args.warmup,
+        },
+        "system": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Bridge Logging
+==============
+
+Logging for the WebSocket bridges that stays off the event loop's hot path.
+
+Records go through a QueueHandler to a QueueListener thread, which does all
+formatting and I/O; the handler does not pre-format records, so the event
+loop only pays for creating the record. Per-message logs are gated on the
+logger level before any arguments are built and can be sampled to one in N
+messages. A bridge started with --debug also keeps a short summary of each
+request in a bounded ring, which it serves to its clients as the
+bridge_stats command.
+"""
+
+import atexit
+import itertools
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_RING_SIZE = 256
+MAX_ERROR_LENGTH = 200
+
+_listener = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread"""
+
+    def __init__(self, records: queue.SimpleQueue, max_backlog: int):
+        super().__init__(records)
+        self.max_backlog = max_backlog
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        # Dropping a log line beats letting a slow sink grow memory without bound
+        if self.queue.qsize() >= self.max_backlog:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging(level: int = logging.INFO, stream=None, queue_size: int = DEFAULT_QUEUE_SIZE):
+    """
+    Route the root logger through a background listener thread. Safe to call
+    more than once; later calls only adjust the level.
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    # SimpleQueue avoids the Condition round trip of queue.Queue on every record
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(records, queue_size))
+    _listener.start()
+    atexit.register(_stop_listener)
+    return _listener
+
+
+class MessageLog:
+    """
+    Per-message logging policy for a bridge: sample() decides once per
+    message whether its log lines are emitted, and record() keeps a summary
+    of the request in a bounded ring when keep_recent is set.
+    """
+
+    def __init__(self, logger: logging.Logger, level: int = logging.INFO, sample_rate: float = 1.0,
+                 ring_size: int = DEFAULT_RING_SIZE, keep_recent: bool = False):
+        self.logger = logger
+        self.level = level
+        self.every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.keep_recent = keep_recent
+        self.recent = deque(maxlen=ring_size)
+        self._counter = itertools.count()
+
+    def sample(self) -> bool:
+        """True if this message should be logged"""
+        if not self.every or not self.logger.isEnabledFor(self.level):
+            return False
+        return self.every == 1 or next(self._counter) % self.every == 0
+
+    def log(self, msg: str, *args):
+        """Emit one line of a sampled message; formatting happens on the listener thread"""
+        self.logger.log(self.level, msg, *args)
+
+    def record(self, client: str, request: Any, response: Any, started: float, size: int = 0):
+        """
+        Remember a handled request as its command, id, size in characters,
+        outcome and latency; payloads are not kept, so a large request or
+        result cannot pin memory in the ring.
+        """
+        if not self.keep_recent:
+            return
+        elapsed = time.perf_counter() - started
+        request = request if isinstance(request, dict) else {}
+        response = response if isinstance(response, dict) else {}
+        error = response.get("error")
+        if error is not None:
+            error = str(error)[:MAX_ERROR_LENGTH]
+        self.recent.append((time.time(), client, request.get("command"), request.get("id"), size,
+                            bool(response.get("success")), error, elapsed))
+
+    def recent_requests(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Most recent requests first, as plain dicts"""
+        entries = list(self.recent)[::-1]
+        if limit is not None:
+            entries = entries[:limit]
+        summaries = []
+        for timestamp, client, command, request_id, size, success, error, elapsed in entries:
+            summary = {"time": timestamp, "client": client, "command": command, "id": request_id,
+                       "size": size, "success": success, "elapsed_ms": round(elapsed * 1000, 3)}
+            if error is not None:
+                summary["error"] = error
+            summaries.append(summary)
+        return summaries
@@ -1,24 +1,59 @@
 import socket
 import json
 import threading
-from typing import Dict, Any, Callable
+import itertools
+import argparse
+import asyncio
+import contextlib
+import csv
+import mmap
+import sys
+import time
+from collections import deque
+from typing import Dict, Any, Callable, Iterable, Iterator, List, TextIO, Tuple
+
+from protocol import ENCODINGS, MessageReader, ProtocolError, encode_message, json_default
+from sessions import UNKNOWN_SESSION
+from upstream import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, UpstreamPool, retryable
+
+# Requests kept in flight by the batch mode
+DEFAULT_BATCH_WINDOW = 256
+# Expressions per calculate_bulk request sent by AsyncCalculatorClient
+DEFAULT_BULK_SIZE = 1000
+BATCH_FORMATS = ('csv', 'jsonl')
 
 class CalculatorClient:
     """Client for connecting to the scientific calculator server"""
     
-    def __init__(self, host='localhost', port=8888):
+    def __init__(self, host='localhost', port=8888, session: str = None, encoding: str = 'json',
+                 compact: bool = False, path: str = None):
         self.host = host
         self.port = port
+        # Unix domain socket of a server on the same host; used instead of host and port
+        self.path = path
+        self.session = session
+        self.encoding = encoding
+        self.compact = compact
         self.socket = None
+        self.reader = None
         self.connected = False
+        self._ids = itertools.count(1)
         
     def connect(self) -> bool:
         """Connect to the calculator server"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
+            if self.path is not None:
+                self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.socket.connect(self.path)
+            else:
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.socket.connect((self.host, self.port))
+            self.reader = MessageReader(self.socket)
+            if self.encoding != 'json':
+                self._negotiate()
             self.connected = True
-            print(f"Connected to calculator server at {self.host}:{self.port}")
+            endpoint = self.path if self.path is not None else f"{self.host}:{self.port}"
+            print(f"Connected to calculator server at {endpoint}")
             return True
         except Exception as e:
             print(f"Failed to connect to server: {e}")
@@ -33,33 +68,186 @@ class CalculatorClient:
             except:
                 pass
             self.socket = None
+        self.reader = None
         self.connected = False
         print("Disconnected from server")
     
+    def _negotiate(self):
+        """Ask the server to switch this connection to the requested encoding"""
+        self.socket.sendall(encode_message({"command": "hello", "encoding": self.encoding}))
+        response = self.reader.read()
+        if response is None:
+            raise ConnectionError("Connection closed by server")
+        if response.get("success"):
+            self.reader.encoding = self.encoding
+        else:
+            # Older servers do not know hello; stay on JSON
+            print(f"Server declined {self.encoding} encoding, using JSON")
+    
+    def _prepare(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a request, assigning an id and the session token if one is set"""
+        request = dict(request, id=next(self._ids))
+        if self.session is not None:
+            request.setdefault("session", self.session)
+        if self.compact:
+            request.setdefault("compact", True)
+        return request
+    
+    def _receive(self, request_id: int) -> Dict[str, Any]:
+        """Read the response matching a request id"""
+        response = self.reader.read()
+        if response is None:
+            raise ConnectionError("Connection closed by server")
+        if response.get("id") != request_id:
+            raise ConnectionError(f"Out-of-order response: expected id {request_id}, got {response.get('id')}")
+        return response
+    
     def send_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
         """Send request to server and get response"""
         if not self.connected:
             return {"success": False, "error": "Not connected to server"}
         
         try:
-            request_json = json.dumps(request)
-            self.socket.send(request_json.encode('utf-8'))
-            
-            response_data = self.socket.recv(1024).decode('utf-8')
-            response = json.loads(response_data)
-            return response
+            request = self._prepare(request)
+            self.socket.sendall(encode_message(request, self.reader.encoding))
+            return self._receive(request["id"])
             
         except Exception as e:
             return {"success": False, "error": f"Communication error: {str(e)}"}
     
-    def calculate(self, expression: str) -> Dict[str, Any]:
-        """Send calculation request to server"""
+    def pipeline(self, requests: Iterable[Dict[str, Any]], window: int = 64) -> Iterator[Dict[str, Any]]:
+        """
+        Send many requests on this connection keeping up to `window` in flight,
+        yielding the responses in request order
+        """
+        if not self.connected:
+            yield {"success": False, "error": "Not connected to server"}
+            return
+        
+        in_flight = deque()
+        requests = iter(requests)
+        try:
+            while True:
+                batch = []
+                for request in itertools.islice(requests, max(0, window - len(in_flight))):
+                    request = self._prepare(request)
+                    in_flight.append(request["id"])
+                    batch.append(encode_message(request, self.reader.encoding))
+                if batch:
+                    self.socket.sendall(b"".join(batch))
+                if not in_flight:
+                    return
+                yield self._receive(in_flight.popleft())
+                
+        except Exception as e:
+            yield {"success": False, "error": f"Communication error: {str(e)}"}
+    
+    def calculate_many(self, expressions: Iterable[str], window: int = 64) -> Iterator[Dict[str, Any]]:
+        """Pipeline calculation requests, yielding responses in order"""
+        requests = ({"command": "calculate", "expression": expression} for expression in expressions)
+        return self.pipeline(requests, window)
+    
+    def calculate(self, expression: str, mode: str = None, precision: int = None) -> Dict[str, Any]:
+        """
+        Send calculation request to server. mode may be 'decimal' (with an
+        optional number of significant digits) or 'fraction' for exact results.
+        """
         request = {
             "command": "calculate",
             "expression": expression
         }
+        if mode is not None:
+            request["mode"] = mode
+        if precision is not None:
+            request["precision"] = precision
+        return self.send_request(request)
+    
+    def calculate_batch(self, expression: str, variables: Dict[str, List[float]]) -> Dict[str, Any]:
+        """Evaluate one expression over columns of variable values in a single request"""
+        request = {
+            "command": "calculate_batch",
+            "expression": expression,
+            "variables": variables
+        }
+        return self.send_request(request)
+    
+    def matrix(self, expression: str, variables: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Evaluate an expression over vectors and matrices server-side. NumPy
+        array variables are sent packed, and with NumPy installed an array
+        result comes back as an ndarray.
+        """
+        # Imported here so that starting the client does not load NumPy
+        from linalg import is_packed, pack_array, unpack_array
+        from vectorized import NUMPY_AVAILABLE
+        
+        request = {"command": "matrix", "expression": expression}
+        if variables:
+            request["variables"] = {name: pack_array(value) if hasattr(value, "shape") else value
+                                    for name, value in variables.items()}
+        response = self.send_request(request)
+        if NUMPY_AVAILABLE and is_packed(response.get("result")):
+            response["result"] = unpack_array(response["result"])
+        return response
+    
+    def solve(self, expression: str, variable: str = None, bracket: List[float] = None, start: float = None,
+              starts: List[float] = None, **options) -> Dict[str, Any]:
+        """
+        Find a root server-side: Brent's method within a bracket [a, b], or
+        Newton's method from a start or from each of many starts.
+        Options: tolerance, max_iterations.
+        """
+        request = {"command": "solve", "expression": expression}
+        for key, value in (("variable", variable), ("bracket", bracket), ("start", start), ("starts", starts)):
+            if value is not None:
+                request[key] = value
+        request.update(options)
+        return self.send_request(request)
+    
+    def integrate(self, expression: str, lower: float, upper: float, variable: str = None,
+                  **options) -> Dict[str, Any]:
+        """
+        Integrate server-side over [lower, upper]; either limit may be "inf"
+        or "-inf". Options: abs_tolerance, rel_tolerance, max_evaluations.
+        """
+        request = {"command": "integrate", "expression": expression, "lower": lower, "upper": upper}
+        if variable is not None:
+            request["variable"] = variable
+        request.update(options)
         return self.send_request(request)
     
+    def tabulate(self, expression: str, variable: str, start: float, stop: float, step: float,
+                 chunk_size: int = None, include_x: bool = True) -> Iterator[Dict[str, Any]]:
+        """Yield tabulate chunks from the server as they arrive"""
+        if not self.connected:
+            yield {"success": False, "done": True, "error": "Not connected to server"}
+            return
+        
+        request = {
+            "command": "tabulate",
+            "expression": expression,
+            "variable": variable,
+            "start": start,
+            "stop": stop,
+            "step": step,
+            "include_x": include_x
+        }
+        if chunk_size is not None:
+            request["chunk_size"] = chunk_size
+        
+        try:
+            request = self._prepare(request)
+            self.socket.sendall(encode_message(request, self.reader.encoding))
+            
+            while True:
+                chunk = self._receive(request["id"])
+                yield chunk
+                if chunk.get("done"):
+                    return
+                    
+        except Exception as e:
+            yield {"success": False, "done": True, "error": f"Communication error: {str(e)}"}
+    
     def memory_operation(self, operation: str, value: float = None) -> Dict[str, Any]:
         """Send memory operation request to server"""
         request = {
@@ -70,17 +258,289 @@ class CalculatorClient:
             request["value"] = value
         return self.send_request(request)
     
+    def new_session(self) -> Dict[str, Any]:
+        """Ask the server for a session token and use it for later requests"""
+        response = self.send_request({"command": "session"})
+        if response.get("success"):
+            self.session = response["session"]
+        return response
+    
+    def stats(self) -> Dict[str, Any]:
+        """Fetch server metrics: request and error counts, connections and latency summaries"""
+        return self.send_request({"command": "stats"})
+    
     def ping(self) -> Dict[str, Any]:
         """Ping the server to check connection"""
         request = {"command": "ping"}
         return self.send_request(request)
 
+class LocalCalculatorClient(CalculatorClient):
+    """
+    CalculatorClient that runs the calculator in this process. Requests go
+    straight to a CalculatorServer's dispatcher as dicts, with no socket and
+    no encoding; like a connection, the client keeps a session of its own.
+    The server does not need to be started.
+    """
+
+    def __init__(self, server=None, session: str = None, compact: bool = False):
+        super().__init__(session=session, compact=compact)
+        self.server = server
+        self._connection_session = None
+
+    def connect(self) -> bool:
+        """Set up the in-process calculator"""
+        if self.server is None:
+            # Imported here so remote clients do not load the server
+            from server import CalculatorServer
+            self.server = CalculatorServer()
+        self._connection_session = self.server.sessions.create()
+        self.connected = True
+        print("Using the in-process calculator")
+        return True
+
+    def disconnect(self):
+        """Release the client's session"""
+        if self._connection_session is not None:
+            self.server.sessions.remove(self._connection_session)
+            self._connection_session = None
+        self.connected = False
+        print("Disconnected from calculator")
+
+    def send_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Dispatch a request in-process and return its response"""
+        if not self.connected:
+            return {"success": False, "error": "Not connected to server"}
+
+        request = self._prepare(request)
+        try:
+            return self.server.handle_request(request, self._connection_session)
+        except Exception as e:
+            return {"success": False, "error": f"Server error: {str(e)}", "id": request["id"]}
+
+    def pipeline(self, requests: Iterable[Dict[str, Any]], window: int = 64) -> Iterator[Dict[str, Any]]:
+        """Answer requests one at a time, in order; there is nothing to keep in flight"""
+        if not self.connected:
+            yield {"success": False, "error": "Not connected to server"}
+            return
+        for request in requests:
+            yield self.send_request(request)
+
+    def tabulate(self, expression: str, variable: str, start: float, stop: float, step: float,
+                 chunk_size: int = None, include_x: bool = True) -> Iterator[Dict[str, Any]]:
+        """Yield tabulate chunks as they are computed"""
+        if not self.connected:
+            yield {"success": False, "done": True, "error": "Not connected to server"}
+            return
+
+        request = {"expression": expression, "variable": variable, "start": start, "stop": stop,
+                   "step": step, "include_x": include_x}
+        if chunk_size is not None:
+            request["chunk_size"] = chunk_size
+        request = self._prepare(request)
+        started = time.perf_counter()
+        success = False
+        for chunk in self.server.tabulate_chunks(request, self._connection_session):
+            success = chunk.get("success", False)
+            chunk["id"] = request["id"]
+            yield chunk
+        self.server.metrics.record_request('tabulate', time.perf_counter() - started, success)
+
+class AsyncCalculatorClient:
+    """
+    asyncio client over a pool of connections to the calculator server.
+    Calls may run concurrently, e.g. under asyncio.gather, up to one per
+    pooled connection; each one has a timeout and is retried on a fresh connection if the server drops
+    the old one. All calls share one server session, so memory operations
+    see the same state whichever connection carries them.
+    """
+    
+    def __init__(self, host='localhost', port=8888, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_TIMEOUT, encoding: str = 'json', session: str = None,
+                 compact: bool = False, path: str = None):
+        self.pool = UpstreamPool(host, port, size=pool_size, timeout=timeout, encoding=encoding, path=path)
+        self.timeout = timeout
+        self.session = session
+        self.compact = compact
+        self._session_lock = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    async def close(self):
+        """Close all pooled connections"""
+        await self.pool.close()
+    
+    async def _session(self, deadline: float) -> str:
+        """The session token, created on the server by the first call"""
+        if self.session is None:
+            if self._session_lock is None:
+                self._session_lock = asyncio.Lock()
+            async with self._session_lock:
+                if self.session is None:
+                    response = await self._exchange({"command": "session"}, deadline)
+                    if not response.get("success"):
+                        raise ConnectionError(response.get("error", "Could not create a session"))
+                    self.session = response["session"]
+        return self.session
+    
+    async def _exchange(self, request: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+        """Send over the pool, waiting out reconnect backoff until the deadline"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                return await self.pool.request(request, max(0.0, deadline - loop.time()))
+            except ConnectionError:
+                delay = max(0.01, self.pool.retry_after)
+                if loop.time() + delay >= deadline or not retryable(request):
+                    raise
+                await asyncio.sleep(delay)
+    
+    async def send_request(self, request: Dict[str, Any], timeout: float = None) -> Dict[str, Any]:
+        """Send a request and return its response; failures come back as error responses"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.timeout if timeout is None else timeout)
+        try:
+            request = dict(request)
+            session = await self._session(deadline)
+            request.setdefault("session", session)
+            if self.compact:
+                request.setdefault("compact", True)
+            response = await self._exchange(request, deadline)
+            if response.get("error") == UNKNOWN_SESSION and request["session"] == session:
+                # The server dropped the idle session or restarted; continue in a new one
+                if self.session == session:
+                    self.session = None
+                request["session"] = await self._session(deadline)
+                response = await self._exchange(request, deadline)
+            return response
+        except asyncio.TimeoutError:
+            return {"success": False, "error": "Request timed out"}
+        except (OSError, ProtocolError, ValueError) as e:
+            return {"success": False, "error": f"Communication error: {str(e)}"}
+    
+    async def calculate(self, expression: str, mode: str = None, precision: int = None,
+                        timeout: float = None) -> Dict[str, Any]:
+        """Evaluate one expression"""
+        request = {"command": "calculate", "expression": expression}
+        if mode is not None:
+            request["mode"] = mode
+        if precision is not None:
+            request["precision"] = precision
+        return await self.send_request(request, timeout)
+    
+    async def calculate_many(self, expressions: Iterable[str], mode: str = None, precision: int = None,
+                             timeout: float = None) -> List[Dict[str, Any]]:
+        """Evaluate expressions as concurrent requests, returning the responses in order"""
+        return await asyncio.gather(*[self.calculate(expression, mode, precision, timeout)
+                                      for expression in expressions])
+    
+    async def calculate_bulk(self, expressions: Iterable[str], mode: str = None, precision: int = None,
+                             chunk_size: int = DEFAULT_BULK_SIZE, timeout: float = None) -> List[Dict[str, Any]]:
+        """
+        Evaluate expressions packed `chunk_size` to a request, with the chunks
+        in flight concurrently. Returns one response per expression, in order.
+        """
+        expressions = list(expressions)
+        chunk_size = max(1, chunk_size)
+        chunks = [expressions[i:i + chunk_size] for i in range(0, len(expressions), chunk_size)]
+        
+        async def send(chunk):
+            request = {"command": "calculate_bulk", "expressions": chunk}
+            if mode is not None:
+                request["mode"] = mode
+            if precision is not None:
+                request["precision"] = precision
+            response = await self.send_request(request, timeout)
+            if response.get("success"):
+                return response["results"]
+            error = response.get("error", "Unknown error")
+            return [{"success": False, "error": error} for _ in chunk]
+        
+        results = []
+        for responses in await asyncio.gather(*[send(chunk) for chunk in chunks]):
+            results.extend(responses)
+        return results
+    
+    async def memory_operation(self, operation: str, value: float = None, timeout: float = None) -> Dict[str, Any]:
+        """Perform memory operation on the shared session"""
+        request = {"command": "memory", "operation": operation}
+        if value is not None:
+            request["value"] = value
+        return await self.send_request(request, timeout)
+    
+    async def ping(self, timeout: float = None) -> Dict[str, Any]:
+        """Test server connection"""
+        return await self.send_request({"command": "ping"}, timeout)
+
+
+def read_expressions(path: str) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (line number, expression) for each line of a file, or of stdin for
+    '-'. Blank lines and lines starting with '#' are skipped. Files are
+    memory-mapped, so even very large inputs are read without copying them
+    into memory.
+    """
+    if path == '-':
+        lines = sys.stdin.buffer
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if line and not line.startswith(b"#"):
+                yield number, line.decode('utf-8', 'replace')
+        return
+    
+    with open(path, 'rb') as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return
+        with mapped:
+            for number, line in enumerate(iter(mapped.readline, b""), 1):
+                line = line.strip()
+                if line and not line.startswith(b"#"):
+                    yield number, line.decode('utf-8', 'replace')
+
+
+class BatchWriter:
+    """Writes batch results in input order as CSV or JSON lines"""
+    
+    def __init__(self, stream: TextIO, output_format: str = 'csv'):
+        self.stream = stream
+        self.format = output_format
+        self.csv = csv.writer(stream, lineterminator="\n") if output_format == 'csv' else None
+        if self.csv is not None:
+            self.csv.writerow(("line", "expression", "result", "error"))
+    
+    def write(self, line: int, expression: str, response: Dict[str, Any]):
+        """Write the response to one expression"""
+        result = response.get("result") if response.get("success") else None
+        error = None if response.get("success") else response.get("error", "Unknown error")
+        if self.csv is None:
+            record = {"line": line, "expression": expression}
+            if error is None:
+                record["result"] = result
+            else:
+                record["error"] = error
+            self.stream.write(json.dumps(record, separators=(',', ':'), default=json_default))
+            self.stream.write("\n")
+            return
+        if isinstance(result, dict):
+            result = json.dumps(result, separators=(',', ':'), default=json_default)
+        self.csv.writerow((line, expression, "" if result is None else result, error or ""))
+
+
 class CalculatorCLI:
     """Command-line interface for the calculator client"""
     
-    def __init__(self):
-        self.client = CalculatorClient()
+    def __init__(self, client: CalculatorClient = None, mode: str = None, precision: int = None):
+        self.client = client if client is not None else CalculatorClient()
         self.running = False
+        # The number mode for calculations, as set by :mode; None is float
+        self.mode = None if mode == 'float' else mode
+        self.precision = precision
         
     def print_help(self):
         """Print help information"""
@@ -100,6 +560,11 @@ Memory Operations:
     :mc          - Clear memory
     :ma [value]  - Add value to memory (or last result if no value)
 
+Precision:
+    :mode decimal [digits] - Evaluate with that many significant digits
+    :mode fraction         - Evaluate exactly as fractions
+    :mode float            - Back to ordinary floating point
+
 System Commands:
     :help        - Show this help
     :ping        - Test server connection
@@ -130,6 +595,8 @@ Examples:
         
         print("Type ':help' for commands or ':quit' to exit")
         print("Enter mathematical expressions to calculate")
+        if self.mode:
+            print(f"Mode: {self.mode}" + (f" ({self.precision} digits)" if self.precision else ""))
         print()
         
         self.running = True
@@ -196,13 +663,27 @@ Examples:
                     return
             result = self.client.memory_operation("add", value)
             self.handle_memory_result(result)
+        elif cmd == ':mode':
+            if len(parts) < 2 or parts[1] not in ('float', 'decimal', 'fraction'):
+                print("Usage: :mode float|decimal [digits]|fraction")
+                return
+            precision = None
+            if len(parts) > 2:
+                try:
+                    precision = int(parts[2])
+                except ValueError:
+                    print("Invalid number of digits")
+                    return
+            self.mode = None if parts[1] == 'float' else parts[1]
+            self.precision = precision
+            print(f"Mode: {parts[1]}" + (f" ({precision} digits)" if precision else ""))
         else:
             print(f"Unknown command: {cmd}")
             print("Type ':help' for available commands")
     
     def handle_calculation(self, expression: str):
         """Handle mathematical calculations"""
-        result = self.client.calculate(expression)
+        result = self.client.calculate(expression, self.mode, self.precision)
         
         if result.get("success"):
             formatted_result = result.get("formatted_result", result.get("result"))
@@ -211,6 +692,40 @@ Examples:
             error = result.get("error", "Unknown error")
             print(f"Error: {error}")
     
+    def run_batch(self, source: str, output: TextIO, output_format: str = 'csv', window: int = DEFAULT_BATCH_WINDOW,
+                  mode: str = None, precision: int = None) -> Tuple[int, int, bool]:
+        """
+        Evaluate every expression in `source` on one pipelined connection and
+        write the results to `output` as they arrive, in input order. Returns
+        (expressions done, errors, whether the connection survived).
+        """
+        writer = BatchWriter(output, output_format)
+        pending = deque()
+        
+        def requests():
+            for line, expression in read_expressions(source):
+                pending.append((line, expression))
+                request = {"command": "calculate", "expression": expression, "compact": True}
+                if mode is not None and mode != 'float':
+                    request["mode"] = mode
+                if precision is not None:
+                    request["precision"] = precision
+                yield request
+        
+        count = errors = 0
+        for response in self.client.pipeline(requests(), window):
+            if "id" not in response:
+                # Server replies echo the id; the pipeline's own error means the connection failed
+                output.flush()
+                return count, errors, False
+            line, expression = pending.popleft()
+            if not response.get("success"):
+                errors += 1
+            writer.write(line, expression, response)
+            count += 1
+        output.flush()
+        return count, errors, True
+    
     def handle_memory_result(self, result: Dict[str, Any]):
         """Handle memory operation results"""
         if result.get("success"):
@@ -221,6 +736,57 @@ Examples:
             error = result.get("error", "Unknown error")
             print(f"Memory error: {error}")
 
+def main():
+    """Command-line entry point: interactive, or a batch run with --batch"""
+    parser = argparse.ArgumentParser(description="Scientific calculator client")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--unix-socket", metavar="PATH", default=None,
+                        help="connect over this Unix domain socket instead of TCP")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="json")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="evaluate one expression per line of FILE ('-' for stdin) and exit")
+    parser.add_argument("--output", "-o", default="-", help="batch output file (default: stdout)")
+    parser.add_argument("--format", choices=BATCH_FORMATS, default=None,
+                        help="batch output format (default: from the output file extension, else csv)")
+    parser.add_argument("--window", type=int, default=DEFAULT_BATCH_WINDOW, help="batch requests kept in flight")
+    parser.add_argument("--mode", choices=["float", "decimal", "fraction"], default="float",
+                        help="number mode for calculations, interactive or batch (default: float)")
+    parser.add_argument("--precision", type=int, default=None, help="significant digits in decimal mode")
+    args = parser.parse_args()
+    
+    client = CalculatorClient(args.host, args.port, encoding=args.encoding, path=args.unix_socket)
+    cli = CalculatorCLI(client, args.mode, args.precision)
+    if args.batch is None:
+        cli.start()
+        return
+    
+    output_format = args.format or ('jsonl' if args.output.endswith(('.jsonl', '.ndjson')) else 'csv')
+    # Status messages go to stderr so they never mix with results on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        connected = client.connect()
+    if not connected:
+        sys.exit(1)
+    
+    started = time.perf_counter()
+    try:
+        if args.output == '-':
+            count, errors, ok = cli.run_batch(args.batch, sys.stdout, output_format, max(1, args.window),
+                                              args.mode, args.precision)
+        else:
+            with open(args.output, 'w', encoding='utf-8', newline='', buffering=1 << 20) as output:
+                count, errors, ok = cli.run_batch(args.batch, output, output_format, max(1, args.window),
+                                                  args.mode, args.precision)
+    finally:
+        with contextlib.redirect_stdout(sys.stderr):
+            client.disconnect()
+    
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"{count} expressions, {errors} errors in {elapsed:.2f}s ({rate:,.0f}/s)", file=sys.stderr)
+    if not ok:
+        print("Batch stopped early: connection to the server failed", file=sys.stderr)
+        sys.exit(1)
+
 if __name__ == "__main__":
-    cli = CalculatorCLI()
-    cli.start()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""
+Process Pool Engine
+===================
+
+Runs CPU-heavy calculations in a pool of worker processes so they execute in
+parallel outside the server's GIL. Each task has a deadline; a worker that
+crashes or overruns its deadline is killed and replaced, and workers can be
+recycled after a fixed number of tasks. Cheap expressions never reach the
+pool, so they are not queued behind heavy ones.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from expression import SMALL_FACTORIAL, Binary, Call, Num, Unary, is_small_power
+
+DEFAULT_TIMEOUT = 10.0
+
+
+def is_expensive(node) -> bool:
+    """
+    Heuristic: True if the tree contains a factorial or binomial that may be
+    huge, or a power whose result may have more than SMALL_POWER_BITS bits
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Call):
+            if node.name in ('factorial', 'binomial'):
+                if not (node.args and all(isinstance(arg, Num) for arg in node.args)
+                        and node.args[0].value <= SMALL_FACTORIAL):
+                    return True
+            elif node.name == 'pow' and not is_small_power(node):
+                return True
+            stack.extend(node.args)
+        elif isinstance(node, Binary):
+            if node.op == '**' and not is_small_power(node):
+                return True
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, Unary):
+            stack.append(node.operand)
+    return False
+
+
+def _worker_main(conn):
+    """Worker process loop: evaluate expressions received over the pipe"""
+    # Imported here so the worker does not depend on import order in the parent
+    from server import ScientificCalculator
+    calculator = ScientificCalculator()
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if task is None:
+            return
+        expression, mode, precision, full = task
+        response = calculator.calculate(expression, mode=mode, precision=precision, full=full)
+        if response.get("success"):
+            # The numeric result, for the parent's memory operations
+            response["value"] = calculator.last_result
+        conn.send(response)
+
+
+class _Worker:
+    """A worker process and the parent end of its pipe"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(1)
+        finally:
+            self.conn.close()
+
+    def shutdown(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class ProcessPoolEngine:
+    """Pool of calculator worker processes with per-task deadlines"""
+
+    def __init__(self, workers: Optional[int] = None, timeout: float = DEFAULT_TIMEOUT,
+                 max_tasks_per_worker: Optional[int] = None):
+        self.size = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.timeouts = 0
+        self.crashes = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._closed = False
+        for _ in range(self.size):
+            self._add_worker()
+
+    def _add_worker(self):
+        worker = _Worker(self._context)
+        with self._lock:
+            self._workers.add(worker)
+        self._idle.put(worker)
+
+    def _replace(self, worker: _Worker):
+        """Kill a broken or exhausted worker and start a fresh one"""
+        with self._lock:
+            self._workers.discard(worker)
+        worker.kill()
+        if not self._closed:
+            self._add_worker()
+
+    def evaluate(self, expression: str, timeout: Optional[float] = None, mode: str = 'float',
+                 precision: Optional[int] = None, full: bool = False) -> Dict[str, Any]:
+        """
+        Evaluate an expression in a worker process and return the calculate()
+        response, with the numeric result under "value" when successful
+        """
+        if self._closed:
+            return {"success": False, "error": "Evaluation engine is shut down"}
+
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        try:
+            worker = self._idle.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            return {"success": False, "error": "Calculation timed out waiting for a worker"}
+
+        try:
+            worker.conn.send((expression, mode, precision, full))
+            if not worker.conn.poll(max(0.0, deadline - time.monotonic())):
+                self.timeouts += 1
+                self._replace(worker)
+                return {"success": False, "error": "Calculation timed out"}
+            response = worker.conn.recv()
+        except (EOFError, OSError):
+            self.crashes += 1
+            self._replace(worker)
+            return {"success": False, "error": "Calculation worker crashed"}
+
+        worker.tasks += 1
+        if self._closed:
+            worker.shutdown()
+        elif self.max_tasks_per_worker and worker.tasks >= self.max_tasks_per_worker:
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+        return response
+
+    def close(self):
+        """Stop all worker processes"""
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool counters"""
+        return {
+            "workers": self.size,
+            "idle": self._idle.qsize(),
+            "timeouts": self.timeouts,
+            "crashes": self.crashes
+        }
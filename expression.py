@@ -0,0 +1,658 @@
+"""
+Expression Engine
+=================
+
+Tokenizer, parser and evaluator for calculator expressions.
+
+Expressions are parsed once into a small AST of named tuples and compiled
+into a tree of closures over a function table, so evaluation never touches
+Python's compiler. The AST is the shared representation used by caching,
+batch evaluation and the other numeric features.
+"""
+
+import math
+import numbers
+import operator
+import re
+from collections import namedtuple
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import intmath
+
+FUNCTIONS = MappingProxyType({
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "sinh": math.sinh,
+    "cosh": math.cosh,
+    "tanh": math.tanh,
+    "log": math.log10,
+    "ln": math.log,
+    "log10": math.log10,
+    "log2": math.log2,
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "pow": intmath.power,
+    "abs": abs,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "round": round,
+    "pi": math.pi,
+    "π": math.pi,
+    "e": math.e,
+    "factorial": intmath.factorial,
+    "binomial": intmath.binomial,
+    "degrees": math.degrees,
+    "radians": math.radians,
+    "gcd": intmath.gcd,
+    "lcm": intmath.lcm,
+})
+
+OPERATORS = MappingProxyType({
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "//": operator.floordiv,
+    "%": operator.mod,
+    "**": operator.pow,
+    "@": operator.matmul,
+    "neg": operator.neg,
+    "pos": operator.pos,
+})
+
+# AST node types
+Num = namedtuple('Num', 'value')
+Var = namedtuple('Var', 'name')
+Unary = namedtuple('Unary', 'op operand')
+Binary = namedtuple('Binary', 'op left right')
+Call = namedtuple('Call', 'name args')
+Array = namedtuple('Array', 'items')
+
+_TOKEN_RE = re.compile(r"""
+    (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_π][A-Za-z_0-9]*)
+  | (?P<op>\*\*|//|[-+*/%^@(),\[\]])
+  | (?P<space>\s+)
+  | (?P<error>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Binding powers for the precedence-climbing parser, matching Python
+_BINARY_POWER = {'+': 10, '-': 10, '*': 20, '/': 20, '//': 20, '%': 20, '@': 20, '**': 30}
+_UNARY_POWER = 25
+_RIGHT_ASSOCIATIVE = frozenset(['**'])
+
+
+def tokenize(source: str, literal: Callable[[str], Any] = float) -> List[tuple]:
+    """
+    Split an expression into (kind, value, position) tokens. Integer
+    literals become ints; literals with a point or exponent are passed to
+    `literal`, float by default.
+    """
+    tokens = []
+    append = tokens.append
+    pos = 0
+    for number, name, op, space, error in _TOKEN_RE.findall(source):
+        if number:
+            if '.' in number or 'e' in number or 'E' in number:
+                append(('number', literal(number), pos))
+            else:
+                append(('number', int(number), pos))
+            pos += len(number)
+        elif op:
+            append(('op', '**' if op == '^' else op, pos))
+            pos += len(op)
+        elif name:
+            append(('name', name, pos))
+            pos += len(name)
+        elif space:
+            pos += len(space)
+        else:
+            raise SyntaxError(f"Unexpected character {error!r} at position {pos}")
+    append(('end', None, pos))
+    return tokens
+
+
+class _Parser:
+    """Precedence-climbing parser following Python's operator precedence"""
+
+    __slots__ = ('tokens', 'index')
+
+    def __init__(self, tokens: List[tuple]):
+        self.tokens = tokens
+        self.index = 0
+
+    def error(self, token: tuple, message: str) -> SyntaxError:
+        if token[0] == 'end':
+            return SyntaxError(f"Unexpected end of expression, {message}")
+        return SyntaxError(f"Unexpected {token[1]!r} at position {token[2]}, {message}")
+
+    def parse(self):
+        node = self.expression(0)
+        token = self.tokens[self.index]
+        if token[0] != 'end':
+            raise self.error(token, "expected an operator")
+        return node
+
+    def expression(self, min_power: int):
+        node = self.prefix()
+        tokens = self.tokens
+        while True:
+            kind, value, _ = tokens[self.index]
+            if kind != 'op':
+                return node
+            power = _BINARY_POWER.get(value)
+            if power is None or power < min_power:
+                return node
+            self.index += 1
+            # Right associative, and the exponent may carry its own sign: 2**-1
+            right = self.expression(power if value in _RIGHT_ASSOCIATIVE else power + 1)
+            node = Binary(value, node, right)
+
+    def prefix(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        kind, value, _ = token
+        if kind == 'number':
+            return Num(value)
+        if kind == 'name':
+            following = self.tokens[self.index]
+            if following[0] == 'op' and following[1] == '(':
+                self.index += 1
+                return Call(value, self.arguments())
+            return Var(value)
+        if kind == 'op':
+            if value == '(':
+                node = self.expression(0)
+                self.expect(')')
+                return node
+            if value == '[':
+                return Array(self.arguments(']'))
+            if value == '-' or value == '+':
+                operand = self.expression(_UNARY_POWER)
+                return Unary('neg' if value == '-' else 'pos', operand)
+        raise self.error(token, "expected a number, name, '(' or '['")
+
+    def expect(self, value: str):
+        token = self.tokens[self.index]
+        self.index += 1
+        if token[0] != 'op' or token[1] != value:
+            raise self.error(token, f"expected {value!r}")
+
+    def arguments(self, close: str = ')') -> tuple:
+        """Comma-separated expressions up to the closing bracket"""
+        args = []
+        token = self.tokens[self.index]
+        if token[0] == 'op' and token[1] == close:
+            self.index += 1
+            return ()
+        while True:
+            args.append(self.expression(0))
+            token = self.tokens[self.index]
+            self.index += 1
+            if token[0] == 'op' and token[1] == close:
+                return tuple(args)
+            if token[0] != 'op' or token[1] != ',':
+                raise self.error(token, f"expected ',' or {close!r}")
+
+
+def parse(source: str, literal: Callable[[str], Any] = float):
+    """Parse an expression string into an AST"""
+    return _Parser(tokenize(source, literal)).parse()
+
+
+def free_variables(node, functions: Mapping[str, Any] = FUNCTIONS) -> frozenset:
+    """Return names referenced by the tree that are not in the function table"""
+    names = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Var):
+            if node.name not in functions:
+                names.add(node.name)
+        elif isinstance(node, Unary):
+            stack.append(node.operand)
+        elif isinstance(node, Binary):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, Call):
+            stack.extend(node.args)
+        elif isinstance(node, Array):
+            stack.extend(node.items)
+    return frozenset(names)
+
+
+def top_function(node) -> Optional[str]:
+    """Return the name of the outermost function call in the tree, if any"""
+    level = [node]
+    while level:
+        following = []
+        for node in level:
+            if isinstance(node, Call):
+                return node.name
+            if isinstance(node, Unary):
+                following.append(node.operand)
+            elif isinstance(node, Binary):
+                following.append(node.left)
+                following.append(node.right)
+            elif isinstance(node, Array):
+                following.extend(node.items)
+        level = following
+    return None
+
+
+def count_nodes(node) -> int:
+    """Return the number of nodes in the tree"""
+    if isinstance(node, Unary):
+        return 1 + count_nodes(node.operand)
+    if isinstance(node, Binary):
+        return 1 + count_nodes(node.left) + count_nodes(node.right)
+    if isinstance(node, Call):
+        return 1 + sum(count_nodes(arg) for arg in node.args)
+    if isinstance(node, Array):
+        return 1 + sum(count_nodes(item) for item in node.items)
+    return 1
+
+
+# Factorials and powers up to these sizes are cheap enough to fold at compile
+# time and to evaluate inline; larger ones are left to the engine
+SMALL_FACTORIAL = 1000
+# Bits in the largest integer power treated as cheap, about 20000 digits
+SMALL_POWER_BITS = 1 << 16
+
+# Exceptions that leave a constant subtree unfolded, so evaluation raises them
+_FOLD_ERRORS = (ArithmeticError, ValueError, TypeError)
+# A bound on the bits of any finite float, which is as far as float results grow
+_FLOAT_BITS = 1024
+
+
+def _number_bits(value) -> int:
+    """Bits in an integer or fraction literal; other numbers are bounded like floats"""
+    if isinstance(value, int):
+        return max(1, abs(value).bit_length())
+    if isinstance(value, numbers.Rational):
+        return max(1, abs(value.numerator).bit_length()) + value.denominator.bit_length()
+    return _FLOAT_BITS
+
+
+def _power_bits(base, exponent) -> Optional[int]:
+    if isinstance(base, Num) and not isinstance(base.value, numbers.Rational):
+        return _FLOAT_BITS
+    if isinstance(exponent, Num) and not isinstance(exponent.value, numbers.Rational):
+        return _FLOAT_BITS
+    base_bits, exponent_bits = result_bits(base), result_bits(exponent)
+    if base_bits is None or exponent_bits is None:
+        return None
+    if isinstance(exponent, Num):
+        return base_bits * max(1, abs(int(exponent.value)))
+    if exponent_bits > 32:
+        return None
+    return base_bits << exponent_bits
+
+
+def result_bits(node) -> Optional[int]:
+    """
+    Upper bound on the number of bits in the value of a constant tree, or
+    None if it cannot be bounded (variables, unknown functions, arrays). A
+    power of an integer has the bits of its base times the exponent; float
+    results are bounded by the float range.
+    """
+    if isinstance(node, Num):
+        return _number_bits(node.value)
+    if isinstance(node, Var):
+        value = FUNCTIONS.get(node.name)
+        return _FLOAT_BITS if isinstance(value, float) else None
+    if isinstance(node, Unary):
+        return result_bits(node.operand)
+    if isinstance(node, Binary):
+        if node.op == '**':
+            return _power_bits(node.left, node.right)
+        left, right = result_bits(node.left), result_bits(node.right)
+        if left is None or right is None:
+            return None
+        if node.op in ('+', '-'):
+            return max(left, right) + 1
+        if node.op == '*':
+            return left + right
+        if node.op == '/':
+            return max(_FLOAT_BITS, left + right)
+        if node.op == '//':
+            return left
+        if node.op == '%':
+            return right
+        return None
+    if isinstance(node, Call):
+        args = [result_bits(arg) for arg in node.args]
+        if not args or None in args:
+            return None
+        if node.name == 'pow':
+            return _power_bits(*node.args) if len(args) == 2 else args[-1]
+        if node.name in ('factorial', 'binomial'):
+            n = node.args[0].value if isinstance(node.args[0], Num) else None
+            if isinstance(n, float) and n.is_integer():
+                n = int(n)
+            if not isinstance(n, int):
+                if args[0] > 64:
+                    return None
+                n = 1 << args[0]
+            # n! < n**n and binomial(n, k) < 2**n
+            return max(1, abs(n)) * args[0] if node.name == 'factorial' else abs(n) + 1
+        if node.name in ('gcd', 'abs', 'floor', 'ceil', 'round'):
+            return max(args)
+        if node.name == 'lcm':
+            return sum(args)
+        if callable(FUNCTIONS.get(node.name)):
+            return _FLOAT_BITS
+    return None
+
+
+def is_small_power(node) -> bool:
+    """True if a power's result is small enough to compute inline"""
+    bits = result_bits(node)
+    return bits is not None and bits <= SMALL_POWER_BITS
+
+
+def _cheap(node) -> bool:
+    """False for constant factorials, binomials and powers whose result may be huge"""
+    if isinstance(node, Binary) and node.op == '**' or isinstance(node, Call) and node.name == 'pow':
+        return is_small_power(node)
+    if isinstance(node, Call) and node.name in ('factorial', 'binomial'):
+        return all(isinstance(arg.value, (int, float)) and arg.value <= SMALL_FACTORIAL for arg in node.args)
+    return True
+
+
+def _fold(node, func, *args):
+    """Replace a constant node by its value, or keep it if evaluating it fails"""
+    if not _cheap(node):
+        return node
+    try:
+        return Num(func(*args))
+    except _FOLD_ERRORS:
+        return node
+
+
+def simplify(node, functions: Mapping[str, Any] = FUNCTIONS, operators: Mapping[str, Callable] = OPERATORS):
+    """
+    Fold constant subtrees with the given tables and drop trivial identities.
+
+    Only rewrites that give the same value for every input are applied:
+    x*1, 1*x, x**1, x-0, +x, --x, x+-y and x--y. Identities such as x+0 or
+    x*0 are kept because they differ for -0.0, inf or nan. Folding never
+    reassociates, so 2*x*3 is left alone.
+    """
+    if isinstance(node, Var):
+        value = functions.get(node.name)
+        if value is not None and not callable(value):
+            return Num(value)
+        return node
+
+    # Identities assume the standard arithmetic operators
+    standard = operators is OPERATORS
+
+    if isinstance(node, Unary):
+        operand = simplify(node.operand, functions, operators)
+        if isinstance(operand, Num):
+            return _fold(Unary(node.op, operand), operators[node.op], operand.value)
+        if standard:
+            if node.op == 'pos':
+                return operand
+            if isinstance(operand, Unary) and operand.op == 'neg':
+                return operand.operand
+        return Unary(node.op, operand)
+
+    if isinstance(node, Binary):
+        op = node.op
+        left = simplify(node.left, functions, operators)
+        right = simplify(node.right, functions, operators)
+        if isinstance(left, Num) and isinstance(right, Num):
+            return _fold(Binary(op, left, right), operators[op], left.value, right.value)
+        if standard:
+            if _is_int(right, 1) and op in ('*', '**') or _is_int(right, 0) and op == '-':
+                return left
+            if _is_int(left, 1) and op == '*':
+                return right
+            if op in ('+', '-') and isinstance(right, Unary) and right.op == 'neg':
+                return Binary('-' if op == '+' else '+', left, right.operand)
+        return Binary(op, left, right)
+
+    if isinstance(node, Call):
+        args = tuple(simplify(arg, functions, operators) for arg in node.args)
+        node = Call(node.name, args)
+        func = functions.get(node.name)
+        if callable(func) and all(isinstance(arg, Num) for arg in args):
+            return _fold(node, func, *[arg.value for arg in args])
+        return node
+
+    if isinstance(node, Array):
+        return Array(tuple(simplify(item, functions, operators) for item in node.items))
+
+    return node
+
+
+def _is_int(node, value: int) -> bool:
+    return isinstance(node, Num) and type(node.value) is int and node.value == value
+
+
+def _leaf_key(node):
+    """Structural key of a leaf that tells 1 from 1.0 and 0.0 from -0.0"""
+    if isinstance(node, Num):
+        value = node.value
+        if isinstance(value, float):
+            return ('num', float, value, math.copysign(1.0, value))
+        return ('num', type(value), value)
+    return ('var', node.name)
+
+
+def hoist_common(node):
+    """
+    Find subexpressions that occur more than once and bind each to a
+    temporary. Returns (bindings, body): bindings is a list of (name, tree)
+    in dependency order, and body refers to the temporaries as variables.
+    Temporary names start with '$', which the tokenizer never produces.
+    """
+    ids = {}            # structural key -> id of a distinct subtree
+    subtrees = []       # id -> (representative node, child ids)
+
+    def number(node) -> int:
+        if isinstance(node, Unary):
+            children = (number(node.operand),)
+            key = ('unary', node.op) + children
+        elif isinstance(node, Binary):
+            children = (number(node.left), number(node.right))
+            key = ('binary', node.op) + children
+        elif isinstance(node, Call):
+            children = tuple(number(arg) for arg in node.args)
+            key = ('call', node.name) + children
+        elif isinstance(node, Array):
+            children = tuple(number(item) for item in node.items)
+            key = ('array',) + children
+        else:
+            children = ()
+            key = _leaf_key(node)
+        index = ids.get(key)
+        if index is None:
+            index = ids[key] = len(subtrees)
+            subtrees.append((node, children))
+        return index
+
+    root = number(node)
+    # With every distinct subtree shared, one that is referenced from more
+    # than one place would otherwise be evaluated more than once
+    references = [0] * len(subtrees)
+    for _, children in subtrees:
+        for child in children:
+            references[child] += 1
+    shared = {index for index, (tree, children) in enumerate(subtrees)
+              if children and references[index] > 1 and index != root}
+    if not shared:
+        return [], node
+
+    names = {}
+    bindings = []
+
+    def build(index: int):
+        tree, children = subtrees[index]
+        if isinstance(tree, Unary):
+            return Unary(tree.op, reference(children[0]))
+        if isinstance(tree, Binary):
+            return Binary(tree.op, reference(children[0]), reference(children[1]))
+        if isinstance(tree, Call):
+            return Call(tree.name, tuple(reference(child) for child in children))
+        if isinstance(tree, Array):
+            return Array(tuple(reference(child) for child in children))
+        return tree
+
+    def reference(index: int):
+        if index not in shared:
+            return build(index)
+        if index not in names:
+            # Building first binds the temporaries this one depends on
+            value = build(index)
+            names[index] = f"${len(bindings)}"
+            bindings.append((names[index], value))
+        return Var(names[index])
+
+    body = build(root)
+    return bindings, body
+
+
+def compile_tree(node, functions: Mapping[str, Any] = FUNCTIONS,
+                 operators: Mapping[str, Callable] = OPERATORS) -> Callable:
+    """Compile an AST into a callable taking a variable mapping"""
+    if isinstance(node, Num):
+        value = node.value
+        return lambda env: value
+
+    if isinstance(node, Var):
+        name = node.name
+        if name in functions:
+            value = functions[name]
+            if callable(value):
+                raise TypeError(f"'{name}' is a function and must be called")
+            return lambda env: value
+
+        def load(env):
+            try:
+                return env[name]
+            except (KeyError, TypeError):
+                raise NameError(f"name '{name}' is not defined") from None
+        return load
+
+    if isinstance(node, Unary):
+        op = operators[node.op]
+        operand = compile_tree(node.operand, functions, operators)
+        return lambda env: op(operand(env))
+
+    if isinstance(node, Binary):
+        op = operators[node.op]
+        left = compile_tree(node.left, functions, operators)
+        right = compile_tree(node.right, functions, operators)
+        return lambda env: op(left(env), right(env))
+
+    if isinstance(node, Call):
+        if node.name not in functions:
+            raise NameError(f"name '{node.name}' is not defined")
+        func = functions[node.name]
+        if not callable(func):
+            raise TypeError(f"'{node.name}' is not a function")
+        args = [compile_tree(arg, functions, operators) for arg in node.args]
+        if len(args) == 1:
+            arg, = args
+            return lambda env: func(arg(env))
+        if len(args) == 2:
+            first, second = args
+            return lambda env: func(first(env), second(env))
+        return lambda env: func(*[arg(env) for arg in args])
+
+    if isinstance(node, Array):
+        build = operators.get('array')
+        if build is None:
+            raise TypeError("Vectors and matrices are not supported here")
+        items = [compile_tree(item, functions, operators) for item in node.items]
+        return lambda env: build([item(env) for item in items])
+
+    raise TypeError(f"Unknown expression node: {node!r}")
+
+
+def compile_optimized(node, functions: Mapping[str, Any] = FUNCTIONS,
+                      operators: Mapping[str, Callable] = OPERATORS) -> Callable:
+    """
+    Simplify the tree, hoist its repeated subexpressions and compile it.
+    Temporaries are computed once per call into a copy of the variables.
+    """
+    bindings, body = hoist_common(simplify(node, functions, operators))
+    evaluate = compile_tree(body, functions, operators)
+    if not bindings:
+        return evaluate
+    steps = [(name, compile_tree(tree, functions, operators)) for name, tree in bindings]
+
+    def run(env):
+        scope = dict(env) if env else {}
+        for name, step in steps:
+            scope[name] = step(scope)
+        return evaluate(scope)
+    return run
+
+
+_UNSET = object()
+
+
+class Expression:
+    """A parsed expression with a lazily compiled float evaluator"""
+
+    __slots__ = ('source', 'tree', '_variables', '_size', '_function', '_evaluate', '_compiled')
+
+    def __init__(self, source: str, tree=None):
+        self.source = source
+        self.tree = tree if tree is not None else parse(source)
+        self._variables = None
+        self._size = None
+        self._function = _UNSET
+        self._evaluate = None
+        self._compiled = None
+
+    @property
+    def variables(self) -> frozenset:
+        """Names the expression expects to be supplied at evaluation time"""
+        if self._variables is None:
+            self._variables = free_variables(self.tree)
+        return self._variables
+
+    @property
+    def size(self) -> int:
+        """Number of AST nodes, a rough measure of evaluation cost"""
+        if self._size is None:
+            self._size = count_nodes(self.tree)
+        return self._size
+
+    @property
+    def function(self) -> Optional[str]:
+        """Outermost function called by the expression, or None for plain arithmetic"""
+        if self._function is _UNSET:
+            self._function = top_function(self.tree)
+        return self._function
+
+    def evaluate(self, env: Optional[Dict[str, Any]] = None) -> Any:
+        """Evaluate with the default function table"""
+        evaluate = self._evaluate
+        if evaluate is None:
+            evaluate = self._evaluate = compile_optimized(self.tree)
+        return evaluate(env)
+
+    def compile(self, functions: Mapping[str, Any], operators: Mapping[str, Callable] = OPERATORS) -> Callable:
+        """Optimize and compile the tree against an alternative function table, caching the result"""
+        key = (id(functions), id(operators))
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self._compiled = {}
+        evaluate = compiled.get(key)
+        if evaluate is None:
+            evaluate = compiled[key] = compile_optimized(self.tree, functions, operators)
+        return evaluate
+
+    def __repr__(self):
+        return f"Expression({self.source!r})"
@@ -0,0 +1,257 @@
+"""
+Integer Math
+============
+
+Big-integer kernels for the calculator: cached factorials, binomial
+coefficients built from a cached prime table, modular exponentiation,
+and decimal display of huge integers.
+
+Converting an int to decimal text takes time quadratic in its length on
+the Python versions this runs on, and CPython refuses to convert more than
+a few thousand digits at all. Huge results are therefore shown in
+scientific notation computed from their leading bits; the full digits are
+only produced on request, by a divide-and-conquer conversion through the
+decimal module, whose multiplication is subquadratic. Text coming the other
+way is converted by halves too.
+"""
+
+import bisect
+import decimal
+import itertools
+import math
+import threading
+from array import array
+from decimal import Decimal
+from functools import lru_cache
+from typing import List
+
+# Factorials kept in a table, built up incrementally
+FACTORIAL_TABLE_SIZE = 1024
+# Larger factorials remembered by argument
+FACTORIAL_CACHE_SIZE = 16
+# Binomials with a smaller k are left to math.comb
+BINOMIAL_DIRECT = 256
+# The prime table never grows past this bound
+PRIME_TABLE_LIMIT = 10_000_000
+# Ints with up to this many digits are shown in full
+MAX_EXACT_DIGITS = 4000
+# Significant digits shown for larger ints
+SIGNIFICANT_DIGITS = 20
+
+_EXACT_BITS = int(MAX_EXACT_DIGITS * math.log2(10))
+# Pieces of at most this many bits go straight to Decimal()
+_CONVERSION_BITS = 2048
+
+_factorials = [1]
+_primes = array('L')
+_sieved = 1
+_lock = threading.Lock()
+
+
+def as_integer(value, name: str) -> int:
+    """Accept ints and integral floats, as the math module's integer functions did"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise ValueError(f"{name}() only accepts integral values")
+
+
+@lru_cache(maxsize=FACTORIAL_CACHE_SIZE)
+def _large_factorial(n: int) -> int:
+    return math.factorial(n)
+
+
+def factorial(n) -> int:
+    """n! from the table for small n, else from a cache of recent results"""
+    n = as_integer(n, 'factorial')
+    if n < 0:
+        raise ValueError("factorial() not defined for negative values")
+    if n < FACTORIAL_TABLE_SIZE:
+        table = _factorials
+        if n >= len(table):
+            with _lock:
+                value = table[-1]
+                for i in range(len(table), n + 1):
+                    value *= i
+                    table.append(value)
+        return table[n]
+    return _large_factorial(n)
+
+
+def primes_up_to(n: int) -> array:
+    """Primes <= n from a shared sieve that grows on demand"""
+    global _primes, _sieved
+    if n > PRIME_TABLE_LIMIT:
+        raise ValueError(f"Prime table is limited to {PRIME_TABLE_LIMIT}")
+    if n > _sieved:
+        with _lock:
+            if n > _sieved:
+                limit = min(PRIME_TABLE_LIMIT, max(n, 2 * _sieved, 1024))
+                sieve = bytearray([1]) * (limit + 1)
+                sieve[0:2] = b'\x00\x00'
+                for p in range(2, math.isqrt(limit) + 1):
+                    if sieve[p]:
+                        sieve[p * p::p] = bytes(len(range(p * p, limit + 1, p)))
+                _primes = array('L', itertools.compress(range(limit + 1), sieve))
+                _sieved = limit
+    primes = _primes
+    return primes[:bisect.bisect_right(primes, n)]
+
+
+def _product(values, start: int, stop: int) -> int:
+    """Product of values[start:stop], multiplying similar sizes together"""
+    if stop - start <= 8:
+        result = 1
+        for i in range(start, stop):
+            result *= values[i]
+        return result
+    middle = (start + stop) // 2
+    return _product(values, start, middle) * _product(values, middle, stop)
+
+
+def binomial(n, k) -> int:
+    """
+    The binomial coefficient C(n, k). Large ones are assembled from their
+    prime factorization (Kummer's theorem) with a balanced product tree.
+    """
+    n, k = as_integer(n, 'binomial'), as_integer(k, 'binomial')
+    if n < 0:
+        raise ValueError("binomial() not defined for negative n")
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    if k < BINOMIAL_DIRECT or n > PRIME_TABLE_LIMIT:
+        return math.comb(n, k)
+
+    factors: List[int] = []
+    rest = n - k
+    half = n // 2
+    root = math.isqrt(n)
+    for p in primes_up_to(n):
+        if p > rest:
+            factors.append(p)
+        elif p > half:
+            continue
+        elif p > root:
+            if n // p - k // p - rest // p:
+                factors.append(p)
+        else:
+            exponent, power = 0, p
+            while power <= n:
+                exponent += n // power - k // power - rest // power
+                power *= p
+            if exponent:
+                factors.append(p ** exponent)
+    return _product(factors, 0, len(factors))
+
+
+def power(base, exponent, modulus=None):
+    """pow(), with the three-argument form accepting integral floats"""
+    if modulus is None:
+        return pow(base, exponent)
+    return pow(as_integer(base, 'pow'), as_integer(exponent, 'pow'), as_integer(modulus, 'pow'))
+
+
+def gcd(*values) -> int:
+    return math.gcd(*[as_integer(value, 'gcd') for value in values])
+
+
+def lcm(*values) -> int:
+    values = [as_integer(value, 'lcm') for value in values]
+    if hasattr(math, 'lcm'):
+        return math.lcm(*values)
+    result = 1
+    for value in values:
+        result = abs(result * value) // math.gcd(result, value) if result and value else 0
+    return result
+
+
+def is_huge(n: int) -> bool:
+    """True if an int has too many digits to show in full by default"""
+    return n.bit_length() > _EXACT_BITS
+
+
+def leading_digits(n: int, digits: int) -> Decimal:
+    """n rounded to `digits` significant digits, from its top bits only"""
+    magnitude = abs(n)
+    shift = max(0, magnitude.bit_length() - 4 * (digits + 10))
+    with decimal.localcontext() as ctx:
+        ctx.prec = digits + 10
+        ctx.Emax = decimal.MAX_EMAX
+        value = Decimal(magnitude >> shift) * Decimal(2) ** shift
+        ctx.prec = digits
+        return +value if n >= 0 else -value
+
+
+def digit_count(n: int) -> int:
+    """Number of decimal digits of n, from its leading digits"""
+    if not is_huge(n):
+        return len(str(abs(n)))
+    leading = leading_digits(n, SIGNIFICANT_DIGITS)
+    digits = leading.adjusted() + 1
+    # 99...9 rounds up to 1.00...0e+k; only then is the exact comparison needed
+    if leading.as_tuple().digits == (1,) + (0,) * (SIGNIFICANT_DIGITS - 1) and abs(n) < 10 ** (digits - 1):
+        digits -= 1
+    return digits
+
+
+def scientific(n: int, digits: int = SIGNIFICANT_DIGITS) -> str:
+    """n in scientific notation with `digits` significant digits"""
+    return format(leading_digits(n, digits), f'.{digits - 1}e')
+
+
+def to_decimal_string(n: int) -> str:
+    """All digits of n, converting halves recursively instead of digit by digit"""
+    if not is_huge(n):
+        return str(n)
+    powers = {}
+
+    def power_of_two(bits: int) -> Decimal:
+        result = powers.get(bits)
+        if result is None:
+            result = powers[bits] = Decimal(2) ** bits
+        return result
+
+    def convert(value: int, bits: int) -> Decimal:
+        if bits <= _CONVERSION_BITS:
+            return Decimal(value)
+        low_bits = bits >> 1
+        high = value >> low_bits
+        low = value - (high << low_bits)
+        return convert(high, bits - low_bits) * power_of_two(low_bits) + convert(low, low_bits)
+
+    with decimal.localcontext() as ctx:
+        ctx.prec = decimal.MAX_PREC
+        ctx.Emax = decimal.MAX_EMAX
+        ctx.traps[decimal.Inexact] = True
+        text = str(convert(abs(n), n.bit_length()))
+    return '-' + text if n < 0 else text
+
+
+def parse_integer(text: str) -> int:
+    """int() of a string of decimal digits, converting halves recursively so long strings stay fast"""
+    if len(text) <= MAX_EXACT_DIGITS:
+        return int(text)
+    low = len(text) >> 1
+    return parse_integer(text[:-low]) * 10 ** low + parse_integer(text[-low:])
+
+
+def decimal_to_integer(value: Decimal) -> int:
+    """An integral Decimal as an int; int() converts huge ones digit by digit"""
+    sign, digits, exponent = value.as_tuple()
+    n = parse_integer(''.join(map(str, digits)))
+    if exponent > 0:
+        n *= 10 ** exponent
+    elif exponent < 0:
+        n //= 10 ** -exponent
+    return -n if sign else n
+
+
+def format_integer(n: int, full: bool = False) -> str:
+    """Full digits for ordinary ints, scientific notation for huge ones unless `full`"""
+    if full:
+        return to_decimal_string(n)
+    if is_huge(n):
+        return scientific(n)
+    return str(n)
@@ -0,0 +1,158 @@
+"""
+Vectors and Matrices
+====================
+
+Evaluates expressions over vectors and matrices with NumPy.
+
+Bracket literals build arrays: [1, 2, 3] is a vector and [[1, 2], [3, 4]] a
+2x2 matrix. The usual operators and functions apply element by element, @
+is matrix multiplication, and dot, matmul, det, inv, solve and transpose
+cover the common linear algebra. All values are contiguous float64 arrays.
+
+Arrays travel over the protocol packed rather than as nested lists: an
+object with "dtype", "shape" and "data", where data holds the little-endian
+float64 elements in row-major order. The binary encoding carries the bytes
+as they are; JSON carries them as base64 text.
+"""
+
+import base64
+import binascii
+import math
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+from expression import OPERATORS, Array, Binary, Call, Expression, Unary
+from vectorized import MAX_BATCH_SIZE, NUMPY_AVAILABLE, NUMPY_FUNCTIONS, np
+
+ARRAY_DTYPE = 'float64'
+MAX_ELEMENTS = MAX_BATCH_SIZE
+MAX_DIMENSIONS = 8
+
+
+def _stack(items):
+    """Build an array from the values of a bracket literal"""
+    try:
+        array = np.array(items, dtype=np.float64)
+    except ValueError:
+        raise ValueError("Rows of a matrix must all have the same length") from None
+    if array.size > MAX_ELEMENTS:
+        raise ValueError(f"Array too large: {array.size} elements (maximum {MAX_ELEMENTS})")
+    return array
+
+
+if NUMPY_AVAILABLE:
+    MATRIX_FUNCTIONS = MappingProxyType(dict(
+        NUMPY_FUNCTIONS,
+        dot=np.dot,
+        matmul=np.matmul,
+        det=np.linalg.det,
+        inv=np.linalg.inv,
+        solve=np.linalg.solve,
+        transpose=np.transpose,
+    ))
+    MATRIX_OPERATORS = MappingProxyType(dict(OPERATORS, array=_stack))
+else:
+    MATRIX_FUNCTIONS = MATRIX_OPERATORS = None
+
+# Functions that only make sense for arrays
+_MATRIX_ONLY = frozenset(['dot', 'matmul', 'det', 'inv', 'solve', 'transpose'])
+
+
+def uses_arrays(node) -> bool:
+    """True if the tree has a bracket literal, @ or a linear algebra function"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Array):
+            return True
+        if isinstance(node, Call):
+            if node.name in _MATRIX_ONLY:
+                return True
+            stack.extend(node.args)
+        elif isinstance(node, Binary):
+            if node.op == '@':
+                return True
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, Unary):
+            stack.append(node.operand)
+    return False
+
+
+def is_packed(value: Any) -> bool:
+    """True if a decoded message value is a packed array"""
+    return isinstance(value, dict) and "shape" in value and "data" in value
+
+
+def pack_array(array) -> Dict[str, Any]:
+    """Pack an array for a message"""
+    array = np.ascontiguousarray(array, dtype='<f8')
+    return {"dtype": ARRAY_DTYPE, "shape": list(array.shape), "data": array.tobytes()}
+
+
+def unpack_array(value: Mapping[str, Any]):
+    """Rebuild an array from its packed form, with data as bytes or base64 text"""
+    if value.get("dtype", ARRAY_DTYPE) != ARRAY_DTYPE:
+        raise ValueError(f"Arrays must have dtype {ARRAY_DTYPE}")
+    shape = value.get("shape")
+    if not isinstance(shape, list) or len(shape) > MAX_DIMENSIONS \
+            or not all(isinstance(n, int) and not isinstance(n, bool) and n >= 0 for n in shape):
+        raise ValueError("Array shape must be a list of non-negative integers")
+    size = math.prod(shape)
+    if size > MAX_ELEMENTS:
+        raise ValueError(f"Array too large: {size} elements (maximum {MAX_ELEMENTS})")
+    data = value.get("data")
+    if isinstance(data, str):
+        try:
+            data = base64.b64decode(data, validate=True)
+        except binascii.Error:
+            raise ValueError("Array data is not valid base64") from None
+    if not isinstance(data, bytes) or len(data) != 8 * size:
+        raise ValueError(f"Array data must hold {size} float64 values")
+    return np.frombuffer(data, dtype='<f8').astype(np.float64).reshape(shape)
+
+
+def _variable(name: str, value: Any):
+    if is_packed(value):
+        return unpack_array(value)
+    if isinstance(value, (list, tuple)):
+        return _stack(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Variable '{name}' must be a number, a list or a packed array")
+    return np.float64(value)
+
+
+def evaluate(expression: Expression, variables: Optional[Dict[str, Any]] = None):
+    """
+    Evaluate an expression over vectors and matrices. Variables may be
+    numbers, nested lists or packed arrays. Returns a float64 array, or a
+    float if the result is a scalar.
+    """
+    if not NUMPY_AVAILABLE:
+        raise ValueError("Vectors and matrices require NumPy")
+    env = {name: _variable(name, value) for name, value in (variables or {}).items()}
+    missing = expression.variables - set(env)
+    if missing:
+        raise NameError(f"name '{sorted(missing)[0]}' is not defined")
+
+    evaluate = expression.compile(MATRIX_FUNCTIONS, MATRIX_OPERATORS)
+    # LinAlgError, e.g. for a singular matrix, is a ValueError
+    with np.errstate(all='ignore'):
+        result = np.asarray(evaluate(env))
+    # Element-by-element fallbacks such as factorial produce object arrays
+    if result.dtype != np.float64:
+        result = result.astype(np.float64)
+
+    if result.ndim == 0:
+        value = float(result)
+        if not math.isfinite(value):
+            raise ValueError("math domain error")
+        return value
+    if result.size > MAX_ELEMENTS:
+        raise ValueError(f"Array too large: {result.size} elements (maximum {MAX_ELEMENTS})")
+    return result
+
+
+def format_array(array) -> str:
+    """Readable text for an array, summarized when it is large"""
+    return np.array2string(array, precision=10, separator=', ', threshold=100)
@@ -0,0 +1,264 @@
+"""
+Server Metrics
+==============
+
+Low-overhead instrumentation for the calculator server: request and error
+counters, connection gauges and latency histograms split by request phase,
+by command and by the top-level function of the expression.
+
+Histograms use fixed power-of-two buckets, so the bucket of a sample comes
+straight from its binary exponent: recording is a few arithmetic operations
+under one lock and memory does not grow with traffic. Snapshots are
+available as a dict (the "stats" command) and in the Prometheus text
+exposition format, optionally served over HTTP.
+"""
+
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Bucket upper bounds in seconds: 10us doubling up to about 10s
+BUCKET_MINIMUM = 0.00001
+BUCKET_COUNT = 21
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram; callers hold the registry lock"""
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', '_scale', '_overflow')
+
+    def __init__(self, minimum: float = BUCKET_MINIMUM, buckets: int = BUCKET_COUNT):
+        self.bounds = tuple(minimum * 2 ** power for power in range(buckets))
+        self.counts = [0] * (buckets + 1)
+        self.count = 0
+        self.total = 0.0
+        self._scale = 1.0 / minimum
+        self._overflow = buckets
+
+    def observe(self, value: float):
+        # value <= minimum * 2**e where e is the binary exponent of value / minimum,
+        # less one when value / minimum is an exact power of two that sits on a bound
+        scaled = value * self._scale
+        if scaled > 1.0:
+            mantissa, index = math.frexp(scaled)
+            if mantissa == 0.5:
+                index -= 1
+        else:
+            index = 0
+        self.counts[index if index < self._overflow else self._overflow] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, fraction: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            if seen + bucket >= rank and bucket:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket
+            seen += bucket
+        return self.bounds[-1]
+
+    def summary(self) -> Dict[str, Any]:
+        """Count, mean and estimated percentiles in milliseconds"""
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 4) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.50) * 1000, 4),
+            "p95_ms": round(self.quantile(0.95) * 1000, 4),
+            "p99_ms": round(self.quantile(0.99) * 1000, 4),
+        }
+
+
+class Metrics:
+    """Thread-safe registry of the server's counters and histograms"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests: Dict[str, int] = {}
+        self.failures: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.active_connections = 0
+        self.connections = 0
+        self.phases: Dict[str, Histogram] = {}
+        self.commands: Dict[str, Histogram] = {}
+        self.functions: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, family: Dict[str, Histogram], label: str) -> Histogram:
+        histogram = family.get(label)
+        if histogram is None:
+            histogram = family[label] = Histogram()
+        return histogram
+
+    def connection_opened(self):
+        with self._lock:
+            self.active_connections += 1
+            self.connections += 1
+
+    def connection_closed(self):
+        with self._lock:
+            self.active_connections -= 1
+
+    def record_request(self, command: str, seconds: float, success: bool):
+        """Count one request and its end-to-end handling time"""
+        with self._lock:
+            self.requests[command] = self.requests.get(command, 0) + 1
+            if not success:
+                self.failures[command] = self.failures.get(command, 0) + 1
+            self._histogram(self.commands, command).observe(seconds)
+
+    def record_phases(self, function: Optional[str], phases: Tuple[Tuple[str, float], ...]):
+        """Record (phase, seconds) timings of one calculation and its total under its top-level function"""
+        histograms = self.phases
+        with self._lock:
+            total = 0.0
+            for phase, seconds in phases:
+                histogram = histograms.get(phase)
+                if histogram is None:
+                    histogram = histograms[phase] = Histogram()
+                histogram.observe(seconds)
+                total += seconds
+            self._histogram(self.functions, function or "none").observe(total)
+
+    def record_error(self, kind: str):
+        """Count an error by exception type name"""
+        with self._lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all counters and histogram summaries as plain data"""
+        with self._lock:
+            return {
+                "uptime": round(time.time() - self.started, 3),
+                "connections": {"active": self.active_connections, "total": self.connections},
+                "requests": dict(self.requests),
+                "failures": dict(self.failures),
+                "errors": dict(self.errors),
+                "latency": {
+                    "phase": {name: h.summary() for name, h in self.phases.items()},
+                    "command": {name: h.summary() for name, h in self.commands.items()},
+                    "function": {name: h.summary() for name, h in self.functions.items()},
+                },
+            }
+
+    def export(self) -> Dict[str, Any]:
+        """Raw counters and histogram buckets as plain data, for merging in another process"""
+        with self._lock:
+            return {
+                "started": self.started,
+                "active_connections": self.active_connections,
+                "connections": self.connections,
+                "requests": dict(self.requests),
+                "failures": dict(self.failures),
+                "errors": dict(self.errors),
+                "phases": {name: (list(h.counts), h.count, h.total) for name, h in self.phases.items()},
+                "commands": {name: (list(h.counts), h.count, h.total) for name, h in self.commands.items()},
+                "functions": {name: (list(h.counts), h.count, h.total) for name, h in self.functions.items()},
+            }
+
+    def merge(self, data: Dict[str, Any], gauges: bool = True):
+        """Add counters from export() into this registry; `gauges` also adds open connections"""
+        with self._lock:
+            self.started = min(self.started, data["started"])
+            if gauges:
+                self.active_connections += data["active_connections"]
+            self.connections += data["connections"]
+            for name in ("requests", "failures", "errors"):
+                counters = getattr(self, name)
+                for label, count in data[name].items():
+                    counters[label] = counters.get(label, 0) + count
+            for name in ("phases", "commands", "functions"):
+                family = getattr(self, name)
+                for label, (counts, count, total) in data[name].items():
+                    histogram = self._histogram(family, label)
+                    histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                    histogram.count += count
+                    histogram.total += total
+
+    def prometheus(self, extra: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+        `extra` maps gauge names to numbers, e.g. cache and session counters.
+        """
+        lines: List[str] = []
+        with self._lock:
+            _family(lines, "calculator_requests_total", "counter", "Requests handled by command",
+                    [({"command": k}, v) for k, v in self.requests.items()])
+            _family(lines, "calculator_request_failures_total", "counter", "Unsuccessful responses by command",
+                    [({"command": k}, v) for k, v in self.failures.items()])
+            _family(lines, "calculator_errors_total", "counter", "Calculation errors by exception type",
+                    [({"type": k}, v) for k, v in self.errors.items()])
+            _family(lines, "calculator_active_connections", "gauge", "Open client connections",
+                    [({}, self.active_connections)])
+            _family(lines, "calculator_connections_total", "counter", "Client connections accepted",
+                    [({}, self.connections)])
+            _histograms(lines, "calculator_phase_seconds", "Calculation time by phase", "phase", self.phases)
+            _histograms(lines, "calculator_request_seconds", "Request handling time by command", "command",
+                        self.commands)
+            _histograms(lines, "calculator_function_seconds", "Calculation time by top-level function",
+                        "function", self.functions)
+        for name, value in sorted((extra or {}).items()):
+            _family(lines, f"calculator_{name}", "gauge", name.replace("_", " ").capitalize(), [({}, value)])
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _family(lines: List[str], name: str, kind: str, help_text: str, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {value}")
+
+
+def _histograms(lines: List[str], name: str, help_text: str, label: str, family: Dict[str, Histogram]):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for value, histogram in family.items():
+        cumulative = 0
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels({label: value, 'le': repr(bound)})} {cumulative}")
+        lines.append(f"{name}_bucket{_labels({label: value, 'le': '+Inf'})} {histogram.count}")
+        lines.append(f"{name}_sum{_labels({label: value})} {histogram.total}")
+        lines.append(f"{name}_count{_labels({label: value})} {histogram.count}")
+
+
+def start_http_server(render: Callable[[], str], host: str = 'localhost', port: int = 9100) -> ThreadingHTTPServer:
+    """Serve render() as text/plain on /metrics from a daemon thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
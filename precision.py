@@ -0,0 +1,498 @@
+"""
+Precision Modes
+===============
+
+Arbitrary-precision and exact-rational evaluation for the calculator.
+
+The 'decimal' mode evaluates with the decimal module to a requested number
+of significant digits; the 'fraction' mode evaluates exactly over the
+rationals with the fractions module and rejects functions whose results are
+irrational. Number literals are read from the source text, so 0.1 is one
+tenth rather than the nearest float. Both modes reuse the parser and
+compiler from expression.py with their own function and operator tables.
+
+Pure integer arithmetic runs on Python ints in both modes, since they are
+already exact; everything else goes through decimal or fraction arithmetic,
+however few digits are asked for, so that literals such as 0.1 stay exact.
+"""
+
+import decimal
+import math
+from decimal import Decimal
+from fractions import Fraction
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Callable, Mapping, Optional
+
+import intmath
+from expression import FUNCTIONS, OPERATORS, Binary, Call, Expression, Num, Unary, Var, compile_optimized, parse
+
+MODES = ('float', 'decimal', 'fraction')
+DEFAULT_PRECISION = 28
+MAX_PRECISION = 1000
+# Extra digits carried through intermediate steps of decimal evaluation
+GUARD_DIGITS = 5
+# Digits before the point a number sent as text may have, so that text like
+# '1e999999999' cannot make the server build a billion-digit integer
+MAX_NUMBER_DIGITS = 1_000_000
+
+
+def check_precision(precision: Any) -> int:
+    """Validate a requested number of significant digits"""
+    if precision is None:
+        return DEFAULT_PRECISION
+    if isinstance(precision, bool) or not isinstance(precision, int) or not 1 <= precision <= MAX_PRECISION:
+        raise ValueError(f"Precision must be an integer from 1 to {MAX_PRECISION}")
+    return precision
+
+
+def _dec(x) -> Decimal:
+    if isinstance(x, Decimal):
+        return x
+    if isinstance(x, int) and intmath.is_huge(x):
+        # Converting every digit is slow and the context would round them away
+        return intmath.leading_digits(x, decimal.getcontext().prec)
+    return Decimal(x)
+
+
+def _integer(x, name: str) -> int:
+    """Convert an integral Decimal or Fraction for an integer-only function"""
+    if isinstance(x, int):
+        return x
+    if x == int(x):
+        return int(x)
+    raise ValueError(f"{name}() only accepts integral values")
+
+
+# Decimal mode
+
+@lru_cache(maxsize=32)
+def _pi(precision: int) -> Decimal:
+    """pi to the given number of digits (series from the decimal module recipes)"""
+    with decimal.localcontext() as ctx:
+        ctx.prec = precision + 2
+        three = Decimal(3)
+        lasts, t, s, n, na, d, da = 0, three, 3, 1, 0, 0, 24
+        while s != lasts:
+            lasts = s
+            n, na = n + na, na + 8
+            d, da = d + da, da + 32
+            t = (t * n) / d
+            s += t
+    with decimal.localcontext() as ctx:
+        ctx.prec = precision
+        return +s
+
+
+def _context_pi() -> Decimal:
+    return _pi(decimal.getcontext().prec)
+
+
+def _trig_series(x: Decimal, odd: bool) -> Decimal:
+    """Taylor series of sin (odd) or cos around zero, from the decimal module recipes"""
+    with decimal.localcontext() as ctx:
+        ctx.prec += 2
+        i = 1 if odd else 0
+        term = x if odd else Decimal(1)
+        total, lasts, factorial, sign = term, None, 1, 1
+        square = x * x
+        while total != lasts:
+            lasts = total
+            i += 2
+            factorial *= i * (i - 1)
+            term *= square
+            sign = -sign
+            total += sign * term / factorial
+    return +total
+
+
+def _reduce_angle(x: Decimal) -> Decimal:
+    """Reduce an angle to [-pi, pi] with a few extra digits of pi"""
+    with decimal.localcontext() as ctx:
+        ctx.prec += max(0, x.adjusted()) + 2
+        return x.remainder_near(2 * _context_pi())
+
+
+def _sin(x) -> Decimal:
+    return _trig_series(_reduce_angle(_dec(x)), True)
+
+
+def _cos(x) -> Decimal:
+    return _trig_series(_reduce_angle(_dec(x)), False)
+
+
+def _tan(x) -> Decimal:
+    with decimal.localcontext() as ctx:
+        ctx.prec += 2
+        result = _sin(x) / _cos(x)
+    return +result
+
+
+def _atan(x) -> Decimal:
+    x = _dec(x)
+    with decimal.localcontext() as ctx:
+        ctx.prec += 4
+        # atan(x) = 2 atan(x / (1 + sqrt(1 + x^2))) until the series converges quickly
+        halvings = 0
+        while abs(x) > Decimal('0.1'):
+            x = x / (1 + (1 + x * x).sqrt())
+            halvings += 1
+        # x - x^3/3 + x^5/5 - ...
+        total, lasts, term, i, square = x, None, x, 1, -x * x
+        while total != lasts:
+            lasts = total
+            i += 2
+            term *= square
+            total += term / i
+        result = total * 2 ** halvings
+    return +result
+
+
+def _asin(x) -> Decimal:
+    x = _dec(x)
+    if abs(x) > 1:
+        raise ValueError("math domain error")
+    with decimal.localcontext() as ctx:
+        ctx.prec += 2
+        if abs(x) == 1:
+            result = _context_pi() / 2 * x
+        else:
+            result = _atan(x / (1 - x * x).sqrt())
+    return +result
+
+
+def _acos(x) -> Decimal:
+    with decimal.localcontext() as ctx:
+        ctx.prec += 2
+        result = _context_pi() / 2 - _asin(x)
+    return +result
+
+
+def _sinh(x) -> Decimal:
+    x = _dec(x)
+    with decimal.localcontext() as ctx:
+        ctx.prec += 4
+        result = (x.exp() - (-x).exp()) / 2
+    return +result
+
+
+def _cosh(x) -> Decimal:
+    x = _dec(x)
+    with decimal.localcontext() as ctx:
+        ctx.prec += 4
+        result = (x.exp() + (-x).exp()) / 2
+    return +result
+
+
+def _tanh(x) -> Decimal:
+    x = _dec(x)
+    if abs(x) > decimal.getcontext().prec:
+        return Decimal(1 if x > 0 else -1)
+    with decimal.localcontext() as ctx:
+        ctx.prec += 4
+        t = (2 * x).exp()
+        result = (t - 1) / (t + 1)
+    return +result
+
+
+def _logarithm(method: str, divisor: Optional[int] = None) -> Callable:
+    def log(x) -> Decimal:
+        x = _dec(x)
+        if x <= 0:
+            raise ValueError("math domain error")
+        if divisor is None:
+            return getattr(x, method)()
+        with decimal.localcontext() as ctx:
+            ctx.prec += 2
+            result = x.ln() / Decimal(divisor).ln()
+        return +result
+    return log
+
+
+def _sqrt(x) -> Decimal:
+    x = _dec(x)
+    if x < 0:
+        raise ValueError("math domain error")
+    return x.sqrt()
+
+
+def _decimal_divide(a, b) -> Decimal:
+    return _dec(a) / b
+
+
+def _decimal_divmod(a, b):
+    """Floor division and modulo with Python's sign rules instead of Decimal's truncation"""
+    if isinstance(a, int) and isinstance(b, int):
+        return divmod(a, b)
+    a, b = _dec(a), _dec(b)
+    quotient, remainder = a // b, a % b
+    if remainder and (remainder < 0) != (b < 0):
+        quotient -= 1
+        remainder += b
+    return quotient, remainder
+
+
+def _decimal_power(x, y, mod=None):
+    if mod is not None:
+        return pow(_integer(x, 'pow'), _integer(y, 'pow'), _integer(mod, 'pow'))
+    if isinstance(x, int) and isinstance(y, int) and y >= 0:
+        return x ** y
+    x, y = _dec(x), _dec(y)
+    if x == 0 and y < 0:
+        raise ZeroDivisionError("0.0 cannot be raised to a negative power")
+    return x ** y
+
+
+DECIMAL_OPERATORS = MappingProxyType(dict(
+    OPERATORS,
+    **{
+        "/": _decimal_divide,
+        "//": lambda a, b: _decimal_divmod(a, b)[0],
+        "%": lambda a, b: _decimal_divmod(a, b)[1],
+        "**": _decimal_power,
+    }
+))
+
+
+@lru_cache(maxsize=32)
+def decimal_functions(precision: int) -> Mapping:
+    """Function table for decimal mode; constants are computed to `precision` digits"""
+    pi = _pi(precision)
+    with decimal.localcontext() as ctx:
+        ctx.prec = precision
+        e = Decimal(1).exp()
+    return MappingProxyType({
+        "sin": _sin,
+        "cos": _cos,
+        "tan": _tan,
+        "asin": _asin,
+        "acos": _acos,
+        "atan": _atan,
+        "sinh": _sinh,
+        "cosh": _cosh,
+        "tanh": _tanh,
+        "log": _logarithm('log10'),
+        "ln": _logarithm('ln'),
+        "log10": _logarithm('log10'),
+        "log2": _logarithm('ln', 2),
+        "sqrt": _sqrt,
+        "exp": lambda x: _dec(x).exp(),
+        "pow": _decimal_power,
+        "abs": abs,
+        "floor": math.floor,
+        "ceil": math.ceil,
+        "round": round,
+        "pi": pi,
+        "π": pi,
+        "e": e,
+        "factorial": lambda x: intmath.factorial(_integer(x, 'factorial')),
+        "binomial": lambda n, k: intmath.binomial(_integer(n, 'binomial'), _integer(k, 'binomial')),
+        "degrees": lambda x: _dec(x) * 180 / _context_pi(),
+        "radians": lambda x: _dec(x) * _context_pi() / 180,
+        "gcd": lambda *values: intmath.gcd(*[_integer(value, 'gcd') for value in values]),
+        "lcm": lambda *values: intmath.lcm(*[_integer(value, 'lcm') for value in values]),
+    })
+
+
+# Fraction mode
+
+def _iroot(n: int, k: int) -> int:
+    """Largest integer r with r**k <= n, for n >= 0"""
+    if n < 2:
+        return n
+    r = 1 << -(-n.bit_length() // k)
+    while True:
+        s = ((k - 1) * r + n // r ** (k - 1)) // k
+        if s >= r:
+            return r
+        r = s
+
+
+def _exact_root(x: Fraction, k: int) -> Fraction:
+    """The rational k-th root of x, or ValueError if it is irrational"""
+    negative = x < 0
+    if negative and k % 2 == 0:
+        raise ValueError("math domain error")
+    numerator, denominator = abs(x.numerator), x.denominator
+    top, bottom = _iroot(numerator, k), _iroot(denominator, k)
+    if top ** k != numerator or bottom ** k != denominator:
+        raise ValueError("Result is irrational; use decimal mode")
+    root = Fraction(top, bottom)
+    return -root if negative else root
+
+
+def _fraction_power(x, y, mod=None):
+    if mod is not None:
+        return pow(_integer(x, 'pow'), _integer(y, 'pow'), _integer(mod, 'pow'))
+    if isinstance(x, int) and isinstance(y, int) and y >= 0:
+        return x ** y
+    x, y = Fraction(x), Fraction(y)
+    if y.denominator != 1:
+        x = _exact_root(x, y.denominator)
+    if x == 0 and y < 0:
+        raise ZeroDivisionError("0 cannot be raised to a negative power")
+    return x ** y.numerator
+
+
+FRACTION_OPERATORS = MappingProxyType(dict(
+    OPERATORS,
+    **{
+        "/": lambda a, b: Fraction(a) / b,
+        "**": _fraction_power,
+    }
+))
+
+FRACTION_FUNCTIONS = MappingProxyType({
+    "sqrt": lambda x: _exact_root(Fraction(x), 2),
+    "pow": _fraction_power,
+    "abs": abs,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "round": round,
+    "factorial": lambda x: intmath.factorial(_integer(x, 'factorial')),
+    "binomial": lambda n, k: intmath.binomial(_integer(n, 'binomial'), _integer(k, 'binomial')),
+    "gcd": lambda *values: intmath.gcd(*[_integer(value, 'gcd') for value in values]),
+    "lcm": lambda *values: intmath.lcm(*[_integer(value, 'lcm') for value in values]),
+})
+
+# Operations that keep integer operands integral
+_INTEGER_OPERATORS = frozenset(['+', '-', '*', '//', '%'])
+_INTEGER_FUNCTIONS = frozenset(['abs', 'factorial', 'binomial', 'gcd', 'lcm'])
+
+
+def _integral(node) -> bool:
+    """True if evaluating the tree on ints can only produce ints"""
+    if isinstance(node, Num):
+        return type(node.value) is int
+    if isinstance(node, Unary):
+        return _integral(node.operand)
+    if isinstance(node, Binary):
+        if node.op == '**':
+            return _integral(node.left) and isinstance(node.right, Num) and type(node.right.value) is int \
+                and node.right.value >= 0
+        return node.op in _INTEGER_OPERATORS and _integral(node.left) and _integral(node.right)
+    if isinstance(node, Call):
+        return node.name in _INTEGER_FUNCTIONS and all(_integral(arg) for arg in node.args)
+    return False
+
+
+def _check_exact(node):
+    """Reject calculator names that have no exact rational value"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (Var, Call)) and node.name in FUNCTIONS and node.name not in FRACTION_FUNCTIONS:
+            raise ValueError(f"'{node.name}' has no exact rational value; use decimal mode")
+        if isinstance(node, Unary):
+            stack.append(node.operand)
+        elif isinstance(node, Binary):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, Call):
+            stack.extend(node.args)
+
+
+def _evaluate_decimal(expression: Expression, precision: int) -> Decimal:
+    if _integral(expression.tree):
+        result = expression.evaluate()
+        return intmath.leading_digits(result, precision) if intmath.is_huge(result) else Decimal(result)
+
+    with decimal.localcontext() as ctx:
+        ctx.prec = precision + GUARD_DIGITS
+        tree = parse(expression.source, Decimal)
+        try:
+            result = compile_optimized(tree, decimal_functions(ctx.prec), DECIMAL_OPERATORS)(None)
+        except decimal.Overflow:
+            raise OverflowError("math range error") from None
+        except ZeroDivisionError:
+            raise ZeroDivisionError("division by zero") from None
+        except decimal.InvalidOperation:
+            raise ValueError("math domain error") from None
+    return _dec(result)
+
+
+def _evaluate_fraction(expression: Expression) -> Fraction:
+    if _integral(expression.tree):
+        return Fraction(expression.evaluate())
+    tree = parse(expression.source, Fraction)
+    _check_exact(tree)
+    return Fraction(compile_optimized(tree, FRACTION_FUNCTIONS, FRACTION_OPERATORS)(None))
+
+
+def evaluate(expression: Expression, mode: str, precision: Optional[int] = None):
+    """
+    Evaluate a parsed expression in 'decimal' or 'fraction' mode, returning
+    a Decimal rounded to `precision` significant digits or an exact Fraction
+    """
+    if mode == 'decimal':
+        precision = check_precision(precision)
+        result = _evaluate_decimal(expression, precision)
+        with decimal.localcontext() as ctx:
+            ctx.prec = precision
+            return +result
+    if mode == 'fraction':
+        return _evaluate_fraction(expression)
+    raise ValueError(f"Unknown mode {mode!r}; expected one of {', '.join(MODES)}")
+
+
+def format_exact(value, precision: Optional[int] = None) -> str:
+    """
+    Text form of a precise result: '1/3' for fractions, and for decimals
+    plain digits unless the value needs more than `precision` digits before
+    the point or is very small
+    """
+    if isinstance(value, Fraction):
+        if value.denominator == 1:
+            return intmath.to_decimal_string(value.numerator)
+        return f"{intmath.to_decimal_string(value.numerator)}/{intmath.to_decimal_string(value.denominator)}"
+    value = value.normalize(decimal.Context(prec=max(1, len(value.as_tuple().digits))))
+    if -7 < value.adjusted() < check_precision(precision):
+        return format(value, 'f')
+    return str(value)
+
+
+def to_number(value):
+    """Nearest JSON number to a precise result, for the calculator's memory"""
+    if isinstance(value, Fraction) and value.denominator == 1:
+        return value.numerator
+    if isinstance(value, Decimal) and value == value.to_integral_value():
+        return intmath.decimal_to_integer(value)
+    try:
+        return float(value)
+    except OverflowError:
+        return math.inf if value > 0 else -math.inf
+
+
+def _parse_decimal(text: str, value: Any) -> Decimal:
+    try:
+        number = Decimal(text)
+    except decimal.InvalidOperation:
+        raise ValueError(f"Not a number: {value!r}") from None
+    if not number.is_finite():
+        raise ValueError(f"Not a number: {value!r}")
+    if number.adjusted() >= MAX_NUMBER_DIGITS:
+        raise ValueError(f"Numbers may have at most {MAX_NUMBER_DIGITS} digits")
+    return number
+
+
+def parse_number(value):
+    """
+    A number sent by a client, e.g. for the calculator's memory: a JSON
+    number, or a result as text from any mode, which is digits, scientific
+    notation (as huge integers are shown) or a fraction 'p/q'. Text becomes
+    the nearest number, as precise results do in to_number().
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Not a number: {value!r}")
+    if not isinstance(value, str):
+        return value
+    numerator, slash, denominator = value.partition('/')
+    number = _parse_decimal(numerator, value)
+    if slash:
+        denominator = _parse_decimal(denominator, value)
+        if number != number.to_integral_value() or denominator != denominator.to_integral_value():
+            raise ValueError(f"Not a number: {value!r}")
+        if not denominator:
+            raise ValueError("Division by zero")
+        number = Fraction(intmath.decimal_to_integer(number), intmath.decimal_to_integer(denominator))
+    return to_number(number)
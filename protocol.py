@@ -0,0 +1,353 @@
+"""
+Wire Protocol
+=============
+
+Framing shared by the calculator server, clients and bridges.
+
+Every message is one JSON document terminated by a newline (NDJSON). Requests
+may carry an "id" which the server echoes in the matching response, so a
+client can pipeline many requests on one connection and match the replies.
+For backwards compatibility a bare JSON object without a trailing newline is
+still accepted when it arrives as a complete document.
+
+A connection can switch to a compact binary encoding by sending
+{"command": "hello", "encoding": "binary"} as JSON. Once the server has
+acknowledged it, both directions use length-prefixed frames: a 4-byte
+little-endian payload length followed by a tagged binary value (see pack).
+Lists of floats are sent as packed float64 arrays, which is far cheaper to
+produce and parse than their decimal JSON text.
+
+Raw bytes, such as the data of a packed vector or matrix, travel as they are
+in the binary encoding and as base64 text in JSON.
+"""
+
+import base64
+import json
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Optional
+
+DEFAULT_BUFFER_SIZE = 65536
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+ENCODINGS = ('json', 'binary')
+
+_NEWLINE = 0x0A
+_LENGTH = struct.Struct('<I')
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_SWAP = sys.byteorder != 'little'
+
+
+class ProtocolError(Exception):
+    """Raised when the peer violates the framing rules"""
+
+
+def _pack_floats(values, out: bytearray):
+    """Append a packed float64 array; None entries are listed by index"""
+    nulls = [index for index, value in enumerate(values) if value is None]
+    if nulls:
+        values = [0.0 if value is None else value for value in values]
+    floats = array('d', values)
+    indices = array('I', nulls)
+    if _SWAP:
+        floats.byteswap()
+        indices.byteswap()
+    out += b"a"
+    out += _LENGTH.pack(len(floats))
+    out += _LENGTH.pack(len(indices))
+    out += indices.tobytes()
+    out += floats.tobytes()
+
+
+def _pack(value, out: bytearray):
+    kind = type(value)
+    if value is None:
+        out += b"N"
+    elif kind is bool:
+        out += b"T" if value else b"F"
+    elif kind is float:
+        out += b"d"
+        out += _FLOAT.pack(value)
+    elif kind is int:
+        if -2 ** 63 <= value < 2 ** 63:
+            out += b"i"
+            out += _INT.pack(value)
+        else:
+            data = value.to_bytes(value.bit_length() // 8 + 1, 'little', signed=True)
+            out += b"I"
+            out += _LENGTH.pack(len(data))
+            out += data
+    elif kind is str:
+        data = value.encode('utf-8')
+        out += b"s"
+        out += _LENGTH.pack(len(data))
+        out += data
+    elif kind is dict:
+        out += b"m"
+        out += _LENGTH.pack(len(value))
+        for key, item in value.items():
+            _pack(str(key), out)
+            _pack(item, out)
+    elif kind is list or kind is tuple:
+        kinds = set(map(type, value))
+        if kinds and kinds <= {float, type(None)} and float in kinds:
+            _pack_floats(value, out)
+            return
+        out += b"l"
+        out += _LENGTH.pack(len(value))
+        for item in value:
+            _pack(item, out)
+    elif kind is bytes or kind is bytearray:
+        out += b"b"
+        out += _LENGTH.pack(len(value))
+        out += value
+    else:
+        raise TypeError(f"Cannot encode {kind.__name__} in a binary message")
+
+
+def pack(value: Any) -> bytes:
+    """
+    Serialize a JSON-like value into the binary encoding. Each value is a
+    one-byte tag followed by its body: N/T/F for None and booleans, i for
+    int64, I for larger ints, d for float64, s for UTF-8 strings, b for
+    bytes, l for lists, m for string-keyed maps and a for float arrays.
+    """
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+def _unpack(data: memoryview, offset: int):
+    tag = data[offset]
+    offset += 1
+    if tag == 0x4E:  # N
+        return None, offset
+    if tag == 0x54:  # T
+        return True, offset
+    if tag == 0x46:  # F
+        return False, offset
+    if tag == 0x64:  # d
+        return _FLOAT.unpack_from(data, offset)[0], offset + 8
+    if tag == 0x69:  # i
+        return _INT.unpack_from(data, offset)[0], offset + 8
+    (length,) = _LENGTH.unpack_from(data, offset)
+    offset += 4
+    if tag == 0x73:  # s
+        end = offset + length
+        if end > len(data):
+            raise ProtocolError("Truncated binary message")
+        return str(data[offset:end], 'utf-8'), end
+    if tag == 0x6D:  # m
+        result = {}
+        for _ in range(length):
+            key, offset = _unpack(data, offset)
+            result[key], offset = _unpack(data, offset)
+        return result, offset
+    if tag == 0x6C:  # l
+        result = []
+        for _ in range(length):
+            item, offset = _unpack(data, offset)
+            result.append(item)
+        return result, offset
+    if tag == 0x61:  # a
+        (null_count,) = _LENGTH.unpack_from(data, offset)
+        offset += 4
+        indices = array('I')
+        indices.frombytes(data[offset:offset + 4 * null_count])
+        offset += 4 * null_count
+        floats = array('d')
+        floats.frombytes(data[offset:offset + 8 * length])
+        offset += 8 * length
+        if len(floats) != length or len(indices) != null_count:
+            raise ProtocolError("Truncated binary message")
+        if _SWAP:
+            floats.byteswap()
+            indices.byteswap()
+        result = floats.tolist()
+        for index in indices:
+            result[index] = None
+        return result, offset
+    if tag == 0x49 or tag == 0x62:  # I, b
+        end = offset + length
+        if end > len(data):
+            raise ProtocolError("Truncated binary message")
+        if tag == 0x62:
+            return bytes(data[offset:end]), end
+        return int.from_bytes(data[offset:end], 'little', signed=True), end
+    raise ProtocolError(f"Unknown binary tag 0x{tag:02x}")
+
+
+def unpack(data) -> Any:
+    """Decode one value produced by pack"""
+    view = memoryview(data)
+    try:
+        value, offset = _unpack(view, 0)
+    except (struct.error, IndexError, TypeError, ValueError, RecursionError) as e:
+        raise ProtocolError(f"Malformed binary message: {e}") from None
+    if offset != len(view):
+        raise ProtocolError("Trailing bytes after binary message")
+    return value
+
+
+def json_default(value: Any) -> str:
+    """json.dumps hook that writes bytes as base64 text"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_message(message: Dict[str, Any], encoding: str = 'json') -> bytes:
+    """Serialize a message into a frame for the given connection encoding"""
+    if encoding == 'binary':
+        payload = pack(message)
+        return _LENGTH.pack(len(payload)) + payload
+    return json.dumps(message, separators=(',', ':'), default=json_default).encode('utf-8') + b"\n"
+
+
+class FrameDecoder:
+    """Splits a byte stream into frames; shared by the blocking and asyncio readers"""
+
+    def __init__(self, max_message_size: int = MAX_MESSAGE_SIZE):
+        self.max_message_size = max_message_size
+        self.encoding = 'json'
+        self._buffer = bytearray()
+        self._scanned = 0
+
+    def feed(self, data) -> None:
+        """Append received bytes to the pending buffer"""
+        self._buffer += data
+
+    def _next_binary_frame(self) -> Optional[bytes]:
+        buffer = self._buffer
+        if len(buffer) < 4:
+            return None
+        (length,) = _LENGTH.unpack_from(buffer)
+        if length > self.max_message_size:
+            raise ProtocolError(f"Message exceeds {self.max_message_size} bytes")
+        if len(buffer) < 4 + length:
+            return None
+        frame = bytes(buffer[4:4 + length])
+        del buffer[:4 + length]
+        return frame
+
+    def next_frame(self) -> Optional[bytes]:
+        """Pop one complete frame from the buffer, if any"""
+        if self.encoding == 'binary':
+            return self._next_binary_frame()
+        buffer = self._buffer
+        newline = buffer.find(_NEWLINE, self._scanned)
+        if newline >= 0:
+            frame = bytes(buffer[:newline])
+            del buffer[:newline + 1]
+            self._scanned = 0
+            return frame
+
+        self._scanned = len(buffer)
+        if len(buffer) > self.max_message_size:
+            raise ProtocolError(f"Message exceeds {self.max_message_size} bytes")
+
+        # Legacy peers send one bare JSON object per write without a delimiter
+        if buffer and buffer.rstrip().endswith(b"}"):
+            try:
+                json.loads(buffer)
+            except ValueError:
+                return None
+            frame = bytes(buffer)
+            buffer.clear()
+            self._scanned = 0
+            return frame
+        return None
+
+    def next_message(self) -> Optional[Dict[str, Any]]:
+        """Pop and decode one complete message, skipping blank frames"""
+        if self.encoding == 'binary':
+            frame = self._next_binary_frame()
+            return None if frame is None else unpack(frame)
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                return None
+            if frame.strip():
+                return json.loads(frame)
+
+    def has_pending(self) -> bool:
+        """Return True if a complete message is already buffered"""
+        if self.encoding == 'binary':
+            buffer = self._buffer
+            return len(buffer) >= 4 and len(buffer) >= 4 + _LENGTH.unpack_from(buffer)[0]
+        return self._buffer.find(_NEWLINE, self._scanned) >= 0
+
+
+class MessageReader:
+    """Reads newline-delimited JSON messages from a blocking socket using reusable buffers"""
+
+    def __init__(self, sock, buffer_size: int = DEFAULT_BUFFER_SIZE, max_message_size: int = MAX_MESSAGE_SIZE):
+        self.sock = sock
+        self.decoder = FrameDecoder(max_message_size)
+        self._chunk = bytearray(buffer_size)
+        self._view = memoryview(self._chunk)
+
+    @property
+    def encoding(self) -> str:
+        """Encoding of incoming frames; switched after a successful hello"""
+        return self.decoder.encoding
+
+    @encoding.setter
+    def encoding(self, encoding: str):
+        self.decoder.encoding = encoding
+
+    def has_pending(self) -> bool:
+        """Return True if a complete message is already buffered"""
+        return self.decoder.has_pending()
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        """
+        Block until the next message is available and return it decoded.
+        Returns None when the peer closes the connection. A malformed frame
+        raises json.JSONDecodeError after it has been consumed, so the next
+        call continues with the following message.
+        """
+        while True:
+            message = self.decoder.next_message()
+            if message is not None:
+                return message
+
+            received = self.sock.recv_into(self._view)
+            if not received:
+                return None
+            self.decoder.feed(self._view[:received])
+
+
+class AsyncMessageReader:
+    """Reads newline-delimited JSON messages from an asyncio StreamReader"""
+
+    def __init__(self, reader, buffer_size: int = DEFAULT_BUFFER_SIZE, max_message_size: int = MAX_MESSAGE_SIZE):
+        self.reader = reader
+        self.buffer_size = buffer_size
+        self.decoder = FrameDecoder(max_message_size)
+
+    @property
+    def encoding(self) -> str:
+        """Encoding of incoming frames; switched after a successful hello"""
+        return self.decoder.encoding
+
+    @encoding.setter
+    def encoding(self, encoding: str):
+        self.decoder.encoding = encoding
+
+    def has_pending(self) -> bool:
+        """Return True if a complete message is already buffered"""
+        return self.decoder.has_pending()
+
+    async def read(self) -> Optional[Dict[str, Any]]:
+        """Wait for the next message; same contract as MessageReader.read"""
+        while True:
+            message = self.decoder.next_message()
+            if message is not None:
+                return message
+
+            data = await self.reader.read(self.buffer_size)
+            if not data:
+                return None
+            self.decoder.feed(data)
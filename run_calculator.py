@@ -5,6 +5,8 @@ Scientific Calculator System Launcher
 This script helps you start the calculator system components easily.
 """
 
+import argparse
+import importlib.util
 import subprocess
 import sys
 import time
@@ -13,6 +15,9 @@ import webbrowser
 import os
 from pathlib import Path
 
+# How long to wait for a component to start listening
+STARTUP_TIMEOUT = 10.0
+
 def print_banner():
     """Print system banner"""
     print("=" * 60)
@@ -21,51 +26,70 @@ def print_banner():
     print()
 
 def check_dependencies():
-    """Check if websockets is available"""
-    try:
-        import websockets
+    """Check if websockets is installed, without importing it until a bridge is started"""
+    if importlib.util.find_spec("websockets") is not None:
         print("websockets library found")
         return True
-    except ImportError:
+    else:
         print("Warning: 'websockets' package not found.")
         print("Install it with: pip install websockets")
         print("(Required for web interface)")
         print()
         return False
 
-def start_server():
-    """Start the calculator server"""
+def start_server(server=None, path=None):
+    """Start the calculator server, or run the given one; `path` is a Unix socket to listen on"""
     print("Starting Calculator Server...")
     try:
-        from server import CalculatorServer
-        server = CalculatorServer()
+        if server is None:
+            from server import CalculatorServer
+            server = CalculatorServer(path=path)
         server.start()
     except KeyboardInterrupt:
         print("\n Calculator server stopped")
     except Exception as e:
         print(f"Error starting server: {e}")
 
-def start_bridge():
-    """Start the WebSocket bridge"""
+def start_sharded_server(path=None):
+    """Start one calculator server process per core on the same port or Unix socket"""
+    print("Starting Calculator Server on every core...")
+    try:
+        from server import CalculatorServer
+        CalculatorServer.start_workers(path=path)
+    except Exception as e:
+        print(f"Error starting server: {e}")
+
+def make_bridge(kind="simple", path=None):
+    """Create the WebSocket bridge of the given kind; `path` is the server's Unix socket"""
+    if kind == "websocket":
+        from websocket_bridge import WebSocketToSocketBridge
+        return WebSocketToSocketBridge(socket_path=path)
+    from simple_bridge import SimpleWebSocketBridge
+    return SimpleWebSocketBridge(socket_path=path)
+
+def start_bridge(bridge=None, path=None, kind="simple"):
+    """Start the WebSocket bridge, or run the given one; `path` is the server's Unix socket"""
     print("Starting WebSocket Bridge...")
     try:
-        from simple_bridge import SimpleWebSocketBridge
-        bridge = SimpleWebSocketBridge()
+        if bridge is None:
+            bridge = make_bridge(kind, path)
+        from bridge_logging import configure_logging
+        configure_logging()
         bridge.run()
     except ImportError:
-        print("Error: simple_bridge.py not found")
-        print("Make sure simple_bridge.py is in the current directory")
+        print(f"Error: {kind}_bridge.py not found")
+        print(f"Make sure {kind}_bridge.py is in the current directory")
     except KeyboardInterrupt:
         print("\n WebSocket bridge stopped")
     except Exception as e:
         print(f"Error starting bridge: {e}")
 
 def start_cli_client():
-    """Start the CLI client"""
+    """Start the CLI client on an in-process calculator"""
     print("Starting CLI Client...")
     try:
-        from client import CalculatorCLI
-        cli = CalculatorCLI()
+        from client import CalculatorCLI, LocalCalculatorClient
+        cli = CalculatorCLI(LocalCalculatorClient())
         cli.start()
     except KeyboardInterrupt:
         print("\n CLI client stopped")
@@ -90,7 +114,7 @@ def show_menu():
     print("   - Opens calculator in browser")
     print()
     print("2. CLI Interface")
-    print("   - Starts server + command-line client")
+    print("   - Command-line client with the calculator in-process")
     print()
     print("3. Server Only")
     print("   - Just starts the calculation server")
@@ -101,6 +125,9 @@ def show_menu():
     print()
     print("5. Help & Information")
     print()
+    print("6. Multi-Process Server")
+    print("   - One server process per core, all on port 8888")
+    print()
     print("0. Exit")
     print()
 
@@ -131,6 +158,13 @@ def show_help():
 
 def main():
     """Main launcher function"""
+    parser = argparse.ArgumentParser(description="Scientific calculator system launcher")
+    parser.add_argument("--unix-socket", metavar="PATH", default=None,
+                        help="connect the server and bridge over this Unix domain socket instead of TCP")
+    parser.add_argument("--bridge", choices=["simple", "websocket"], default="simple",
+                        help="which WebSocket bridge to start")
+    args = parser.parse_args()
+    
     print_banner()
     
     has_websockets = check_dependencies()
@@ -139,7 +173,7 @@ def main():
         show_menu()
         
         try:
-            choice = input("Enter your choice (0-5): ").strip()
+            choice = input("Enter your choice (0-6): ").strip()
         except KeyboardInterrupt:
             print("\n Goodbye!")
             sys.exit(0)
@@ -157,17 +191,26 @@ def main():
             print("   Press Ctrl+C to stop all components")
             print()
             
-            server_thread = threading.Thread(target=start_server, daemon=True)
+            from server import CalculatorServer
+            server = CalculatorServer(path=args.unix_socket)
+            server_thread = threading.Thread(target=start_server, args=(server,), daemon=True)
             server_thread.start()
             
             print("Waiting for server to start...")
-            time.sleep(2)
+            if not server.wait_until_ready(STARTUP_TIMEOUT):
+                print("Calculator server did not start")
+                continue
             
-            bridge_thread = threading.Thread(target=start_bridge, daemon=True)
+            bridge = make_bridge(args.bridge, args.unix_socket)
+            bridge_thread = threading.Thread(target=start_bridge, args=(bridge,), daemon=True)
             bridge_thread.start()
             
             print("Waiting for bridge to start...")
-            time.sleep(2)
+            if not bridge.wait_until_ready(STARTUP_TIMEOUT):
+                print("WebSocket bridge did not start")
+                server.stop()
+                server_thread.join(STARTUP_TIMEOUT)
+                continue
             
             open_web_interface()
             
@@ -181,21 +224,28 @@ def main():
                 
         elif choice == "2":
             print("Starting CLI System...")
-            print("   This will start server and CLI client")
+            print("   The calculator runs in this process; no server is needed")
             print("   Press Ctrl+C to stop")
             print()
             
-            server_thread = threading.Thread(target=start_server, daemon=True)
-            server_thread.start()
-            
-            print("Waiting for server to start...")
-            time.sleep(2)
-            
             start_cli_client()
             
         elif choice == "3":
             print("Starting Server Only...")
-            start_server()
+            from server import CalculatorServer
+            server = CalculatorServer(path=args.unix_socket)
+            server_thread = threading.Thread(target=start_server, args=(server,), daemon=True)
+            server_thread.start()
+            
+            if server.wait_until_ready(STARTUP_TIMEOUT):
+                try:
+                    while server_thread.is_alive():
+                        server_thread.join(1)
+                except KeyboardInterrupt:
+                    print("\n Calculator server stopped")
+            # Release the port before returning to the menu, so it can be chosen again
+            server.stop()
+            server_thread.join(STARTUP_TIMEOUT)
             
         elif choice == "4":
             if not has_websockets:
@@ -203,12 +253,16 @@ def main():
                 continue
             print("Starting Bridge Only...")
             print("   Make sure the calculator server is running!")
-            start_bridge()
+            start_bridge(path=args.unix_socket, kind=args.bridge)
             
         elif choice == "5":
             show_help()
             input("\nPress Enter to continue...")
             
+        elif choice == "6":
+            print("Starting Multi-Process Server...")
+            start_sharded_server(args.unix_socket)
+            
         else:
             print("Invalid choice. Please try again.")
         
@@ -1,75 +1,374 @@
 import socket
+import errno
 import json
-import math
+import os
+import stat
+import argparse
+import asyncio
 import threading
-from typing import Dict, Any
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List
+
+from engine import ProcessPoolEngine, is_expensive
+from expression import FUNCTIONS, Expression
+from intmath import digit_count, format_integer, is_huge
+from linalg import format_array, pack_array, uses_arrays, evaluate as evaluate_matrix
+from metrics import Metrics, start_http_server
+from precision import MODES, check_precision, format_exact, parse_number, to_number, evaluate as evaluate_precise
+from protocol import ENCODINGS, AsyncMessageReader, MessageReader, ProtocolError, encode_message
+from quadrature import DEFAULT_ABS_TOLERANCE, DEFAULT_MAX_EVALUATIONS, DEFAULT_REL_TOLERANCE, integrate
+from sessions import (DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_SESSIONS, UNKNOWN_SESSION, SessionStore,
+                      UnknownSessionError)
+from solver import DEFAULT_MAX_ITERATIONS, DEFAULT_TOLERANCE, solve
+from supervisor import SessionRouter, Supervisor
+from vectorized import DEFAULT_CHUNK_SIZE, evaluate_batch, tabulate
+
+# Most expressions accepted by one calculate_bulk request
+MAX_BULK_EXPRESSIONS = 10000
+# Longer expressions are compiled but not cached, so the cache's memory stays bounded
+MAX_CACHED_LENGTH = 4096
+
+class ExpressionCache:
+    """Thread-safe LRU cache of normalized expression -> parsed Expression"""
+    
+    def __init__(self, maxsize: int = 1024, max_length: int = MAX_CACHED_LENGTH):
+        self.maxsize = maxsize
+        self.max_length = max_length
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncached = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def compile(self, expression: str) -> Expression:
+        """Return the parsed expression, parsing and compiling it on a miss"""
+        key = expression.strip()
+        if len(key) > self.max_length:
+            with self._lock:
+                self.uncached += 1
+            return Expression(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        
+        entry = Expression(key)
+        
+        if self.maxsize <= 0:
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+    
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "uncached": self.uncached
+            }
 
 class ScientificCalculator:
     """Scientific calculator with comprehensive mathematical operations"""
     
-    def __init__(self):
+    def __init__(self, cache: ExpressionCache = None, engine: ProcessPoolEngine = None, metrics: Metrics = None):
         self.memory = 0
         self.last_result = 0
+        self.cache = cache if cache is not None else ExpressionCache()
+        self.engine = engine
+        self.metrics = metrics
         
-    def calculate(self, expression: str) -> Dict[str, Any]:
-        """
-        Evaluate mathematical expression and return result
-        """
-        try:
-            safe_dict = {
-                "__builtins__": {},
-                "sin": math.sin,
-                "cos": math.cos,
-                "tan": math.tan,
-                "asin": math.asin,
-                "acos": math.acos,
-                "atan": math.atan,
-                "sinh": math.sinh,
-                "cosh": math.cosh,
-                "tanh": math.tanh,
-                "log": math.log10,
-                "ln": math.log,
-                "log10": math.log10,
-                "log2": math.log2,
-                "sqrt": math.sqrt,
-                "exp": math.exp,
-                "pow": pow,
-                "abs": abs,
-                "floor": math.floor,
-                "ceil": math.ceil,
-                "round": round,
-                "pi": math.pi,
-                "e": math.e,
-                "factorial": math.factorial,
-                "degrees": math.degrees,
-                "radians": math.radians,
-                "gcd": math.gcd,
-                "lcm": math.lcm if hasattr(math, 'lcm') else lambda a, b: abs(a * b) // math.gcd(a, b)
-            }
+    def calculate(self, expression: str, compact: bool = False, mode: str = 'float',
+                  precision: int = None, full: bool = False) -> Dict[str, Any]:
+        """
+        Evaluate mathematical expression and return result.
+        A compact response carries only the result, without the echoed
+        expression and formatted text. mode='decimal' evaluates to `precision`
+        significant digits and mode='fraction' exactly; their results are
+        strings so no digits are lost in transit. Integers too long for a
+        JSON number come back as scientific notation text, or with all their
+        digits if `full` is set.
+        """
+        if mode != 'float':
+            if mode not in MODES:
+                return {"success": False, "error": f"Unknown mode {mode!r}; expected one of {', '.join(MODES)}"}
+            try:
+                precision = check_precision(precision) if mode == 'decimal' else None
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+        
+        started = time.perf_counter()
+        try:
+            compiled = self.cache.compile(expression)
+            parsed = time.perf_counter()
+            
+            if uses_arrays(compiled.tree):
+                if mode != 'float':
+                    raise ValueError("Vectors and matrices are only supported in float mode")
+                return self._matrix_response(compiled, None, compact)
             
-            expression = expression.replace('^', '**') 
-            expression = expression.replace('π', str(math.pi))
-            expression = expression.replace('e', str(math.e))
+            if self.engine is not None and is_expensive(compiled.tree):
+                response = self.engine.evaluate(compiled.source, mode=mode, precision=precision, full=full)
+                if response.get("success"):
+                    self.last_result = response.pop("value", response["result"])
+                    if compact:
+                        for key in ("expression", "formatted_result", "mode", "precision"):
+                            response.pop(key, None)
+                if self.metrics is not None:
+                    if not response.get("success"):
+                        self.metrics.record_error("EngineError")
+                    self.metrics.record_phases(_function_label(compiled.function), (
+                        ("parse", parsed - started), ("engine", time.perf_counter() - parsed)))
+                return response
             
-            result = eval(expression, safe_dict)
+            if mode == 'float':
+                result = compiled.evaluate()
+                self.last_result = result
+                if isinstance(result, int) and (full or is_huge(result)):
+                    digits = digit_count(result)
+                    result = format_integer(result, full)
+            else:
+                exact = evaluate_precise(compiled, mode, precision)
+                self.last_result = to_number(exact)
+            evaluated = time.perf_counter()
+            
+            if mode != 'float':
+                result = format_exact(exact, precision)
+                response = {"success": True, "result": result}
+                if not compact:
+                    response.update(expression=compiled.source, formatted_result=result, mode=mode)
+                    if precision is not None:
+                        response["precision"] = precision
+            elif compact:
+                response = {"success": True, "result": result}
+            else:
+                response = {
+                    "success": True,
+                    "result": result,
+                    "expression": compiled.source,
+                    "formatted_result": self._format_result(result)
+                }
+                if isinstance(result, str):
+                    response["digits"] = digits
+            if self.metrics is not None:
+                self.metrics.record_phases(_function_label(compiled.function), (
+                    ("parse", parsed - started), ("evaluate", evaluated - parsed),
+                    ("format", time.perf_counter() - evaluated)))
+            return response
+            
+        except ZeroDivisionError as e:
+            self._record_error(e)
+            return {"success": False, "error": "Division by zero"}
+        except ValueError as e:
+            self._record_error(e)
+            return {"success": False, "error": f"Math error: {str(e)}"}
+        except SyntaxError as e:
+            self._record_error(e)
+            return {"success": False, "error": "Invalid expression"}
+        except Exception as e:
+            self._record_error(e)
+            return {"success": False, "error": f"Error: {str(e)}"}
+    
+    def calculate_bulk(self, expressions: List[str], compact: bool = True, mode: str = 'float',
+                       precision: int = None) -> Dict[str, Any]:
+        """
+        Evaluate many independent expressions in one request. Each entry of
+        "results" is the response calculate() gives for that expression.
+        """
+        if not isinstance(expressions, list) or not all(isinstance(e, str) for e in expressions):
+            return {"success": False, "error": "Expressions must be a list of strings"}
+        if len(expressions) > MAX_BULK_EXPRESSIONS:
+            return {"success": False,
+                    "error": f"Too many expressions: {len(expressions)} (maximum {MAX_BULK_EXPRESSIONS})"}
+        results = [self.calculate(expression, compact, mode, precision) for expression in expressions]
+        return {
+            "success": True,
+            "count": len(results),
+            "errors": sum(1 for result in results if not result.get("success")),
+            "results": results
+        }
+    
+    def matrix(self, expression: str, variables: Dict[str, Any] = None, compact: bool = False) -> Dict[str, Any]:
+        """
+        Evaluate an expression over vectors and matrices. Variables may be
+        numbers, nested lists or packed arrays; array results are packed.
+        """
+        try:
+            if variables is not None and not isinstance(variables, dict):
+                return {"success": False, "error": "Variables must be an object of name -> value"}
+            return self._matrix_response(self.cache.compile(expression), variables, compact)
+            
+        except ZeroDivisionError as e:
+            self._record_error(e)
+            return {"success": False, "error": "Division by zero"}
+        except ValueError as e:
+            self._record_error(e)
+            return {"success": False, "error": f"Math error: {str(e)}"}
+        except SyntaxError as e:
+            self._record_error(e)
+            return {"success": False, "error": "Invalid expression"}
+        except Exception as e:
+            self._record_error(e)
+            return {"success": False, "error": f"Error: {str(e)}"}
+    
+    def _matrix_response(self, compiled: Expression, variables: Dict[str, Any], compact: bool) -> Dict[str, Any]:
+        """Evaluate with NumPy arrays; scalar results are also kept as the last result"""
+        result = evaluate_matrix(compiled, variables)
+        if isinstance(result, float):
             self.last_result = result
+            response = {"success": True, "result": result}
+            formatted = self._format_result(result)
+        else:
+            response = {"success": True, "result": pack_array(result), "shape": list(result.shape)}
+            formatted = format_array(result)
+        if not compact:
+            response.update(expression=compiled.source, formatted_result=formatted)
+        return response
+    
+    def calculate_batch(self, expression: str, variables: Dict[str, Any], compact: bool = False) -> Dict[str, Any]:
+        """
+        Evaluate one expression over columns of variable values
+        """
+        try:
+            if not isinstance(variables, dict):
+                return {"success": False, "error": "Variables must be an object of name -> values"}
+            compiled = self.cache.compile(expression)
+            results = evaluate_batch(compiled, variables)
             
+            if compact:
+                return {"success": True, "count": len(results), "results": results}
             return {
                 "success": True,
-                "result": result,
-                "expression": expression,
-                "formatted_result": self._format_result(result)
+                "expression": compiled.source,
+                "count": len(results),
+                "errors": sum(1 for value in results if value is None),
+                "results": results
             }
             
-        except ZeroDivisionError:
+        except ZeroDivisionError as e:
+            self._record_error(e)
+            return {"success": False, "error": "Division by zero"}
+        except ValueError as e:
+            self._record_error(e)
+            return {"success": False, "error": f"Math error: {str(e)}"}
+        except SyntaxError as e:
+            self._record_error(e)
+            return {"success": False, "error": "Invalid expression"}
+        except Exception as e:
+            self._record_error(e)
+            return {"success": False, "error": f"Error: {str(e)}"}
+    
+    def solve(self, expression: str, variable: str = None, bracket: List[float] = None, start: float = None,
+              starts: List[float] = None, tolerance: float = DEFAULT_TOLERANCE,
+              max_iterations: int = DEFAULT_MAX_ITERATIONS) -> Dict[str, Any]:
+        """
+        Find a root of an expression in one variable, within a bracket or
+        from one or many starting points
+        """
+        try:
+            compiled = self.cache.compile(expression)
+            response = {"success": True, "expression": compiled.source}
+            response.update(solve(compiled, variable, bracket, start, starts, tolerance, max_iterations))
+            return response
+            
+        except ZeroDivisionError as e:
+            self._record_error(e)
+            return {"success": False, "error": "Division by zero"}
+        except ValueError as e:
+            self._record_error(e)
+            return {"success": False, "error": f"Math error: {str(e)}"}
+        except SyntaxError as e:
+            self._record_error(e)
+            return {"success": False, "error": "Invalid expression"}
+        except Exception as e:
+            self._record_error(e)
+            return {"success": False, "error": f"Error: {str(e)}"}
+    
+    def integrate(self, expression: str, lower: float, upper: float, variable: str = None,
+                  abs_tolerance: float = DEFAULT_ABS_TOLERANCE, rel_tolerance: float = DEFAULT_REL_TOLERANCE,
+                  max_evaluations: int = DEFAULT_MAX_EVALUATIONS) -> Dict[str, Any]:
+        """Integrate an expression in one variable over [lower, upper]"""
+        try:
+            compiled = self.cache.compile(expression)
+            response = {"success": True, "expression": compiled.source}
+            response.update(integrate(compiled, lower, upper, variable, abs_tolerance, rel_tolerance,
+                                      max_evaluations))
+            return response
+            
+        except ZeroDivisionError as e:
+            self._record_error(e)
             return {"success": False, "error": "Division by zero"}
         except ValueError as e:
+            self._record_error(e)
             return {"success": False, "error": f"Math error: {str(e)}"}
-        except SyntaxError:
+        except SyntaxError as e:
+            self._record_error(e)
             return {"success": False, "error": "Invalid expression"}
         except Exception as e:
+            self._record_error(e)
             return {"success": False, "error": f"Error: {str(e)}"}
     
+    def tabulate(self, expression: str, variable: str, start: float, stop: float, step: float,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, include_x: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Stream an expression evaluated over a range as a sequence of response chunks.
+        The last message has "done" set; errors end the stream early.
+        """
+        count = 0
+        try:
+            compiled = self.cache.compile(expression)
+            for first, xs, results in tabulate(compiled, variable, float(start), float(stop), float(step), chunk_size):
+                chunk = {
+                    "success": True,
+                    "command": "tabulate",
+                    "done": False,
+                    "index": first,
+                    "results": results
+                }
+                if include_x:
+                    chunk["x"] = xs
+                count += len(results)
+                yield chunk
+            
+            yield {"success": True, "command": "tabulate", "done": True, "count": count}
+            
+        except ZeroDivisionError as e:
+            self._record_error(e)
+            yield {"success": False, "command": "tabulate", "done": True, "error": "Division by zero"}
+        except ValueError as e:
+            self._record_error(e)
+            yield {"success": False, "command": "tabulate", "done": True, "error": f"Math error: {str(e)}"}
+        except SyntaxError as e:
+            self._record_error(e)
+            yield {"success": False, "command": "tabulate", "done": True, "error": "Invalid expression"}
+        except Exception as e:
+            self._record_error(e)
+            yield {"success": False, "command": "tabulate", "done": True, "error": f"Error: {str(e)}"}
+    
+    def _record_error(self, error: Exception):
+        """Count a calculation error by exception type"""
+        if self.metrics is not None:
+            self.metrics.record_error(type(error).__name__)
+    
     def _format_result(self, result) -> str:
         """Format result for display"""
         if isinstance(result, float):
@@ -79,22 +378,36 @@ class ScientificCalculator:
                 return f"{result:.6e}"
             else:
                 return f"{result:.10f}".rstrip('0').rstrip('.')
+        if isinstance(result, int):
+            return format_integer(result)
         return str(result)
     
+    def _memory_value(self):
+        """Memory contents for a response; huge ints become text, as in calculate()"""
+        if isinstance(self.memory, int) and is_huge(self.memory):
+            return format_integer(self.memory)
+        return self.memory
+    
     def memory_operation(self, operation: str, value: float = None) -> Dict[str, Any]:
-        """Handle memory operations"""
+        """
+        Handle memory operations. Memory only ever holds a number: a value may
+        also be given as result text from any mode, e.g. '1/3' or the
+        scientific notation of a huge integer, and is converted first.
+        """
         try:
+            if operation in ("store", "add"):
+                value = self.last_result if value is None else parse_number(value)
             if operation == "store":
-                self.memory = value if value is not None else self.last_result
-                return {"success": True, "memory": self.memory, "operation": "stored"}
+                self.memory = value
+                return {"success": True, "memory": self._memory_value(), "operation": "stored"}
             elif operation == "recall":
-                return {"success": True, "memory": self.memory, "operation": "recalled"}
+                return {"success": True, "memory": self._memory_value(), "operation": "recalled"}
             elif operation == "clear":
                 self.memory = 0
-                return {"success": True, "memory": self.memory, "operation": "cleared"}
+                return {"success": True, "memory": self._memory_value(), "operation": "cleared"}
             elif operation == "add":
-                self.memory += value if value is not None else self.last_result
-                return {"success": True, "memory": self.memory, "operation": "added"}
+                self.memory += value
+                return {"success": True, "memory": self._memory_value(), "operation": "added"}
             else:
                 return {"success": False, "error": "Invalid memory operation"}
         except Exception as e:
@@ -103,73 +416,352 @@ class ScientificCalculator:
 class CalculatorServer:
     """Socket server for scientific calculator"""
     
-    def __init__(self, host='localhost', port=8888):
+    def __init__(self, host='localhost', port=8888, cache_size=1024, backlog=128,
+                 process_workers=None, task_timeout=10.0,
+                 session_timeout=DEFAULT_IDLE_TIMEOUT, max_sessions=DEFAULT_MAX_SESSIONS,
+                 metrics_port=None, reuse_port=False, path=None, shard=None, peers=None):
         self.host = host
         self.port = port
-        self.calculator = ScientificCalculator()
+        # Listen on this Unix domain socket instead of the TCP port
+        self.path = path
+        self.backlog = backlog
+        # Set SO_REUSEPORT so several server processes can share the port
+        self.reuse_port = reuse_port
+        # Totals over all workers, kept up to date by a supervisor
+        self.cluster_stats = None
+        self.metrics = Metrics()
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.cache = ExpressionCache(cache_size)
+        # process_workers=None keeps all evaluation in-process; 0 sizes the pool to the core count
+        self.engine = None
+        if process_workers is not None:
+            self.engine = ProcessPoolEngine(process_workers or None, timeout=task_timeout)
+        # As one of several workers: this worker's index and every worker's private socket
+        self.router = SessionRouter(peers, shard) if peers else None
+        self.sessions = SessionStore(self.new_calculator, session_timeout, max_sessions,
+                                     self.router.prefix if self.router is not None else '')
         self.running = False
+        # Set once the server is listening, or once starting it has failed
+        self.ready = threading.Event()
+        # Socket file this server created and removes when it stops
+        self._socket_file = None
+        # Listening sockets this server bound itself, which stop() shuts down
+        self._listeners = []
+    
+    @property
+    def endpoint(self) -> str:
+        """Where the server listens, for messages"""
+        return self.path if self.path is not None else f"{self.host}:{self.port}"
+    
+    def new_calculator(self) -> ScientificCalculator:
+        """Create calculator state for one session, sharing the cache and engine"""
+        return ScientificCalculator(self.cache, self.engine, self.metrics)
+    
+    def calculator_for(self, request: Dict[str, Any], session: str = None) -> ScientificCalculator:
+        """
+        Resolve the calculator for a request: an explicit "session" token wins,
+        then the connection's own session, else a throwaway calculator. An
+        explicit token must be one the server issued and has not dropped; the
+        connection's own session is simply recreated if it was dropped.
+        """
+        token = request.get('session')
+        if token is not None and str(token) != session:
+            calculator = self.sessions.get(str(token))
+            if calculator is None:
+                raise UnknownSessionError(token)
+            return calculator
+        if session is None:
+            return self.new_calculator()
+        return self.sessions.get(session, create=True)
         
+    def handle_request(self, request: Dict[str, Any], session: str = None) -> Dict[str, Any]:
+        """Dispatch a single non-streaming request and return its response"""
+        owner = self.router.owner(request) if self.router is not None else None
+        if owner is not None:
+            return next(self.router.forward(owner, request))
+        started = time.perf_counter()
+        command = request.get('command')
+        
+        try:
+            if command == 'calculate':
+                expression = request.get('expression', '')
+                response = self.calculator_for(request, session).calculate(
+                    expression, request.get('compact', False), request.get('mode', 'float'), request.get('precision'),
+                    request.get('full', False))
+            elif command == 'calculate_batch':
+                expression = request.get('expression', '')
+                variables = request.get('variables', {})
+                response = self.calculator_for(request, session).calculate_batch(
+                    expression, variables, request.get('compact', False))
+            elif command == 'calculate_bulk':
+                response = self.calculator_for(request, session).calculate_bulk(
+                    request.get('expressions'), request.get('compact', True), request.get('mode', 'float'),
+                    request.get('precision'))
+            elif command == 'matrix':
+                response = self.calculator_for(request, session).matrix(
+                    request.get('expression', ''), request.get('variables'), request.get('compact', False))
+            elif command == 'solve':
+                response = self.calculator_for(request, session).solve(
+                    request.get('expression', ''), request.get('variable'), request.get('bracket'),
+                    request.get('start'), request.get('starts'), request.get('tolerance', DEFAULT_TOLERANCE),
+                    request.get('max_iterations', DEFAULT_MAX_ITERATIONS))
+            elif command == 'integrate':
+                response = self.calculator_for(request, session).integrate(
+                    request.get('expression', ''), request.get('lower'), request.get('upper'), request.get('variable'),
+                    request.get('abs_tolerance', DEFAULT_ABS_TOLERANCE), request.get('rel_tolerance', DEFAULT_REL_TOLERANCE),
+                    request.get('max_evaluations', DEFAULT_MAX_EVALUATIONS))
+            elif command == 'memory':
+                operation = request.get('operation')
+                value = request.get('value')
+                response = self.calculator_for(request, session).memory_operation(operation, value)
+            elif command == 'session':
+                response = {"success": True, "session": self.sessions.create()}
+            elif command == 'ping':
+                response = {"success": True, "message": "Server is running"}
+            elif command == 'stats':
+                response = {"success": True, "stats": self.stats()}
+            else:
+                # Keep metric labels bounded whatever clients send
+                command = 'unknown'
+                response = {"success": False, "error": "Unknown command"}
+        except UnknownSessionError:
+            response = {"success": False, "error": UNKNOWN_SESSION}
+        
+        if 'id' in request:
+            response['id'] = request['id']
+        self.metrics.record_request(command, time.perf_counter() - started, response.get("success", False))
+        return response
+    
+    def stats(self) -> Dict[str, Any]:
+        """Metrics snapshot together with cache, session and engine counters"""
+        stats = self.metrics.snapshot()
+        stats["cache"] = self.cache.stats()
+        stats["sessions"] = self.sessions.stats()
+        if self.engine is not None:
+            stats["engine"] = self.engine.stats()
+        if self.cluster_stats is not None:
+            stats["cluster"] = self.cluster_stats
+        return stats
+    
+    @classmethod
+    def start_workers(cls, workers: int = None, **options):
+        """
+        Serve from `workers` processes sharing one port or Unix socket path
+        (default: one per core), under a supervisor that restarts them and
+        sums their stats
+        """
+        metrics_port = options.pop("metrics_port", None)
+        Supervisor(cls, options, workers, metrics_port).run()
+    
+    @staticmethod
+    def listen_unix(path: str, backlog: int) -> socket.socket:
+        """
+        A listening Unix domain socket at `path`. A socket file left behind by
+        a server that has exited is replaced; one in use by a live server is not.
+        """
+        if not hasattr(socket, 'AF_UNIX'):
+            raise OSError("Unix domain sockets are not supported on this platform")
+        try:
+            mode = os.stat(path).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(errno.EEXIST, f"{path} exists and is not a socket")
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)
+            else:
+                raise OSError(errno.EADDRINUSE, f"A server is already listening on {path}")
+            finally:
+                probe.close()
+        
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            listener.bind(path)
+            listener.listen(backlog)
+        except OSError:
+            listener.close()
+            raise
+        return listener
+    
+    def _listen(self) -> socket.socket:
+        """Bind the server's own listening socket: the Unix socket path if set, else the TCP port"""
+        if self.path is not None:
+            listener = self.listen_unix(self.path, self.backlog)
+            self._socket_file = self.path
+            return listener
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(self.backlog)
+        return listener
+    
+    def render_metrics(self) -> str:
+        """All metrics in the Prometheus text format"""
+        extra = {f"cache_{key}": value for key, value in self.cache.stats().items()}
+        extra.update((f"sessions_{key}", value) for key, value in self.sessions.stats().items())
+        if self.engine is not None:
+            extra.update((f"engine_{key}", value) for key, value in self.engine.stats().items())
+        return self.metrics.prometheus(extra)
+    
+    def start_metrics_endpoint(self):
+        """Serve Prometheus metrics over HTTP if a metrics port is configured"""
+        if self.metrics_port is not None and self.metrics_server is None:
+            self.metrics_server = start_http_server(self.render_metrics, self.host, self.metrics_port)
+            print(f"Metrics available at http://{self.host}:{self.metrics_port}/metrics")
+    
+    def close_resources(self):
+        """Release the process pool, metrics endpoint and socket file after the server stops"""
+        if self._socket_file is not None:
+            try:
+                os.unlink(self._socket_file)
+            except OSError:
+                pass
+            self._socket_file = None
+        if self.engine is not None:
+            self.engine.close()
+        if self.router is not None:
+            self.router.close()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+    
+    def negotiate(self, request: Dict[str, Any], reader) -> bytes:
+        """
+        Answer a hello request and switch the connection's encoding.
+        The reply is encoded in the old encoding; everything after it,
+        in both directions, uses the new one.
+        """
+        encoding = request.get('encoding', 'json')
+        if encoding in ENCODINGS:
+            response = {"success": True, "encoding": encoding, "encodings": list(ENCODINGS)}
+        else:
+            response = {"success": False, "error": f"Unsupported encoding: {encoding}", "encodings": list(ENCODINGS)}
+        if 'id' in request:
+            response['id'] = request['id']
+        data = encode_message(response, reader.encoding)
+        if response['success']:
+            reader.encoding = encoding
+        return data
+    
     def handle_client(self, client_socket, address):
         """Handle individual client connections"""
         print(f"Connection from {address}")
+        reader = MessageReader(client_socket)
+        session = self.sessions.create()
+        pending = []
+        self.metrics.connection_opened()
         
         try:
             while self.running:
-                data = client_socket.recv(1024).decode('utf-8')
-                if not data:
-                    break
-                
                 try:
-                    request = json.loads(data)
-                    command = request.get('command')
+                    request = reader.read()
+                    if request is None:
+                        break
+                    if not isinstance(request, dict):
+                        raise json.JSONDecodeError("Expected a JSON object", "", 0)
                     
-                    if command == 'calculate':
-                        expression = request.get('expression', '')
-                        response = self.calculator.calculate(expression)
-                    elif command == 'memory':
-                        operation = request.get('operation')
-                        value = request.get('value')
-                        response = self.calculator.memory_operation(operation, value)
-                    elif command == 'ping':
-                        response = {"success": True, "message": "Server is running"}
+                    command = request.get('command')
+                    if command == 'tabulate':
+                        if pending:
+                            client_socket.sendall(b"".join(pending))
+                            pending.clear()
+                        self.stream_tabulate(client_socket, request, session, reader.encoding)
+                        continue
+                    if command == 'hello':
+                        pending.append(self.negotiate(request, reader))
                     else:
-                        response = {"success": False, "error": "Unknown command"}
-                    
-                    client_socket.send(json.dumps(response).encode('utf-8'))
+                        pending.append(encode_message(self.handle_request(request, session), reader.encoding))
                     
                 except json.JSONDecodeError:
-                    error_response = {"success": False, "error": "Invalid JSON format"}
-                    client_socket.send(json.dumps(error_response).encode('utf-8'))
+                    self.metrics.record_error("JSONDecodeError")
+                    pending.append(encode_message({"success": False, "error": "Invalid JSON format"}, reader.encoding))
+                except ProtocolError as e:
+                    self.metrics.record_error("ProtocolError")
+                    pending.append(encode_message({"success": False, "error": f"Protocol error: {str(e)}"}, reader.encoding))
+                    client_socket.sendall(b"".join(pending))
+                    break
                 except Exception as e:
-                    error_response = {"success": False, "error": f"Server error: {str(e)}"}
-                    client_socket.send(json.dumps(error_response).encode('utf-8'))
+                    pending.append(encode_message({"success": False, "error": f"Server error: {str(e)}"}, reader.encoding))
+                
+                # Pipelined requests already in the buffer are answered with one write
+                if pending and not reader.has_pending():
+                    client_socket.sendall(b"".join(pending))
+                    pending.clear()
                     
         except ConnectionResetError:
             print(f"Client {address} disconnected")
         except Exception as e:
             print(f"Error handling client {address}: {e}")
         finally:
+            self.metrics.connection_closed()
+            self.sessions.remove(session)
             client_socket.close()
             print(f"Connection with {address} closed")
     
-    def start(self):
-        """Start the calculator server"""
+    def tabulate_chunks(self, request: Dict[str, Any], session: str = None) -> Iterator[Dict[str, Any]]:
+        """The chunks of a tabulate request, produced lazily"""
+        owner = self.router.owner(request) if self.router is not None else None
+        if owner is not None:
+            return self.router.forward(owner, request)
         try:
-            server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server_socket.bind((self.host, self.port))
-            server_socket.listen(5)
+            calculator = self.calculator_for(request, session)
+        except UnknownSessionError:
+            return iter([{"success": False, "command": "tabulate", "done": True, "error": UNKNOWN_SESSION}])
+        return calculator.tabulate(
+            request.get('expression', ''),
+            request.get('variable', 'x'),
+            request.get('start', 0),
+            request.get('stop', 0),
+            request.get('step', 1),
+            request.get('chunk_size', DEFAULT_CHUNK_SIZE),
+            request.get('include_x', True)
+        )
+    
+    def stream_tabulate(self, client_socket, request: Dict[str, Any], session: str = None, encoding: str = 'json'):
+        """Send tabulate chunks as framed messages as they are produced"""
+        started = time.perf_counter()
+        chunks = self.tabulate_chunks(request, session)
+        for chunk in chunks:
+            if 'id' in request:
+                chunk['id'] = request['id']
+            client_socket.sendall(encode_message(chunk, encoding))
+        self.metrics.record_request('tabulate', time.perf_counter() - started, chunk.get("success", False))
+    
+    def start(self, sock: socket.socket = None):
+        """Start the calculator server, on an already listening socket if one is given"""
+        peer_socket = None
+        try:
+            server_socket = sock
+            if server_socket is None:
+                server_socket = self._listen()
+                # A socket handed in is shared with other workers, so stop() leaves it alone
+                self._listeners.append(server_socket)
+            if self.router is not None:
+                peer_socket = self.listen_unix(self.router.path, self.backlog)
+                self._listeners.append(peer_socket)
+            self.start_metrics_endpoint()
             
             self.running = True
-            print(f"Scientific Calculator Server started on {self.host}:{self.port}")
+            print(f"Scientific Calculator Server started on {self.endpoint}")
             print("Waiting for connections...")
+            if peer_socket is not None:
+                threading.Thread(target=self._accept_peers, args=(peer_socket,), daemon=True).start()
+            self.ready.set()
             
             while self.running:
                 try:
                     client_socket, address = server_socket.accept()
                     client_thread = threading.Thread(
                         target=self.handle_client,
-                        args=(client_socket, address)
+                        args=(client_socket, address or self.path)
                     )
                     client_thread.daemon = True
                     client_thread.start()
@@ -177,26 +769,308 @@ class CalculatorServer:
                     print("\nShutting down server...")
                     break
                 except Exception as e:
+                    if not self.running:
+                        break
                     print(f"Error accepting connection: {e}")
                     
         except Exception as e:
             print(f"Failed to start server: {e}")
         finally:
             self.running = False
+            self.ready.set()
             try:
                 server_socket.close()
             except:
                 pass
+            if peer_socket is not None:
+                peer_socket.close()
+            self.close_resources()
+            print("Server stopped")
+    
+    def _accept_peers(self, listener: socket.socket):
+        """Serve the requests other workers forward for sessions held here"""
+        while self.running:
+            try:
+                client_socket, _ = listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.handle_client, args=(client_socket, self.router.path), daemon=True).start()
+    
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """Block until the server is listening; False if it failed to start or timed out"""
+        return self.ready.wait(timeout) and self.running
+    
+    def stop(self):
+        """Stop the server, waking the accept loop so that start() returns and releases the port"""
+        self.running = False
+        listeners, self._listeners = self._listeners, []
+        for listener in listeners:
+            # Closing a socket does not wake a thread blocked in accept(), but shutting it down does
+            try:
+                listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+class AsyncCalculatorServer(CalculatorServer):
+    """
+    asyncio-based calculator server. Connections live on a single event loop
+    and evaluation runs on a bounded thread pool, so idle or slow clients only
+    cost a coroutine instead of a thread.
+    """
+    
+    def __init__(self, host='localhost', port=8888, cache_size=1024, backlog=4096,
+                 process_workers=None, task_timeout=10.0,
+                 session_timeout=DEFAULT_IDLE_TIMEOUT, max_sessions=DEFAULT_MAX_SESSIONS,
+                 metrics_port=None, max_workers=None, max_pending=None, reuse_port=False, path=None,
+                 shard=None, peers=None):
+        super().__init__(host, port, cache_size, backlog, process_workers, task_timeout,
+                         session_timeout, max_sessions, metrics_port, reuse_port, path, shard, peers)
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.max_pending = max_pending or self.max_workers * 4
+        self.executor = None
+        self._slots = None
+        self._loop = None
+        self._server = None
+        self._peer_server = None
+    
+    async def _run(self, func, *args):
+        """Run blocking work on the executor, applying backpressure when it is saturated"""
+        async with self._slots:
+            return await self._loop.run_in_executor(self.executor, func, *args)
+    
+    def _handle_batch(self, requests: List[Any], session: str) -> List[Dict[str, Any]]:
+        """Answer a run of pipelined requests in one executor call"""
+        responses = []
+        for request in requests:
+            if not isinstance(request, dict):
+                self.metrics.record_error("JSONDecodeError")
+                responses.append({"success": False, "error": "Invalid JSON format"})
+                continue
+            try:
+                responses.append(self.handle_request(request, session))
+            except Exception as e:
+                responses.append({"success": False, "error": f"Server error: {str(e)}"})
+        return responses
+    
+    async def _answer(self, writer, requests: List[Any], session: str, encoding: str = 'json'):
+        """Evaluate buffered requests in order, streaming tabulate requests as they come"""
+        run = []
+        for request in requests:
+            owner = self.router.owner(request) if self.router is not None and isinstance(request, dict) else None
+            if owner is not None or isinstance(request, dict) and request.get('command') == 'tabulate':
+                if run:
+                    for response in await self._run(self._handle_batch, run, session):
+                        writer.write(encode_message(response, encoding))
+                    run = []
+                if owner is not None:
+                    await self._forward(writer, request, owner, encoding)
+                else:
+                    await self.stream_tabulate_async(writer, request, session, encoding)
+            else:
+                run.append(request)
+        if run:
+            for response in await self._run(self._handle_batch, run, session):
+                writer.write(encode_message(response, encoding))
+    
+    async def handle_connection(self, reader, writer):
+        """Handle one client connection on the event loop"""
+        address = writer.get_extra_info('peername') or self.path
+        print(f"Connection from {address}")
+        messages = AsyncMessageReader(reader)
+        session = self.sessions.create()
+        self.metrics.connection_opened()
+        
+        try:
+            while self.running:
+                requests = []
+                try:
+                    request = await messages.read()
+                    if request is None:
+                        break
+                    requests.append(request)
+                    # Frames after a hello may use the new encoding, so stop there
+                    while messages.has_pending() and not _is_hello(requests[-1]):
+                        requests.append(messages.decoder.next_message())
+                except json.JSONDecodeError:
+                    requests.append(None)
+                except ProtocolError as e:
+                    self.metrics.record_error("ProtocolError")
+                    writer.write(encode_message({"success": False, "error": f"Protocol error: {str(e)}"}, messages.encoding))
+                    break
+                
+                hello = requests.pop() if _is_hello(requests[-1]) else None
+                await self._answer(writer, requests, session, messages.encoding)
+                if hello is not None:
+                    writer.write(self.negotiate(hello, messages))
+                await writer.drain()
+                
+        except asyncio.CancelledError:
+            pass
+        except ConnectionResetError:
+            print(f"Client {address} disconnected")
+        except Exception as e:
+            print(f"Error handling client {address}: {e}")
+        finally:
+            try:
+                await writer.drain()
+            except Exception:
+                pass
+            self.metrics.connection_closed()
+            self.sessions.remove(session)
+            writer.close()
+            print(f"Connection with {address} closed")
+    
+    async def _forward(self, writer, request: Dict[str, Any], owner: int, encoding: str = 'json'):
+        """
+        Relay a request to the worker holding its session. The wait runs on the
+        loop's default executor, not the evaluation threads, so two workers
+        forwarding to each other cannot use up each other's evaluation threads.
+        """
+        messages = self.router.forward(owner, request)
+        while True:
+            message = await self._loop.run_in_executor(None, next, messages, None)
+            if message is None:
+                return
+            writer.write(encode_message(message, encoding))
+            await writer.drain()
+    
+    async def stream_tabulate_async(self, writer, request: Dict[str, Any], session: str = None,
+                                    encoding: str = 'json'):
+        """Send tabulate chunks as they are produced, computing each chunk off the loop"""
+        started = time.perf_counter()
+        await writer.drain()
+        chunks = self.tabulate_chunks(request, session)
+        success = False
+        while True:
+            chunk = await self._run(next, chunks, None)
+            if chunk is None:
+                self.metrics.record_request('tabulate', time.perf_counter() - started, success)
+                return
+            success = chunk.get("success", False)
+            if 'id' in request:
+                chunk['id'] = request['id']
+            writer.write(encode_message(chunk, encoding))
+            await writer.drain()
+    
+    async def serve(self, sock: socket.socket = None):
+        """Accept connections until stop() is called"""
+        self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="calculator")
+        _raise_file_limit()
+        
+        if sock is None and self.path is not None:
+            sock = self._listen()
+        if sock is not None:
+            self._server = await asyncio.start_server(self.handle_connection, sock=sock, backlog=self.backlog)
+        else:
+            self._server = await asyncio.start_server(
+                self.handle_connection, self.host, self.port,
+                backlog=self.backlog, reuse_address=True, reuse_port=self.reuse_port or None
+            )
+        if self.router is not None:
+            self._peer_server = await asyncio.start_server(
+                self.handle_connection, sock=self.listen_unix(self.router.path, self.backlog))
+        self.start_metrics_endpoint()
+        self.running = True
+        print(f"Scientific Calculator Server (asyncio) started on {self.endpoint}")
+        print("Waiting for connections...")
+        self.ready.set()
+        
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.running = False
+            if self._peer_server is not None:
+                self._peer_server.close()
+            self.executor.shutdown(wait=False)
+    
+    def start(self, sock: socket.socket = None):
+        """Start the calculator server, on an already listening socket if one is given"""
+        try:
+            asyncio.run(self.serve(sock))
+        except KeyboardInterrupt:
+            print("\nShutting down server...")
+        except Exception as e:
+            print(f"Failed to start server: {e}")
+        finally:
+            self.running = False
+            self.ready.set()
+            self.close_resources()
             print("Server stopped")
     
     def stop(self):
         """Stop the server"""
         self.running = False
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
 
-if __name__ == "__main__":
-    server = CalculatorServer()
+def _function_label(name):
+    """Metrics label for a top-level function; names clients make up share one label"""
+    if name is None or name in FUNCTIONS:
+        return name
+    return "other"
+
+def _is_hello(request) -> bool:
+    """True for an encoding negotiation request"""
+    return isinstance(request, dict) and request.get('command') == 'hello'
+
+def _raise_file_limit():
+    """Raise the open-file soft limit to the hard limit so many sockets can stay open"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Scientific calculator socket server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--mode", choices=["threaded", "asyncio"], default="threaded",
+                        help="thread-per-connection or asyncio event loop server")
+    parser.add_argument("--backlog", type=int, default=None, help="listen backlog")
+    parser.add_argument("--workers", type=int, default=None, help="evaluation threads (asyncio mode)")
+    parser.add_argument("--processes", type=int, nargs="?", const=0, default=None,
+                        help="run heavy calculations in a process pool (default size: core count)")
+    parser.add_argument("--task-timeout", type=float, default=10.0, help="deadline for pooled calculations")
+    parser.add_argument("--session-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help="seconds before an idle session is dropped")
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS)
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics over HTTP on this port")
+    parser.add_argument("--shards", type=int, nargs="?", const=0, default=None,
+                        help="run this many server processes on the port (default: core count)")
+    parser.add_argument("--unix-socket", metavar="PATH", default=None,
+                        help="listen on this Unix domain socket instead of the TCP port")
+    args = parser.parse_args()
+    
+    options = dict(process_workers=args.processes, task_timeout=args.task_timeout,
+                   session_timeout=args.session_timeout, max_sessions=args.max_sessions,
+                   metrics_port=args.metrics_port, path=args.unix_socket)
+    if args.shards is not None:
+        server_class = AsyncCalculatorServer if args.mode == "asyncio" else CalculatorServer
+        if args.mode == "asyncio":
+            options["max_workers"] = args.workers
+        server_class.start_workers(args.shards or None, host=args.host, port=args.port,
+                                   backlog=args.backlog or (4096 if args.mode == "asyncio" else 128), **options)
+        return
+    if args.mode == "asyncio":
+        server = AsyncCalculatorServer(args.host, args.port, backlog=args.backlog or 4096,
+                                       max_workers=args.workers, **options)
+    else:
+        server = CalculatorServer(args.host, args.port, backlog=args.backlog or 128, **options)
     try:
         server.start()
     except KeyboardInterrupt:
         print("\nServer interrupted by user")
-        server.stop()
\ No newline at end of file
+        server.stop()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Session Store
+=============
+
+Per-session calculator state for the calculator server.
+
+Every connection gets its own session, and clients may name a session token
+in a request to share state across connections. Only tokens the store issued
+are accepted: an unknown or expired token is an error, not a new session, so
+no client can fill the store with tokens of its own and push other clients'
+live sessions out. Sessions are kept in LRU order and dropped after an
+idle timeout or when the store is full, so memory stays bounded no matter
+how many clients come and go.
+"""
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_IDLE_TIMEOUT = 1800.0
+DEFAULT_MAX_SESSIONS = 10000
+UNKNOWN_SESSION = "Unknown or expired session"
+
+
+class UnknownSessionError(LookupError):
+    """A request named a session token the store did not issue, or has dropped"""
+
+
+class Session:
+    """State owned by one session"""
+
+    __slots__ = ('token', 'calculator', 'last_used')
+
+    def __init__(self, token: str, calculator: Any):
+        self.token = token
+        self.calculator = calculator
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    """Thread-safe store of sessions with idle expiry and a size bound"""
+
+    def __init__(self, factory: Callable[[], Any], idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 max_sessions: int = DEFAULT_MAX_SESSIONS, prefix: str = ''):
+        self.factory = factory
+        # Start of every token issued, e.g. to tell which server process holds a session
+        self.prefix = prefix
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.expired = 0
+        self.evicted = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sweep(self, now: float):
+        """Drop idle and excess sessions; must be called with the lock held"""
+        sessions = self._sessions
+        while sessions:
+            token, oldest = next(iter(sessions.items()))
+            if now - oldest.last_used > self.idle_timeout:
+                del sessions[token]
+                self.expired += 1
+            elif len(sessions) > self.max_sessions:
+                del sessions[token]
+                self.evicted += 1
+            else:
+                break
+
+    def create(self) -> str:
+        """Create a session with a fresh random token and return the token"""
+        token = self.prefix + secrets.token_urlsafe(16)
+        self.get(token, create=True)
+        return token
+
+    def get(self, token: str, create: bool = False) -> Optional[Any]:
+        """
+        Return the calculator for a session, or None if the token is unknown or
+        expired. Only the server passes create=True, for tokens it issued.
+        """
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is not None and now - session.last_used <= self.idle_timeout:
+                session.last_used = now
+                self._sessions.move_to_end(token)
+                return session.calculator
+            if session is not None:
+                self.expired += 1
+            if not create:
+                return None
+            session = Session(token, self.factory())
+            self._sessions[token] = session
+            self._sessions.move_to_end(token)
+            self._sweep(now)
+            return session.calculator
+
+    def remove(self, token: str):
+        """Forget a session"""
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def expire(self) -> int:
+        """Drop idle sessions now and return how many remain"""
+        with self._lock:
+            self._sweep(time.monotonic())
+            return len(self._sessions)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return store counters"""
+        with self._lock:
+            return {
+                "active": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_timeout": self.idle_timeout,
+                "expired": self.expired,
+                "evicted": self.evicted
+            }
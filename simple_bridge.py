@@ -3,13 +3,19 @@ Simple WebSocket to Socket Bridge
 Compatible with various websockets library versions
 """
 
+import argparse
 import asyncio
-import socket
 import json
 import logging
-from typing import Dict, Any
+import threading
+import time
+from typing import Dict, Any, AsyncIterator
+
+from bridge_logging import DEFAULT_RING_SIZE, MessageLog, configure_logging
+from protocol import json_default
+
+from upstream import DEFAULT_POOL_SIZE, UpstreamPool, UpstreamSession
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 try:
@@ -23,83 +29,122 @@ except ImportError:
 class SimpleWebSocketBridge:
     """Simple WebSocket to Socket Bridge"""
     
-    def __init__(self, websocket_host='localhost', websocket_port=8080, socket_host='localhost', socket_port=8888):
+    def __init__(self, websocket_host='localhost', websocket_port=8080, socket_host='localhost', socket_port=8888,
+                 pool_size=DEFAULT_POOL_SIZE, upstream_encoding='json', log_sample_rate=1.0,
+                 recent_size=DEFAULT_RING_SIZE, socket_path=None, debug=False):
         self.websocket_host = websocket_host
         self.websocket_port = websocket_port
         self.socket_host = socket_host
         self.socket_port = socket_port
+        # Unix domain socket of a calculator server on the same host, used instead of TCP
+        self.socket_path = socket_path
+        self.upstream = UpstreamPool(socket_host, socket_port, size=pool_size, encoding=upstream_encoding,
+                                     path=socket_path)
         self.clients = set()
+        self.running = False
+        self.message_log = MessageLog(logger, sample_rate=log_sample_rate, ring_size=recent_size,
+                                      keep_recent=debug)
+        # Answer bridge_stats with recent requests; off by default, as they include other browsers' traffic
+        self.debug = debug
+        # Set once the bridge is listening, or once starting it has failed
+        self.ready = threading.Event()
         
     async def handle_client(self, websocket, path=None):
         """Handle WebSocket client connections"""
         self.clients.add(websocket)
+        # Upstream connections are shared, so each browser gets its own calculator session
+        session = UpstreamSession(self.upstream)
         
         try:
             client_address = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
-            logger.info(f"Client connected: {client_address}")
+            logger.info("Client connected: %s", client_address)
             
             welcome = {"success": True, "message": "Connected to calculator", "type": "connection"}
             await websocket.send(json.dumps(welcome))
             
             async for message in websocket:
+                started = time.perf_counter()
+                sampled = self.message_log.sample()
                 try:
-                    logger.info(f"Received: {message}")
+                    if sampled:
+                        self.message_log.log("Received: %s", message)
                     request = json.loads(message)
+                    if self.debug and request.get("command") == "bridge_stats":
+                        await websocket.send(json.dumps(self.bridge_stats(request.get("limit")), default=json_default))
+                        continue
+                    await session.attach(request)
+                    
+                    if request.get("command") == "tabulate":
+                        async for chunk in self.stream_from_socket_server(request):
+                            await websocket.send(json.dumps(chunk, default=json_default))
+                        session.forgotten(request, chunk)
+                        self.message_log.record(client_address, request, chunk, started, len(message))
+                        continue
                     
                     response = await self.forward_to_socket_server(request)
+                    if session.forgotten(request, response):
+                        # The server restarted or dropped the idle session; carry on in a new one
+                        response = await self.forward_to_socket_server(await session.attach(request))
                     
-                    logger.info(f"Sending: {response}")
-                    await websocket.send(json.dumps(response))
+                    if sampled:
+                        self.message_log.log("Sending: %s", response)
+                    await websocket.send(json.dumps(response, default=json_default))
+                    self.message_log.record(client_address, request, response, started, len(message))
                     
                 except json.JSONDecodeError as e:
                     error_msg = {"success": False, "error": f"Invalid JSON: {str(e)}"}
                     await websocket.send(json.dumps(error_msg))
                 except Exception as e:
-                    logger.error(f"Error processing message: {e}")
+                    logger.error("Error processing message: %s", e)
                     error_msg = {"success": False, "error": f"Processing error: {str(e)}"}
                     await websocket.send(json.dumps(error_msg))
                     
         except Exception as e:
-            logger.error(f"Client error: {e}")
+            logger.error("Client error: %s", e)
         finally:
             self.clients.discard(websocket)
             logger.info("Client disconnected")
     
+    def bridge_stats(self, limit=None) -> Dict[str, Any]:
+        """The bridge's own counters and most recent requests"""
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit < 0:
+            limit = None
+        return {"success": True, "type": "bridge_stats", "clients": len(self.clients),
+                "upstream": self.upstream.stats(), "recent": self.message_log.recent_requests(limit)}
+    
     async def forward_to_socket_server(self, request: Dict[str, Any]) -> Dict[str, Any]:
         """Forward request to socket server"""
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(10)
-            sock.connect((self.socket_host, self.socket_port))
-            
-            request_json = json.dumps(request)
-            sock.send(request_json.encode('utf-8'))
-            
-            response_data = sock.recv(4096).decode('utf-8')
-            response = json.loads(response_data)
-            
-            sock.close()
+            response = await self.upstream.request(request)
             return response
             
-        except ConnectionRefusedError:
+        except (ConnectionRefusedError, FileNotFoundError):
             return {"success": False, "error": "Calculator server not running. Start server.py first."}
-        except socket.timeout:
+        except asyncio.TimeoutError:
             return {"success": False, "error": "Calculator server timeout"}
         except Exception as e:
-            logger.error(f"Socket error: {e}")
+            logger.error("Socket error: %s", e)
             return {"success": False, "error": f"Communication error: {str(e)}"}
     
-    def test_socket_server(self):
+    async def stream_from_socket_server(self, request: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Forward a streaming request and yield each newline-delimited chunk as it arrives"""
+        try:
+            async for chunk in self.upstream.stream(request):
+                yield chunk
+                    
+        except (ConnectionRefusedError, FileNotFoundError):
+            yield {"success": False, "done": True, "error": "Calculator server not running. Start server.py first."}
+        except asyncio.TimeoutError:
+            yield {"success": False, "done": True, "error": "Calculator server timeout"}
+        except Exception as e:
+            logger.error("Socket error: %s", e)
+            yield {"success": False, "done": True, "error": f"Communication error: {str(e)}"}
+    
+    async def test_socket_server(self):
         """Test connection to socket server"""
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(5)
-            sock.connect((self.socket_host, self.socket_port))
-            
             test_msg = {"command": "ping"}
-            sock.send(json.dumps(test_msg).encode('utf-8'))
-            response = sock.recv(1024).decode('utf-8')
-            sock.close()
+            await self.upstream.request(test_msg, timeout=5)
             
             logger.info("✓ Calculator server is reachable")
             return True
@@ -112,12 +157,13 @@ class SimpleWebSocketBridge:
         """Start the WebSocket server"""
         if not WEBSOCKETS_AVAILABLE:
             logger.error("Cannot start server: websockets library not available")
+            self.ready.set()
             return
         
         logger.info(f"Starting WebSocket bridge on {self.websocket_host}:{self.websocket_port}")
-        logger.info(f"Will connect to calculator server at {self.socket_host}:{self.socket_port}")
+        logger.info(f"Will connect to calculator server at {self.socket_path or f'{self.socket_host}:{self.socket_port}'}")
         
-        self.test_socket_server()
+        await self.test_socket_server()
         
         try:
             server = await websockets.serve(
@@ -129,11 +175,21 @@ class SimpleWebSocketBridge:
             logger.info(f"✓ WebSocket bridge running on ws://{self.websocket_host}:{self.websocket_port}")
             logger.info("Open calculator.html in your browser")
             logger.info("Press Ctrl+C to stop")
+            self.running = True
+            self.ready.set()
             
             await server.wait_closed()
             
         except Exception as e:
             logger.error(f"Failed to start WebSocket server: {e}")
+        finally:
+            self.running = False
+            self.ready.set()
+            await self.upstream.close()
+    
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """Block until the bridge is listening; False if it failed to start or timed out"""
+        return self.ready.wait(timeout) and self.running
     
     def run(self):
         """Run the bridge"""
@@ -146,12 +202,20 @@ class SimpleWebSocketBridge:
 
 def main():
     """Main entry point"""
+    parser = argparse.ArgumentParser(description="WebSocket bridge to the calculator server")
+    parser.add_argument("--unix-socket", metavar="PATH", default=None,
+                        help="reach the calculator server over this Unix domain socket instead of TCP")
+    parser.add_argument("--debug", action="store_true",
+                        help="answer the bridge_stats command with the bridge's recent requests")
+    args = parser.parse_args()
+    configure_logging()
+    
     if not WEBSOCKETS_AVAILABLE:
         print("Error: websockets library not found")
         print("Install it with: pip install websockets")
         return
     
-    bridge = SimpleWebSocketBridge()
+    bridge = SimpleWebSocketBridge(socket_path=args.unix_socket, debug=args.debug)
     bridge.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,324 @@
+"""
+Root Finding
+============
+
+Solves f(x) = 0 for expressions in one variable on the server.
+
+With a bracket [a, b] over which f changes sign, Brent's method combines
+bisection with secant and inverse quadratic steps and always converges.
+From a starting point, Newton's method uses a derivative taken
+symbolically from the parsed expression and compiled like any other
+expression, so no finite differences are needed. Many starting points are
+solved together: with NumPy every Newton iteration is one vectorized pass
+over the points that have not converged yet.
+"""
+
+import math
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from expression import Binary, Call, Expression, Num, Unary, Var, compile_optimized, simplify
+from vectorized import MAX_BATCH_SIZE, NUMPY_AVAILABLE, NUMPY_FUNCTIONS, np
+
+DEFAULT_TOLERANCE = 1e-12
+DEFAULT_MAX_ITERATIONS = 100
+MAX_ITERATIONS = 10000
+# Relative part of the tolerance, a few ulps
+_RELATIVE_TOLERANCE = 4 * 2.220446049250313e-16
+
+_ZERO = Num(0)
+_ONE = Num(1)
+
+
+def _is(node, value) -> bool:
+    return isinstance(node, Num) and node.value == value
+
+
+def _add(a, b):
+    if _is(a, 0):
+        return b
+    if _is(b, 0):
+        return a
+    return Binary('+', a, b)
+
+
+def _sub(a, b):
+    if _is(b, 0):
+        return a
+    if _is(a, 0):
+        return Unary('neg', b)
+    return Binary('-', a, b)
+
+
+def _mul(a, b):
+    # Dropping zero terms is what makes derivative trees small
+    if _is(a, 0) or _is(b, 0):
+        return _ZERO
+    if _is(a, 1):
+        return b
+    if _is(b, 1):
+        return a
+    return Binary('*', a, b)
+
+
+def _div(a, b):
+    if _is(a, 0):
+        return _ZERO
+    if _is(b, 1):
+        return a
+    return Binary('/', a, b)
+
+
+def _call(name: str, *args):
+    return Call(name, args)
+
+
+# d/du f(u) for single-argument functions, as trees in u
+_DERIVATIVES: Dict[str, Callable[[Any], Any]] = {
+    "sin": lambda u: _call('cos', u),
+    "cos": lambda u: Unary('neg', _call('sin', u)),
+    "tan": lambda u: Binary('+', _ONE, Binary('**', _call('tan', u), Num(2))),
+    "asin": lambda u: Binary('/', _ONE, _call('sqrt', Binary('-', _ONE, Binary('**', u, Num(2))))),
+    "acos": lambda u: Binary('/', Num(-1), _call('sqrt', Binary('-', _ONE, Binary('**', u, Num(2))))),
+    "atan": lambda u: Binary('/', _ONE, Binary('+', _ONE, Binary('**', u, Num(2)))),
+    "sinh": lambda u: _call('cosh', u),
+    "cosh": lambda u: _call('sinh', u),
+    "tanh": lambda u: Binary('-', _ONE, Binary('**', _call('tanh', u), Num(2))),
+    "ln": lambda u: Binary('/', _ONE, u),
+    "log": lambda u: Binary('/', _ONE, Binary('*', u, _call('ln', Num(10)))),
+    "log10": lambda u: Binary('/', _ONE, Binary('*', u, _call('ln', Num(10)))),
+    "log2": lambda u: Binary('/', _ONE, Binary('*', u, _call('ln', Num(2)))),
+    "sqrt": lambda u: Binary('/', Num(0.5), _call('sqrt', u)),
+    "exp": lambda u: _call('exp', u),
+    "abs": lambda u: Binary('/', u, _call('abs', u)),
+    "degrees": lambda u: Binary('/', Num(180), Var('pi')),
+    "radians": lambda u: Binary('/', Var('pi'), Num(180)),
+    # Piecewise constant
+    "floor": lambda u: _ZERO,
+    "ceil": lambda u: _ZERO,
+    "round": lambda u: _ZERO,
+}
+
+
+def _power(u, v, du, dv):
+    node = Binary('**', u, v)
+    if _is(dv, 0):
+        return _mul(_mul(v, Binary('**', u, _sub(v, _ONE))), du)
+    if _is(du, 0):
+        return _mul(_mul(node, _call('ln', u)), dv)
+    return _mul(node, _add(_mul(dv, _call('ln', u)), _div(_mul(v, du), u)))
+
+
+def _derive(node, variable: str):
+    if isinstance(node, Num):
+        return _ZERO
+    if isinstance(node, Var):
+        return _ONE if node.name == variable else _ZERO
+
+    if isinstance(node, Unary):
+        du = _derive(node.operand, variable)
+        return Unary('neg', du) if node.op == 'neg' and not _is(du, 0) else du
+
+    if isinstance(node, Binary):
+        u, v = node.left, node.right
+        du, dv = _derive(u, variable), _derive(v, variable)
+        op = node.op
+        if op == '+':
+            return _add(du, dv)
+        if op == '-':
+            return _sub(du, dv)
+        if op == '*':
+            return _add(_mul(du, v), _mul(u, dv))
+        if op == '/':
+            if _is(dv, 0):
+                return _div(du, v)
+            return _div(_sub(_mul(du, v), _mul(u, dv)), Binary('**', v, Num(2)))
+        if op == '**':
+            return _power(u, v, du, dv)
+        if op == '//':
+            return _ZERO
+        if op == '%':
+            # u % v = u - v * (u // v), and u // v is piecewise constant
+            return _sub(du, _mul(dv, Binary('//', u, v)))
+
+    if isinstance(node, Call):
+        if node.name == 'pow' and len(node.args) == 2:
+            u, v = node.args
+            return _power(u, v, _derive(u, variable), _derive(v, variable))
+        rule = _DERIVATIVES.get(node.name)
+        if rule is None or len(node.args) != 1:
+            raise ValueError(f"Cannot differentiate {node.name}()")
+        u, = node.args
+        du = _derive(u, variable)
+        return _mul(rule(u), du) if not _is(du, 0) else _ZERO
+
+    raise TypeError(f"Unknown expression node: {node!r}")
+
+
+def derivative(node, variable: str):
+    """Symbolic derivative of a tree with respect to `variable`, simplified"""
+    return simplify(_derive(node, variable))
+
+
+def _scalar(evaluate: Callable, variable: str) -> Callable[[float], float]:
+    """Wrap a compiled evaluator as a float function; failures become NaN"""
+    def f(x: float) -> float:
+        try:
+            value = evaluate({variable: x})
+            return float(value)
+        except (ArithmeticError, ValueError, TypeError):
+            return math.nan
+    return f
+
+
+def brent(f: Callable[[float], float], a: float, b: float, tolerance: float = DEFAULT_TOLERANCE,
+          max_iterations: int = DEFAULT_MAX_ITERATIONS) -> Tuple[float, int]:
+    """Brent's method on a sign-changing bracket; returns (root, iterations)"""
+    previous, current = float(a), float(b)
+    f_previous, f_current = f(previous), f(current)
+    if math.isnan(f_previous) or math.isnan(f_current):
+        raise ValueError("Expression is undefined at the ends of the bracket")
+    if f_previous == 0:
+        return previous, 0
+    if f_current == 0:
+        return current, 0
+    if (f_previous > 0) == (f_current > 0):
+        raise ValueError("Expression must change sign over the bracket")
+
+    block = f_block = 0.0
+    step_previous = step_current = 0.0
+    for iteration in range(1, max_iterations + 1):
+        if f_previous and f_current and (f_previous > 0) != (f_current > 0):
+            block, f_block = previous, f_previous
+            step_previous = step_current = current - previous
+        if abs(f_block) < abs(f_current):
+            previous, current, block = current, block, current
+            f_previous, f_current, f_block = f_current, f_block, f_current
+
+        delta = (tolerance + _RELATIVE_TOLERANCE * abs(current)) / 2
+        bisect = (block - current) / 2
+        if f_current == 0 or abs(bisect) < delta:
+            return current, iteration
+
+        if abs(step_previous) > delta and abs(f_current) < abs(f_previous):
+            if previous == block:
+                # Secant step
+                trial = -f_current * (current - previous) / (f_current - f_previous)
+            else:
+                # Inverse quadratic interpolation
+                d_previous = (f_previous - f_current) / (previous - current)
+                d_block = (f_block - f_current) / (block - current)
+                trial = -f_current * (f_block * d_block - f_previous * d_previous) / (
+                    d_block * d_previous * (f_block - f_previous))
+            if 2 * abs(trial) < min(abs(step_previous), 3 * abs(bisect) - delta):
+                step_previous, step_current = step_current, trial
+            else:
+                step_previous = step_current = bisect
+        else:
+            step_previous = step_current = bisect
+
+        previous, f_previous = current, f_current
+        current += step_current if abs(step_current) > delta else math.copysign(delta, bisect)
+        f_current = f(current)
+        if math.isnan(f_current):
+            raise ValueError(f"Expression is undefined at {current!r}")
+    raise ValueError(f"Did not converge in {max_iterations} iterations")
+
+
+def newton(f: Callable[[float], float], df: Callable[[float], float], start: float,
+           tolerance: float = DEFAULT_TOLERANCE, max_iterations: int = DEFAULT_MAX_ITERATIONS) -> Tuple[float, int]:
+    """Newton's method from a starting point; returns (root, iterations)"""
+    x = float(start)
+    for iteration in range(1, max_iterations + 1):
+        fx = f(x)
+        if fx == 0:
+            return x, iteration
+        slope = df(x)
+        if not slope or not math.isfinite(slope) or math.isnan(fx):
+            raise ValueError(f"Derivative is zero or undefined at {x!r}")
+        step = fx / slope
+        x -= step
+        if not math.isfinite(x):
+            raise ValueError("Newton's method diverged")
+        if abs(step) <= tolerance + _RELATIVE_TOLERANCE * abs(x):
+            return x, iteration
+    raise ValueError(f"Did not converge in {max_iterations} iterations")
+
+
+def _newton_many(expression: Expression, slope_tree, variable: str, starts: Sequence[float],
+                 tolerance: float, max_iterations: int) -> List[Optional[float]]:
+    """Newton's method from many starting points; points that fail yield None"""
+    if not NUMPY_AVAILABLE:
+        f = _scalar(expression.evaluate, variable)
+        df = _scalar(compile_optimized(slope_tree), variable)
+        roots = []
+        for start in starts:
+            try:
+                roots.append(newton(f, df, start, tolerance, max_iterations)[0])
+            except ValueError:
+                roots.append(None)
+        return roots
+
+    f = expression.compile(NUMPY_FUNCTIONS)
+    df = compile_optimized(slope_tree, NUMPY_FUNCTIONS)
+    x = np.asarray(starts, dtype=np.float64).copy()
+    active = np.flatnonzero(np.isfinite(x))
+    converged = np.zeros(len(x), dtype=bool)
+    with np.errstate(all='ignore'):
+        for _ in range(max_iterations):
+            if not len(active):
+                break
+            points = x[active]
+            env = {variable: points}
+            fx = np.broadcast_to(f(env), points.shape).astype(np.float64)
+            slope = np.broadcast_to(df(env), points.shape).astype(np.float64)
+            step = fx / slope
+            points = points - np.where(fx == 0, 0.0, step)
+            x[active] = points
+            done = (fx == 0) | (np.abs(step) <= tolerance + _RELATIVE_TOLERANCE * np.abs(points))
+            failed = ~np.isfinite(points)
+            converged[active[done & ~failed]] = True
+            active = active[~(done | failed)]
+    return [float(root) if ok else None for root, ok in zip(x.tolist(), converged)]
+
+
+def solve(expression: Expression, variable: Optional[str] = None, bracket: Optional[Sequence[float]] = None,
+          start: Optional[float] = None, starts: Optional[Sequence[float]] = None,
+          tolerance: float = DEFAULT_TOLERANCE, max_iterations: int = DEFAULT_MAX_ITERATIONS) -> Dict[str, Any]:
+    """
+    Find a root of the expression in `variable`: by Brent's method inside
+    `bracket`, by Newton's method from `start`, or by Newton's method from
+    each of `starts`. Returns the fields of a successful response.
+    """
+    if variable is None:
+        if len(expression.variables) != 1:
+            raise ValueError("Name the variable to solve for")
+        variable, = expression.variables
+    extra = expression.variables - {variable}
+    if extra:
+        raise NameError(f"name '{sorted(extra)[0]}' is not defined")
+    if not (isinstance(tolerance, (int, float)) and tolerance > 0):
+        raise ValueError("Tolerance must be a positive number")
+    if not (isinstance(max_iterations, int) and 0 < max_iterations <= MAX_ITERATIONS):
+        raise ValueError(f"max_iterations must be an integer from 1 to {MAX_ITERATIONS}")
+
+    f = _scalar(expression.evaluate, variable)
+    if bracket is not None:
+        if not (isinstance(bracket, (list, tuple)) and len(bracket) == 2):
+            raise ValueError("Bracket must be a pair [a, b]")
+        a, b = (float(value) for value in bracket)
+        root, iterations = brent(f, a, b, tolerance, max_iterations)
+        return {"root": root, "value": f(root), "iterations": iterations, "method": "brent"}
+
+    slope_tree = derivative(expression.tree, variable)
+    if starts is not None:
+        if not isinstance(starts, (list, tuple)) or len(starts) > MAX_BATCH_SIZE:
+            raise ValueError(f"Starts must be a list of at most {MAX_BATCH_SIZE} numbers")
+        roots = _newton_many(expression, slope_tree, variable, starts, tolerance, max_iterations)
+        return {"roots": roots, "count": len(roots), "converged": sum(1 for root in roots if root is not None),
+                "method": "newton"}
+
+    if start is None:
+        raise ValueError("Give a bracket, a start or a list of starts")
+    df = _scalar(compile_optimized(slope_tree), variable)
+    root, iterations = newton(f, df, start, tolerance, max_iterations)
+    return {"root": root, "value": f(root), "iterations": iterations, "method": "newton"}
@@ -0,0 +1,423 @@
+"""
+Worker Supervisor
+=================
+
+Runs several calculator server processes on one port, so request handling
+scales across cores instead of sharing one GIL.
+
+Each worker is a full server process. Where the platform has SO_REUSEPORT,
+every worker binds the port itself and the kernel spreads new connections
+across them; elsewhere the supervisor binds one listening socket and hands
+it to every worker, which then compete to accept. A Unix domain socket path
+is always shared that way. The supervisor restarts
+workers that die, backing off if they keep dying, and collects each
+worker's counters over a pipe. The totals are sent back to the workers,
+where the "stats" command shows them under "cluster", and can be served in
+the Prometheus format.
+
+Sessions live in the worker that created them, and their tokens start with
+that worker's index. Each worker also listens on a private Unix socket in a
+directory the supervisor creates; a worker that receives a request naming
+another worker's session forwards it there (SessionRouter), so a token works
+whichever worker the connection carrying it reached. Without Unix domain
+sockets there is no forwarding, and a token only works on its own worker.
+
+A process pool for heavy calculations (process_workers) is split between
+the workers rather than started in full by each of them.
+"""
+
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+from multiprocessing.connection import wait
+from typing import Any, Dict, Iterator, List, Optional
+
+from metrics import Metrics, start_http_server
+from protocol import MessageReader, ProtocolError, encode_message
+from sessions import UNKNOWN_SESSION
+
+STATS_INTERVAL = 1.0
+RESTART_BACKOFF_INITIAL = 0.5
+RESTART_BACKOFF_MAX = 30.0
+# A worker that lived this long before dying is restarted without delay
+STABLE_UPTIME = 10.0
+# Seconds a worker waits on another worker's answer to a forwarded request
+FORWARD_TIMEOUT = 60.0
+
+
+def _worker_stats(server) -> Dict[str, Any]:
+    stats = {"metrics": server.metrics.export(), "cache": server.cache.stats(),
+             "sessions": server.sessions.stats()}
+    if server.engine is not None:
+        stats["engine"] = server.engine.stats()
+    return stats
+
+
+def _report(server, conn):
+    """Send the worker's counters to the supervisor and keep its latest totals"""
+    while True:
+        try:
+            conn.send(_worker_stats(server))
+            while conn.poll():
+                server.cluster_stats = conn.recv()
+        except (EOFError, OSError):
+            # The supervisor is gone; do not linger holding the port
+            os._exit(1)
+        time.sleep(STATS_INTERVAL)
+
+
+class SessionRouter:
+    """
+    Forwards requests naming another worker's session to that worker's
+    private socket. Connections to each worker are pooled, one request on
+    each at a time.
+    """
+
+    def __init__(self, paths: List[str], index: int, timeout: float = FORWARD_TIMEOUT):
+        self.paths = paths
+        self.index = index
+        self.timeout = timeout
+        self._idle: List[List[Any]] = [[] for _ in paths]
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        """This worker's private socket"""
+        return self.paths[self.index]
+
+    @property
+    def prefix(self) -> str:
+        """Start of the session tokens this worker issues"""
+        return f"{self.index}."
+
+    def owner(self, request: Dict[str, Any]) -> Optional[int]:
+        """Index of the other worker holding the request's session; None if that is this worker or none"""
+        token = request.get('session')
+        if not isinstance(token, str):
+            return None
+        index, dot, _ = token.partition('.')
+        if not dot or not index.isdigit():
+            return None
+        index = int(index)
+        return index if index != self.index and index < len(self.paths) else None
+
+    def _checkout(self, index: int):
+        """(socket, reader, reused) for worker `index`, pooled or newly connected"""
+        with self._lock:
+            if self._idle[index]:
+                return self._idle[index].pop() + (True,)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.paths[index])
+        except OSError:
+            sock.close()
+            raise
+        return sock, MessageReader(sock), False
+
+    def forward(self, index: int, request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Send a request to worker `index` and yield its response, or each chunk
+        of a tabulate stream. If that worker cannot be reached it has died,
+        taking its sessions with it, so the answer is an unknown session.
+        """
+        streaming = request.get('command') == 'tabulate'
+        for attempt in range(2):
+            try:
+                sock, reader, reused = self._checkout(index)
+            except OSError:
+                yield self._failed(request, UNKNOWN_SESSION, streaming)
+                return
+            try:
+                sock.sendall(encode_message(request))
+                message = reader.read()
+            except socket.timeout:
+                sock.close()
+                yield self._failed(request, "Calculation timed out", streaming)
+                return
+            except (OSError, ValueError, ProtocolError):
+                message = None
+            if message is None:
+                sock.close()
+                # A pooled connection to a worker that has since been replaced
+                if reused and attempt == 0:
+                    continue
+                yield self._failed(request, UNKNOWN_SESSION, streaming)
+                return
+            try:
+                while streaming and not message.get('done'):
+                    yield message
+                    message = self._read(reader)
+                    if message is None:
+                        break
+            except BaseException:
+                sock.close()
+                raise
+            if message is None:
+                sock.close()
+                yield self._failed(request, "Calculator worker closed the stream", streaming)
+            else:
+                # Back in the pool before the last message goes out, so a caller may stop there
+                with self._lock:
+                    self._idle[index].append((sock, reader))
+                yield message
+            return
+
+    @staticmethod
+    def _read(reader: MessageReader) -> Optional[Dict[str, Any]]:
+        try:
+            return reader.read()
+        except (OSError, ValueError, ProtocolError):
+            return None
+
+    @staticmethod
+    def _failed(request: Dict[str, Any], error: str, streaming: bool) -> Dict[str, Any]:
+        response = {"success": False, "error": error}
+        if streaming:
+            response.update(command="tabulate", done=True)
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    def close(self):
+        """Close the pooled connections to other workers"""
+        with self._lock:
+            for idle in self._idle:
+                for sock, _ in idle:
+                    sock.close()
+                idle.clear()
+
+
+def _worker_main(server_class, options: Dict[str, Any], conn, listener: Optional[socket.socket]):
+    # Ctrl+C reaches the whole process group; the supervisor does the shutting down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server = server_class(**options)
+    threading.Thread(target=_report, args=(server, conn), daemon=True).start()
+    server.start(listener)
+
+
+class _Slot:
+    """One worker position: the current process and its restart history"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.started = 0.0
+        self.restart_at = 0.0
+        self.backoff = 0.0
+        self.restarts = 0
+        self.stats = None
+
+
+def _sum_counters(dicts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum the numeric fields of per-worker stats such as cache counters"""
+    total: Dict[str, Any] = {}
+    for counters in dicts:
+        for key, value in counters.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+    return total
+
+
+class Supervisor:
+    """Starts, watches and restarts calculator server worker processes"""
+
+    def __init__(self, server_class, options: Dict[str, Any], workers: Optional[int] = None,
+                 metrics_port: Optional[int] = None):
+        self.server_class = server_class
+        self.size = workers or os.cpu_count() or 1
+        # SO_REUSEPORT does not spread Unix socket connections across processes
+        reuse_port = hasattr(socket, "SO_REUSEPORT") and options.get("path") is None
+        self.options = dict(options, reuse_port=reuse_port, metrics_port=None)
+        if options.get("process_workers") is not None:
+            # A full-size pool in every worker would start workers x cores processes
+            budget = options["process_workers"] or os.cpu_count() or 1
+            self.options["process_workers"] = max(1, budget // self.size)
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.running = False
+        self._context = multiprocessing.get_context('spawn')
+        self._slots = [_Slot(index) for index in range(self.size)]
+        # Request counters of workers that have since died
+        self._retired = Metrics()
+        self._listener = None
+        # Private sockets the workers forward requests to each other on
+        self._peer_dir = None
+        self._peers = None
+        self._lock = threading.Lock()
+
+    def _bind(self) -> Optional[socket.socket]:
+        """Without SO_REUSEPORT, one socket is bound here and shared by every worker"""
+        if self.options["reuse_port"]:
+            return None
+        if self.options.get("path") is not None:
+            return self.server_class.listen_unix(self.options["path"], self.options.get("backlog") or 128)
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.options.get("host", "localhost"), self.options.get("port", 8888)))
+        listener.listen(self.options.get("backlog") or 128)
+        return listener
+
+    def _start(self, slot: _Slot):
+        conn, child_conn = self._context.Pipe()
+        options = self.options
+        if self._peers is not None:
+            options = dict(options, shard=slot.index, peers=self._peers)
+        # Not a daemon, since daemons cannot start the process pool of --processes;
+        # a worker exits by itself once the supervisor is gone (see _report)
+        slot.process = self._context.Process(
+            target=_worker_main, args=(self.server_class, options, child_conn, self._listener),
+            name=f"calculator-worker-{slot.index}")
+        slot.process.start()
+        child_conn.close()
+        slot.conn = conn
+        slot.started = time.monotonic()
+        slot.stats = None
+
+    def _reap(self, slot: _Slot):
+        """Keep the counters of a dead worker and schedule its replacement"""
+        print(f"Worker {slot.index} (pid {slot.process.pid}) exited with code {slot.process.exitcode}")
+        with self._lock:
+            if slot.stats is not None:
+                self._retired.merge(slot.stats["metrics"], gauges=False)
+        slot.conn.close()
+        slot.process = slot.conn = slot.stats = None
+        now = time.monotonic()
+        if now - slot.started >= STABLE_UPTIME:
+            slot.backoff = 0.0
+        else:
+            slot.backoff = min(RESTART_BACKOFF_MAX, slot.backoff * 2 or RESTART_BACKOFF_INITIAL)
+        slot.restart_at = now + slot.backoff
+
+    def _collect(self, timeout: float):
+        """Take the counters the workers have sent within `timeout` seconds"""
+        conns = {slot.conn: slot for slot in self._slots if slot.conn is not None}
+        for conn in wait(list(conns), timeout):
+            slot = conns[conn]
+            try:
+                while conn.poll():
+                    slot.stats = conn.recv()
+            except (EOFError, OSError):
+                pass
+
+    def _aggregate(self):
+        """
+        (stats, Metrics) summed over the workers. Request counters include
+        workers that have since been replaced; cache, session and engine
+        figures cover the live workers.
+        """
+        with self._lock:
+            metrics = Metrics()
+            metrics.merge(self._retired.export(), gauges=False)
+            live = [slot.stats for slot in self._slots if slot.stats is not None]
+            for stats in live:
+                metrics.merge(stats["metrics"])
+        stats = metrics.snapshot()
+        stats["cache"] = _sum_counters([s["cache"] for s in live])
+        stats["sessions"] = _sum_counters([s["sessions"] for s in live])
+        engines = [s["engine"] for s in live if "engine" in s]
+        if engines:
+            stats["engine"] = _sum_counters(engines)
+        stats["workers"] = {
+            "size": self.size,
+            "alive": sum(1 for slot in self._slots if slot.process is not None and slot.process.is_alive()),
+            "restarts": sum(slot.restarts for slot in self._slots),
+            "pids": [slot.process.pid if slot.process is not None else None for slot in self._slots],
+        }
+        return stats, metrics
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters summed over the workers, in the shape of the stats command"""
+        return self._aggregate()[0]
+
+    def render_metrics(self) -> str:
+        """Cluster-wide metrics in the Prometheus text format"""
+        stats, metrics = self._aggregate()
+        extra = {f"cache_{key}": value for key, value in stats["cache"].items()}
+        extra.update((f"sessions_{key}", value) for key, value in stats["sessions"].items())
+        extra.update((f"engine_{key}", value) for key, value in stats.get("engine", {}).items())
+        extra.update(workers_alive=stats["workers"]["alive"], worker_restarts=stats["workers"]["restarts"])
+        return metrics.prometheus(extra)
+
+    def _broadcast(self):
+        """Send the cluster totals to every worker for its stats command"""
+        stats = self.stats()
+        for slot in self._slots:
+            if slot.conn is not None:
+                try:
+                    slot.conn.send(stats)
+                except (OSError, ValueError):
+                    pass
+
+    def run(self):
+        """Start the workers and supervise them until interrupted or stop() is called"""
+        host, port = self.options.get("host", "localhost"), self.options.get("port", 8888)
+        endpoint = self.options.get("path") or f"{host}:{port}"
+        self._listener = self._bind()
+        if self.size > 1 and hasattr(socket, "AF_UNIX"):
+            self._peer_dir = tempfile.mkdtemp(prefix="calculator-")
+            self._peers = [os.path.join(self._peer_dir, f"worker-{index}.sock") for index in range(self.size)]
+        for slot in self._slots:
+            self._start(slot)
+        if self.metrics_port is not None:
+            self.metrics_server = start_http_server(self.render_metrics, host, self.metrics_port)
+            print(f"Cluster metrics available at http://{host}:{self.metrics_port}/metrics")
+        sharing = "SO_REUSEPORT" if self._listener is None else "a shared listening socket"
+        print(f"Supervising {self.size} calculator workers on {endpoint} ({sharing})")
+
+        self.running = True
+        previous = signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        try:
+            while self.running:
+                self._collect(STATS_INTERVAL)
+                now = time.monotonic()
+                for slot in self._slots:
+                    if slot.process is not None and not slot.process.is_alive():
+                        self._reap(slot)
+                    if slot.process is None and self.running and now >= slot.restart_at:
+                        slot.restarts += 1
+                        self._start(slot)
+                self._broadcast()
+        except KeyboardInterrupt:
+            print("\nShutting down workers...")
+        finally:
+            self.running = False
+            signal.signal(signal.SIGTERM, previous)
+            self._shutdown()
+
+    def _shutdown(self):
+        for slot in self._slots:
+            if slot.process is not None:
+                slot.process.terminate()
+        for slot in self._slots:
+            if slot.process is not None:
+                slot.process.join(5)
+                if slot.process.is_alive():
+                    slot.process.kill()
+                slot.conn.close()
+                slot.process = slot.conn = None
+        if self._listener is not None:
+            self._listener.close()
+            if self.options.get("path") is not None:
+                try:
+                    os.unlink(self.options["path"])
+                except OSError:
+                    pass
+        if self._peer_dir is not None:
+            shutil.rmtree(self._peer_dir, ignore_errors=True)
+            self._peer_dir = self._peers = None
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+        print("All workers stopped")
+
+    def stop(self):
+        """Stop supervising; the workers are terminated as run() returns"""
+        self.running = False
@@ -0,0 +1,70 @@
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from client import AsyncCalculatorClient
+from server import AsyncCalculatorServer
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix domain sockets")
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = AsyncCalculatorServer(path=str(tmp_path / "calculator.sock"))
+    threading.Thread(target=server.start, daemon=True).start()
+    assert server.wait_until_ready(5)
+    yield server
+    server.stop()
+
+
+def run(server, test, **options):
+    async def main():
+        async with AsyncCalculatorClient(path=server.path, **options) as client:
+            return await test(client)
+    return asyncio.run(main())
+
+
+def test_concurrent_calls_return_in_order(server):
+    async def test(client):
+        return await client.calculate_many([f"{n} * 3" for n in range(40)])
+    responses = run(server, test, pool_size=4)
+    assert [response["result"] for response in responses] == [n * 3 for n in range(40)]
+
+
+def test_bulk_calls_split_into_chunks(server):
+    async def test(client):
+        return await client.calculate_bulk(["1 / 3", "1 / 0", "2 ** 8"] * 5, mode="fraction", chunk_size=4)
+    responses = run(server, test)
+    assert len(responses) == 15
+    assert [response.get("result") for response in responses[:3]] == ["1/3", None, "256"]
+    assert responses[1]["error"] == "Division by zero"
+
+
+def test_pooled_connections_share_one_session(server):
+    async def test(client):
+        await client.memory_operation("store", 5)
+        await asyncio.gather(*[client.memory_operation("add", 1) for _ in range(10)])
+        return await client.memory_operation("recall")
+    assert run(server, test, pool_size=4)["memory"] == 15
+
+
+def test_forgotten_session_is_replaced(server):
+    async def test(client):
+        await client.memory_operation("store", 5)
+        first = client.session
+        server.sessions.remove(first)
+        response = await client.memory_operation("recall")
+        return first, client.session, response
+    first, second, response = run(server, test)
+    assert second != first
+    assert response["success"] and response["memory"] == 0
+
+
+def test_unreachable_server_is_an_error_response(tmp_path):
+    async def main():
+        async with AsyncCalculatorClient(path=str(tmp_path / "missing.sock"), timeout=0.3) as client:
+            return await client.ping()
+    response = asyncio.run(main())
+    assert not response["success"]
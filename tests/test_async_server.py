@@ -0,0 +1,51 @@
+import socket
+import threading
+
+import pytest
+
+from client import CalculatorClient
+from protocol import MessageReader, encode_message
+from server import AsyncCalculatorServer
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix domain sockets")
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = AsyncCalculatorServer(path=str(tmp_path / "calculator.sock"), max_workers=2)
+    threading.Thread(target=server.start, daemon=True).start()
+    assert server.wait_until_ready(5)
+    yield server
+    server.stop()
+
+
+def test_many_open_connections_keep_their_own_state(server):
+    clients = [CalculatorClient(path=server.path) for _ in range(50)]
+    try:
+        for number, client in enumerate(clients):
+            assert client.connect()
+            assert client.memory_operation("store", number)["success"]
+        assert [client.memory_operation("recall")["memory"] for client in clients] == list(range(50))
+        assert server.metrics.snapshot()["connections"]["active"] == 50
+    finally:
+        for client in clients:
+            client.disconnect()
+
+
+def test_tabulate_streams_between_pipelined_requests(server):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(server.path)
+    reader = MessageReader(sock)
+    try:
+        sock.sendall(encode_message({"command": "calculate", "expression": "1 + 1", "id": 1})
+                     + encode_message({"command": "tabulate", "expression": "x", "stop": 5, "chunk_size": 2, "id": 2})
+                     + encode_message({"command": "calculate", "expression": "2 + 2", "id": 3}))
+        assert reader.read()["result"] == 2
+        chunks = [reader.read() for _ in range(4)]
+        assert [chunk["id"] for chunk in chunks] == [2] * 4
+        assert [value for chunk in chunks[:-1] for value in chunk["results"]] == [0, 1, 2, 3, 4, 5]
+        assert chunks[-1]["done"]
+        assert reader.read() == {"success": True, "result": 4, "expression": "2 + 2", "formatted_result": "4",
+                                 "id": 3}
+    finally:
+        sock.close()
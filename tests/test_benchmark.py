@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import json
+import signal
+import subprocess
+import threading
+
+import pytest
+
+from benchmark import free_port, make_requests, percentile, run_socket, start_bridge, summarize, wait_for_bridge
+from server import CalculatorServer
+from simple_bridge import WEBSOCKETS_AVAILABLE
+
+
+@pytest.mark.parametrize("fraction, expected", [(0.0, 1), (0.5, 5), (0.9, 9), (0.95, 10), (1.0, 10)])
+def test_percentile_uses_the_nearest_rank(fraction, expected):
+    assert percentile(list(range(1, 11)), fraction) == expected
+
+
+def test_percentile_is_not_thrown_off_by_float_error():
+    assert percentile(list(range(1, 21)), 0.95) == 19
+
+
+def test_empty_run_summarizes_to_zeros():
+    summary = summarize([], 3, 0.0)
+    assert (summary["requests"], summary["errors"], summary["throughput"]) == (3, 3, 0.0)
+    assert summary["latency_ms"]["p99"] == 0.0
+
+
+def test_summary_is_in_milliseconds():
+    summary = summarize([0.002, 0.001, 0.003], 1, 0.5)
+    assert summary["requests"] == 4 and summary["throughput"] == 6.0
+    assert summary["latency_ms"]["min"] == 1.0 and summary["latency_ms"]["max"] == 3.0
+    assert summary["latency_ms"]["mean"] == 2.0
+
+
+def test_unique_requests_defeat_the_cache():
+    build = make_requests(["1 + 1", "2 * 3"], unique=False)
+    assert [build(index)["expression"] for index in range(3)] == ["1 + 1", "2 * 3", "1 + 1"]
+    build = make_requests(["1 + 1"], unique=True)
+    assert build(0)["expression"] != build(1)["expression"]
+
+
+@pytest.fixture(scope="module")
+def port():
+    port = free_port("localhost")
+    server = CalculatorServer(port=port)
+    threading.Thread(target=server.start, daemon=True).start()
+    assert server.wait_until_ready(5)
+    yield port
+    server.stop()
+
+
+@pytest.mark.parametrize("persistent, encoding", [(True, "json"), (False, "json"), (True, "binary")])
+def test_socket_run_counts_every_request(port, persistent, encoding):
+    build = make_requests(["1 + 1", "sqrt(16)", "1 / 0"], unique=True)
+    summary = run_socket("localhost", port, build, 30, 3, persistent, encoding)
+    assert summary["requests"] == 30
+    assert summary["errors"] == 10
+
+
+@pytest.mark.skipif(not WEBSOCKETS_AVAILABLE, reason="websockets is not installed")
+@pytest.mark.parametrize("bridge", ["simple", "websocket"])
+def test_benchmarked_bridge_logs_the_sampled_messages(port, bridge):
+    import websockets
+
+    args = argparse.Namespace(host="localhost", bridge=bridge, encoding="json", log_sample_rate=0.5)
+    websocket_port = free_port("localhost")
+    process = start_bridge(args, port, websocket_port, stderr=subprocess.PIPE)
+    try:
+        url = f"ws://localhost:{websocket_port}"
+        wait_for_bridge(url, process)
+
+        async def calculate():
+            async with websockets.connect(url) as websocket:
+                await websocket.recv()
+                for n in range(10):
+                    await websocket.send(json.dumps({"command": "calculate", "expression": f"{n} + 1"}))
+                    await websocket.recv()
+        asyncio.run(calculate())
+    finally:
+        process.send_signal(signal.SIGINT)
+        _, errors = process.communicate(timeout=10)
+    lines = errors.decode().splitlines()
+    assert len([line for line in lines if "Received" in line]) == 5
+    assert len([line for line in lines if "Sending" in line]) == 5
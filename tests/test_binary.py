@@ -0,0 +1,94 @@
+import socket
+import threading
+
+import pytest
+
+from client import CalculatorClient
+from protocol import FrameDecoder, ProtocolError, encode_message, pack, unpack
+from server import AsyncCalculatorServer, CalculatorServer, ScientificCalculator
+
+
+@pytest.mark.parametrize("value", [
+    None, True, False, 0, -1, 2 ** 63 - 1, -2 ** 63, 2 ** 64, -10 ** 40, 1.5, float("inf"),
+    "", "π ≈ 3.14", b"\x00\xff", [], [1, "two", None], {"a": {"b": [1.0, 2.0]}},
+    [0.5, None, 2.5], [None, 1.0],
+])
+def test_values_survive_a_round_trip(value):
+    assert unpack(pack(value)) == value
+
+
+def test_float_lists_are_packed_arrays():
+    data = pack([n / 7 for n in range(1000)])
+    assert data[:1] == b"a"
+    assert len(data) == 1 + 4 + 4 + 8 * 1000
+
+
+@pytest.mark.parametrize("data", [b"s\x10\x00\x00\x00abc", b"z", pack([1, 2])[:-3], pack(1) + b"\x00"])
+def test_malformed_data_is_a_protocol_error(data):
+    with pytest.raises(ProtocolError):
+        unpack(data)
+
+
+def test_unsupported_types_are_rejected():
+    with pytest.raises(TypeError):
+        pack({1, 2})
+
+
+def test_binary_frames_are_length_prefixed():
+    decoder = FrameDecoder()
+    decoder.encoding = 'binary'
+    data = encode_message({"id": 1}, 'binary') + encode_message({"id": 2}, 'binary')
+    decoder.feed(data[:5])
+    assert not decoder.has_pending() and decoder.next_message() is None
+    decoder.feed(data[5:])
+    assert decoder.next_message() == {"id": 1}
+    assert decoder.next_message() == {"id": 2}
+
+
+def test_compact_responses_carry_only_the_result():
+    calculator = ScientificCalculator()
+    assert calculator.calculate("2 + 3", compact=True) == {"success": True, "result": 5}
+    response = calculator.calculate_batch("x * 2", {"x": [1.0, 2.0]}, compact=True)
+    assert response == {"success": True, "count": 2, "results": [2.0, 4.0]}
+
+
+@pytest.fixture(params=[CalculatorServer, AsyncCalculatorServer])
+def server(request, tmp_path):
+    if not hasattr(socket, "AF_UNIX"):
+        pytest.skip("needs Unix domain sockets")
+    server = request.param(path=str(tmp_path / "calculator.sock"))
+    threading.Thread(target=server.start, daemon=True).start()
+    assert server.wait_until_ready(5)
+    yield server
+    server.stop()
+
+
+def test_client_switches_to_binary_after_hello(server):
+    client = CalculatorClient(path=server.path, encoding='binary', compact=True)
+    assert client.connect()
+    try:
+        assert client.reader.encoding == 'binary'
+        assert client.calculate("6 * 7")["result"] == 42
+        response = client.send_request({"command": "calculate_batch", "expression": "x / 2",
+                                        "variables": {"x": [1.0, 3.0, 0.0]}})
+        assert response["results"] == [0.5, 1.5, 0.0]
+    finally:
+        client.disconnect()
+
+
+def test_unknown_encoding_is_declined(server):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(server.path)
+    try:
+        sock.sendall(encode_message({"command": "hello", "encoding": "xml", "id": 1})
+                     + encode_message({"command": "calculate", "expression": "1 + 1", "id": 2}))
+        decoder = FrameDecoder()
+        responses = []
+        while len(responses) < 2:
+            decoder.feed(sock.recv(65536))
+            while (message := decoder.next_message()) is not None:
+                responses.append(message)
+    finally:
+        sock.close()
+    assert not responses[0]["success"] and responses[0]["encodings"] == ["json", "binary"]
+    assert responses[1]["result"] == 2
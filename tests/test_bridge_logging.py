@@ -0,0 +1,93 @@
+import asyncio
+import json
+import logging
+import time
+
+import pytest
+
+from bridge_logging import MAX_ERROR_LENGTH, MessageLog
+from simple_bridge import SimpleWebSocketBridge
+from websocket_bridge import WebSocketToSocketBridge
+
+
+def test_recent_requests_are_newest_first_and_limited():
+    log = MessageLog(logging.getLogger("test"), ring_size=3, keep_recent=True)
+    for n in range(5):
+        log.record("client", {"command": "calculate", "id": n}, {"success": True}, time.perf_counter())
+    recent = log.recent_requests()
+    assert [entry["id"] for entry in recent] == [4, 3, 2]
+    assert len(log.recent_requests(1)) == 1
+
+
+def test_recent_requests_are_summaries_without_payloads():
+    log = MessageLog(logging.getLogger("test"), keep_recent=True)
+    request = {"command": "calculate", "expression": "x" * 10000, "session": "secret", "id": 7}
+    log.record("client", request, {"success": False, "error": "e" * 1000}, time.perf_counter(), 10042)
+    entry, = log.recent_requests()
+    assert set(entry) == {"time", "client", "command", "id", "size", "success", "error", "elapsed_ms"}
+    assert (entry["command"], entry["id"], entry["size"], entry["success"]) == ("calculate", 7, 10042, False)
+    assert len(entry["error"]) == MAX_ERROR_LENGTH
+
+
+def test_nothing_is_kept_unless_asked():
+    log = MessageLog(logging.getLogger("test"))
+    log.record("client", {"command": "ping"}, {"success": True}, time.perf_counter())
+    assert log.recent_requests() == []
+
+
+class FakeWebSocket:
+    """Delivers the given messages and collects what the bridge sends back"""
+
+    remote_address = ("127.0.0.1", 50000)
+
+    def __init__(self, *messages):
+        self.messages = [json.dumps(message) for message in messages]
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.messages:
+            raise StopAsyncIteration
+        return self.messages.pop(0)
+
+
+@pytest.fixture(params=["simple", "websocket"])
+def serve(request):
+    """Run one fake browser connection through a bridge and return its replies"""
+    def serve(bridge_options, *messages):
+        websocket = FakeWebSocket(*messages)
+        if request.param == "simple":
+            bridge = SimpleWebSocketBridge(**bridge_options)
+            handler = bridge.handle_client
+        else:
+            bridge = WebSocketToSocketBridge(**bridge_options)
+            handler = bridge.handle_websocket_client
+        bridge.message_log.record("earlier", {"command": "ping"}, {"success": True}, time.perf_counter())
+        asyncio.run(handler(websocket))
+        return websocket.sent[1:]
+    return serve
+
+
+def test_debug_bridge_answers_bridge_stats_itself(serve):
+    stats, = serve({"debug": True}, {"command": "bridge_stats", "limit": 5})
+    assert stats["success"] and stats["type"] == "bridge_stats"
+    assert stats["clients"] == 1 and stats["upstream"]["in_flight"] == 0
+    assert stats["recent"][0]["command"] == "ping"
+
+
+def test_bridge_stats_is_forwarded_without_debug(serve):
+    # Nothing listens on this port, so a forwarded command comes back as a connection error
+    response, = serve({"socket_port": 1}, {"command": "bridge_stats"})
+    assert not response["success"]
+    assert response.get("type") != "bridge_stats"
+
+
+@pytest.mark.parametrize("bridge_class", [SimpleWebSocketBridge, WebSocketToSocketBridge])
+def test_only_debug_bridges_keep_recent_requests(bridge_class):
+    assert not bridge_class().message_log.keep_recent
+    assert bridge_class(debug=True).message_log.keep_recent
@@ -0,0 +1,35 @@
+from server import ExpressionCache
+
+
+def test_repeated_expression_is_a_hit():
+    cache = ExpressionCache(maxsize=4)
+    first = cache.compile("x + 1")
+    assert cache.compile("  x + 1 ") is first
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ExpressionCache(maxsize=2)
+    a = cache.compile("1 + 1")
+    cache.compile("2 + 2")
+    cache.compile("1 + 1")
+    cache.compile("3 + 3")
+    assert cache.stats()["evictions"] == 1
+    assert cache.compile("1 + 1") is a
+    assert cache.stats()["size"] == 2
+
+
+def test_zero_size_disables_caching():
+    cache = ExpressionCache(maxsize=0)
+    assert cache.compile("1 + 1") is not cache.compile("1 + 1")
+    assert cache.stats()["size"] == 0
+
+
+def test_long_expressions_are_not_cached():
+    cache = ExpressionCache(maxsize=4, max_length=20)
+    expression = "+".join(["1"] * 50)
+    assert cache.compile(expression).evaluate() == 50
+    assert cache.compile(expression).evaluate() == 50
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["uncached"]) == (0, 0, 2)
@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from client import CalculatorCLI, LocalCalculatorClient
+
+
+@pytest.fixture
+def local():
+    client = LocalCalculatorClient()
+    client.connect()
+    return client
+
+
+@pytest.mark.parametrize("mode, precision, expected", [
+    ("float", None, "= 0.3333333333"),
+    ("decimal", 5, "= 0.33333"),
+    ("fraction", None, "= 1/3"),
+])
+def test_interactive_mode_comes_from_the_command_line(local, capsys, mode, precision, expected):
+    cli = CalculatorCLI(local, mode, precision)
+    cli.handle_calculation("1/3")
+    assert capsys.readouterr().out.strip() == expected
+
+
+def test_mode_command_overrides_the_command_line(local, capsys):
+    cli = CalculatorCLI(local, "fraction")
+    cli.handle_command(":mode float")
+    assert (cli.mode, cli.precision) == (None, None)
+    capsys.readouterr()
+    cli.handle_calculation("1/4")
+    assert capsys.readouterr().out.strip() == "= 0.25"
+
+
+@pytest.fixture
+def expressions(tmp_path):
+    path = tmp_path / "expressions.txt"
+    path.write_text("1 + 1\n\n# a comment\n1 / 0\nx +\n2 ** 10\n")
+    return str(path)
+
+
+def test_batch_results_follow_input_lines_as_csv(local, expressions):
+    output = io.StringIO()
+    count, errors, ok = CalculatorCLI(local).run_batch(expressions, output, 'csv', window=2)
+    assert (count, errors, ok) == (4, 2, True)
+    assert list(csv.reader(io.StringIO(output.getvalue()))) == [
+        ["line", "expression", "result", "error"],
+        ["1", "1 + 1", "2", ""],
+        ["4", "1 / 0", "", "Division by zero"],
+        ["5", "x +", "", "Invalid expression"],
+        ["6", "2 ** 10", "1024", ""],
+    ]
+
+
+def test_batch_results_as_json_lines_in_a_mode(local, expressions):
+    output = io.StringIO()
+    CalculatorCLI(local).run_batch(expressions, output, 'jsonl', mode='decimal', precision=3)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert records[0] == {"line": 1, "expression": "1 + 1", "result": "2"}
+    assert records[1] == {"line": 4, "expression": "1 / 0", "error": "Division by zero"}
+    assert records[3]["result"] == "1.02E+3"
+
+
+def test_empty_input_is_not_an_error(local, tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_text("")
+    output = io.StringIO()
+    assert CalculatorCLI(local).run_batch(str(path), output, 'jsonl') == (0, 0, True)
+    assert output.getvalue() == ""
+
+
+def test_starting_the_client_does_not_load_numpy():
+    code = "import sys, client; sys.exit('numpy' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(__file__))).returncode == 0
+
+
+def test_matrix_results_come_back_as_arrays(local):
+    np = pytest.importorskip("numpy")
+    response = local.matrix("v * 2", {"v": np.array([1.0, 2.0])})
+    np.testing.assert_array_equal(response["result"], [2.0, 4.0])
@@ -0,0 +1,56 @@
+import pytest
+
+from engine import ProcessPoolEngine, is_expensive
+from expression import Num, parse, simplify
+
+
+@pytest.mark.parametrize("source", [
+    "2 ** 10",
+    "10 ** 1000",
+    "7 ** 1000",
+    "(2 + 3) ** 4",
+    "2.5 ** 100000",
+    "2 ** 0.5",
+    "pow(2, 100, 7)",
+    "factorial(20) ** 2",
+    "factorial(100)",
+])
+def test_small_results_are_cheap(source):
+    assert not is_expensive(parse(source))
+
+
+@pytest.mark.parametrize("source", [
+    "((10 ** 1000) ** 1000) ** 30",
+    "pow(10 ** 1000, 1000)",
+    "3 ** 100000",
+    "(10 ** 5000) ** 20",
+    "factorial(5000)",
+    "binomial(100000, 500)",
+])
+def test_huge_results_are_expensive(source):
+    assert is_expensive(parse(source))
+
+
+def test_huge_powers_are_not_folded():
+    tree = simplify(parse("((10 ** 1000) ** 1000) ** 30"))
+    assert not isinstance(tree, Num)
+    assert simplify(parse("(10 ** 2) ** 3")) == Num(10 ** 6)
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = ProcessPoolEngine(1, timeout=30)
+    yield engine
+    engine.close()
+
+
+def test_engine_evaluates_in_a_worker(engine):
+    response = engine.evaluate("factorial(30)")
+    assert response["success"] and response["value"] == 265252859812191058636308480000000
+
+
+def test_overrunning_worker_is_replaced(engine):
+    response = engine.evaluate("((10 ** 1000) ** 1000) ** 30", timeout=0.5)
+    assert response == {"success": False, "error": "Calculation timed out"}
+    assert engine.stats()["timeouts"] == 1
+    assert engine.evaluate("2 + 2")["value"] == 4
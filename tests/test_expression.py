@@ -0,0 +1,74 @@
+import math
+
+import pytest
+
+from expression import Binary, Call, Expression, Num, Unary, Var, parse, tokenize
+
+
+def evaluate(source, **env):
+    return Expression(source).evaluate(env)
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("2 + 3 * 4", 14),
+    ("(2 + 3) * 4", 20),
+    ("2 ** 3 ** 2", 512),
+    ("2 ^ 10", 1024),
+    ("-2 ** 2", -4),
+    ("2 ** -1", 0.5),
+    ("7 // 2 + 7 % 2", 4),
+    ("10 / 4", 2.5),
+    ("--3", 3),
+    ("sqrt(16) + log(100)", 6.0),
+    ("factorial(5)", 120),
+    ("gcd(12, 18, 8)", 2),
+    ("pi", math.pi),
+    ("π / 2", math.pi / 2),
+    ("1.5e3 + .5", 1500.5),
+])
+def test_evaluates_like_python(source, expected):
+    assert evaluate(source) == pytest.approx(expected)
+
+
+def test_integer_literals_stay_exact():
+    assert tokenize("12")[0] == ('number', 12, 0)
+    assert evaluate("2 ** 100") == 2 ** 100
+
+
+def test_tree_shape():
+    assert parse("-x + f(1, y)") == Binary('+', Unary('neg', Var('x')), Call('f', (Num(1), Var('y'))))
+
+
+def test_variables_exclude_constants_and_functions():
+    assert Expression("sin(x) * pi + y").variables == {"x", "y"}
+
+
+def test_variables_are_substituted():
+    assert evaluate("x ** 2 + y", x=3, y=1) == 10
+
+
+@pytest.mark.parametrize("source", ["2 +", "(1 + 2", "1 2", "3 $ 4", "f(1,", ""])
+def test_malformed_expressions_raise_syntax_error(source):
+    with pytest.raises(SyntaxError):
+        Expression(source)
+
+
+def test_unknown_names_raise_name_error():
+    with pytest.raises(NameError):
+        evaluate("x + 1")
+    with pytest.raises(NameError):
+        evaluate("nosuch(1)")
+
+
+def test_python_syntax_is_not_evaluated():
+    with pytest.raises(SyntaxError):
+        Expression("__import__('os')")
+    with pytest.raises(SyntaxError):
+        Expression("(1).real")
+
+
+def test_math_errors_propagate():
+    with pytest.raises(ZeroDivisionError):
+        evaluate("1 / 0")
+    with pytest.raises(ValueError):
+        evaluate("sqrt(-1)")
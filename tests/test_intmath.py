@@ -0,0 +1,55 @@
+import math
+from decimal import Decimal
+
+import pytest
+
+import intmath
+
+
+@pytest.mark.parametrize("n", [0, 1, 20, 1023, 1024, 3000])
+def test_factorial_matches_math(n):
+    assert intmath.factorial(n) == math.factorial(n)
+
+
+@pytest.mark.parametrize("n, k", [(10, 3), (1000, 500), (5000, 300), (20, 25), (7, 0)])
+def test_binomial_matches_math(n, k):
+    assert intmath.binomial(n, k) == math.comb(n, k)
+
+
+def test_integer_functions_reject_fractions():
+    with pytest.raises(ValueError):
+        intmath.factorial(2.5)
+    with pytest.raises(ValueError):
+        intmath.factorial(-1)
+
+
+def test_gcd_lcm_and_modular_power():
+    assert intmath.gcd(12, 18, 8) == 2
+    assert intmath.lcm(4, 6, 10) == 60
+    assert intmath.power(3, 200, 7) == pow(3, 200, 7)
+
+
+def test_huge_integers_are_shown_in_scientific_notation():
+    n = intmath.factorial(2000)
+    assert intmath.is_huge(n)
+    assert intmath.format_integer(n) == "3.3162750924506332412e+5735"
+    assert intmath.format_integer(12345) == "12345"
+    assert intmath.digit_count(n) == 5736
+
+
+def test_full_digits_round_trip():
+    n = -intmath.factorial(3000)
+    text = intmath.format_integer(n, full=True)
+    assert text[0] == "-" and len(text) == intmath.digit_count(n) + 1
+    assert -intmath.parse_integer(text[1:]) == n
+
+
+@pytest.mark.parametrize("text", ["0", "120", "-1.5e3", "12.000"])
+def test_decimal_to_integer_matches_int(text):
+    assert intmath.decimal_to_integer(Decimal(text)) == int(Decimal(text))
+
+
+def test_huge_decimal_to_integer():
+    n = intmath.decimal_to_integer(Decimal("-2.8242294079603478743e+456573"))
+    assert intmath.format_integer(n) == "-2.8242294079603478743e+456573"
+    assert intmath.parse_integer("7" * 9000) == int(Decimal("7" * 9000))
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import socket
+import threading
+
+import pytest
+
+from benchmark import free_port
+from client import LocalCalculatorClient
+from server import AsyncCalculatorServer, CalculatorServer
+from simple_bridge import WEBSOCKETS_AVAILABLE, SimpleWebSocketBridge
+from websocket_bridge import WebSocketToSocketBridge
+
+
+def start(component):
+    thread = threading.Thread(target=component.run if hasattr(component, "run") else component.start, daemon=True)
+    thread.start()
+    return thread
+
+
+@pytest.mark.parametrize("server_class", [CalculatorServer, AsyncCalculatorServer])
+def test_server_is_ready_once_listening(server_class):
+    server = server_class(port=free_port("localhost"))
+    start(server)
+    try:
+        assert server.wait_until_ready(5)
+        with socket.create_connection(("localhost", server.port), timeout=5):
+            pass
+    finally:
+        server.stop()
+
+
+@pytest.mark.parametrize("server_class", [CalculatorServer, AsyncCalculatorServer])
+def test_stopped_server_releases_its_port(server_class):
+    port = free_port("localhost")
+    for _ in range(2):
+        server = server_class(port=port)
+        thread = start(server)
+        assert server.wait_until_ready(5)
+        server.stop()
+        thread.join(5)
+        assert not thread.is_alive()
+
+
+@pytest.mark.parametrize("server_class", [CalculatorServer, AsyncCalculatorServer])
+def test_server_that_cannot_listen_is_not_ready(server_class):
+    with socket.socket() as taken:
+        taken.bind(("localhost", 0))
+        taken.listen()
+        server = server_class(port=taken.getsockname()[1])
+        thread = start(server)
+        assert not server.wait_until_ready(5)
+        thread.join(5)
+        assert not thread.is_alive()
+
+
+@pytest.mark.skipif(not WEBSOCKETS_AVAILABLE, reason="websockets is not installed")
+@pytest.mark.parametrize("bridge_class", [SimpleWebSocketBridge, WebSocketToSocketBridge])
+def test_bridge_is_ready_once_listening_and_fails_on_a_taken_port(bridge_class):
+    import websockets
+
+    server = CalculatorServer(port=free_port("localhost"))
+    start(server)
+    assert server.wait_until_ready(5)
+    port = free_port("localhost")
+    bridge = bridge_class(websocket_port=port, socket_port=server.port)
+    start(bridge)
+    try:
+        assert bridge.wait_until_ready(5)
+
+        async def calculate():
+            async with websockets.connect(f"ws://localhost:{port}") as websocket:
+                await websocket.recv()
+                await websocket.send(json.dumps({"command": "calculate", "expression": "6 * 7"}))
+                return json.loads(await websocket.recv())
+        assert asyncio.run(calculate())["result"] == 42
+
+        second = bridge_class(websocket_port=port, socket_port=server.port)
+        start(second)
+        assert not second.wait_until_ready(5)
+    finally:
+        server.stop()
+
+
+def test_local_client_keeps_a_session_of_its_own():
+    server = CalculatorServer()
+    first, second = LocalCalculatorClient(server), LocalCalculatorClient(server)
+    assert not first.calculate("1 + 1")["success"]
+    first.connect()
+    second.connect()
+    first.memory_operation("store", 3)
+    assert first.memory_operation("recall")["memory"] == 3
+    assert second.memory_operation("recall")["memory"] == 0
+    first.disconnect()
+    assert server.sessions.stats()["active"] == 1
+
+
+def test_local_client_streams_tabulate_chunks():
+    client = LocalCalculatorClient()
+    client.connect()
+    chunks = list(client.tabulate("x * 2", "x", 0, 4, 1, chunk_size=2))
+    assert [value for chunk in chunks[:-1] for value in chunk["results"]] == [0, 2, 4, 6, 8]
+    assert chunks[-1]["done"] and len({chunk["id"] for chunk in chunks}) == 1
+    assert client.server.stats()["requests"]["tabulate"] == 1
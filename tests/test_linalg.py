@@ -0,0 +1,79 @@
+import base64
+import json
+
+import pytest
+
+from expression import Expression, parse
+from linalg import evaluate, pack_array, unpack_array, uses_arrays
+from protocol import json_default, pack, unpack
+from server import CalculatorServer
+from vectorized import NUMPY_AVAILABLE, np
+
+pytestmark = pytest.mark.skipif(not NUMPY_AVAILABLE, reason="NumPy is not installed")
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("[1, 2] + x", True), ("x + 1", False), ("a @ b", True), ("det(m) + 1", True), ("sin(x) * 2", False),
+    ("-(transpose(m))", True),
+])
+def test_array_expressions_are_recognised(source, expected):
+    assert uses_arrays(parse(source)) is expected
+
+
+@pytest.mark.parametrize("source, variables, expected", [
+    ("[1, 2, 3] * 2", {}, [2.0, 4.0, 6.0]),
+    ("[[1, 2], [3, 4]] @ [1, 1]", {}, [3.0, 7.0]),
+    ("dot(v, v)", {"v": [3, 4]}, 25.0),
+    ("det([[2, 0], [0, 3]])", {}, 6.0),
+    ("inv(m) @ m", {"m": [[4, 7], [2, 6]]}, [[1.0, 0.0], [0.0, 1.0]]),
+    ("solve(m, [1, 2])", {"m": [[1, 0], [0, 2]]}, [1.0, 1.0]),
+    ("sqrt(v) + 1", {"v": [4, 9]}, [3.0, 4.0]),
+    ("transpose([[1, 2, 3]])", {}, [[1.0], [2.0], [3.0]]),
+])
+def test_matrix_expressions_evaluate_with_numpy(source, variables, expected):
+    result = evaluate(Expression(source), variables)
+    np.testing.assert_allclose(result, expected, atol=1e-12)
+
+
+@pytest.mark.parametrize("source, variables", [
+    ("[[1, 2], [3]]", {}),
+    ("inv([[1, 2], [2, 4]])", {}),
+    ("det(m)", {"m": "text"}),
+    ("dot(v, v)", {}),
+])
+def test_invalid_arrays_raise(source, variables):
+    with pytest.raises((ValueError, NameError)):
+        evaluate(Expression(source), variables)
+
+
+def test_packed_arrays_round_trip_through_both_encodings():
+    array = np.arange(6, dtype=np.float64).reshape(2, 3) / 7
+    packed = pack_array(array)
+    assert packed["shape"] == [2, 3] and len(packed["data"]) == 48
+    np.testing.assert_array_equal(unpack_array(unpack(pack(packed))), array)
+    text = json.loads(json.dumps(packed, default=json_default))
+    np.testing.assert_array_equal(unpack_array(text), array)
+
+
+@pytest.mark.parametrize("packed", [
+    {"dtype": "int32", "shape": [1], "data": b"\0" * 8},
+    {"shape": [2], "data": b"\0" * 8},
+    {"shape": [-1], "data": b""},
+    {"shape": [True], "data": b"\0" * 8},
+    {"shape": [1], "data": "not base64!"},
+    {"shape": [10 ** 9], "data": b""},
+])
+def test_malformed_packed_arrays_are_rejected(packed):
+    with pytest.raises(ValueError):
+        unpack_array(packed)
+
+
+def test_matrix_command_packs_array_results():
+    server = CalculatorServer()
+    data = base64.b64encode(np.array([1.0, 2.0]).tobytes()).decode()
+    response = server.handle_request({"command": "matrix", "expression": "v * 2",
+                                      "variables": {"v": {"dtype": "float64", "shape": [2], "data": data}}})
+    assert response["success"] and response["shape"] == [2]
+    np.testing.assert_array_equal(unpack_array(response["result"]), [2.0, 4.0])
+    response = server.handle_request({"command": "calculate", "expression": "det([[1, 2], [3, 4]])"})
+    assert response["result"] == pytest.approx(-2.0)
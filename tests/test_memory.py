@@ -0,0 +1,80 @@
+import pytest
+
+from server import ScientificCalculator
+
+
+@pytest.fixture
+def calculator():
+    return ScientificCalculator()
+
+
+def memory(calculator, operation, value=None):
+    return calculator.memory_operation(operation, value)
+
+
+def test_store_recall_add_clear(calculator):
+    assert memory(calculator, "store", 42)["memory"] == 42
+    assert memory(calculator, "add", 8)["memory"] == 50
+    assert memory(calculator, "recall")["memory"] == 50
+    assert memory(calculator, "clear")["memory"] == 0
+
+
+def test_missing_value_uses_last_result(calculator):
+    calculator.calculate("6 * 7")
+    assert memory(calculator, "store")["memory"] == 42
+    assert memory(calculator, "add")["memory"] == 84
+
+
+@pytest.mark.parametrize("mode, expression, stored", [
+    ("float", "1 / 4", 0.25),
+    ("decimal", "1 / 4", 0.25),
+    ("decimal", "2 ** 70", 2 ** 70),
+    ("fraction", "1 / 4", 0.25),
+    ("fraction", "10 / 2", 5),
+])
+def test_results_of_every_mode_are_stored_as_numbers(calculator, mode, expression, stored):
+    result = calculator.calculate(expression, mode=mode)["result"]
+    assert memory(calculator, "store", result)["memory"] == stored
+    assert memory(calculator, "add", result)["memory"] == 2 * stored
+    calculator.calculate(expression, mode=mode)
+    assert memory(calculator, "add")["memory"] == 3 * stored
+
+
+@pytest.mark.parametrize("text, number", [
+    ("0.1", 0.1),
+    ("-12", -12),
+    ("1/3", 1 / 3),
+    ("-6/3", -2),
+    ("1.5e3", 1500),
+])
+def test_text_values_are_converted(calculator, text, number):
+    assert memory(calculator, "store", text)["memory"] == pytest.approx(number)
+    assert type(calculator.memory) is type(number)
+
+
+@pytest.mark.parametrize("value", ["abc", "", "1/0", "1.5/2", "nan", "inf", True, [1], {"a": 1},
+                                   "1e999999999"])
+def test_invalid_values_are_errors(calculator, value):
+    memory(calculator, "store", 7)
+    for operation in ("store", "add"):
+        response = memory(calculator, operation, value)
+        assert not response["success"] and response["error"]
+    assert calculator.memory == 7
+
+
+def test_unknown_operation(calculator):
+    assert memory(calculator, "swap") == {"success": False, "error": "Invalid memory operation"}
+
+
+def test_huge_integer_text_is_stored_as_an_integer(calculator):
+    text = calculator.calculate("factorial(100000)")["result"]
+    assert text == "2.8242294079603478743e+456573"
+    assert memory(calculator, "store", text)["memory"] == text
+    assert isinstance(calculator.memory, int)
+    assert memory(calculator, "add")["memory"].startswith("5.6484588159206957")
+
+
+def test_full_digits_are_stored_exactly(calculator):
+    text = calculator.calculate("factorial(3000)", full=True)["result"]
+    memory(calculator, "store", text)
+    assert calculator.memory == calculator.last_result
@@ -0,0 +1,104 @@
+import urllib.request
+
+import pytest
+
+from benchmark import free_port
+from metrics import BUCKET_MINIMUM, Histogram, Metrics
+from expression import FUNCTIONS
+from server import CalculatorServer
+
+
+@pytest.mark.parametrize("value, bucket", [
+    (0.0, 0), (BUCKET_MINIMUM, 0), (BUCKET_MINIMUM * 1.5, 1), (BUCKET_MINIMUM * 2, 1), (BUCKET_MINIMUM * 2.5, 2),
+    (BUCKET_MINIMUM * 4, 2), (1e9, 21),
+])
+def test_samples_land_in_the_first_bucket_whose_bound_covers_them(value, bucket):
+    histogram = Histogram()
+    histogram.observe(value)
+    assert histogram.counts.index(1) == bucket
+    assert bucket == len(histogram.bounds) or value <= histogram.bounds[bucket]
+
+
+@pytest.mark.parametrize("value, bucket", [(0.5, 0), (0.75, 1), (1.0, 1), (2.0, 2), (2.5, 3)])
+def test_samples_on_a_bound_belong_to_its_bucket(value, bucket):
+    histogram = Histogram(minimum=0.5, buckets=4)
+    histogram.observe(value)
+    assert histogram.counts.index(1) == bucket
+
+
+def test_quantiles_interpolate_within_buckets():
+    histogram = Histogram()
+    for _ in range(100):
+        histogram.observe(0.003)
+    assert histogram.bounds[8] < histogram.quantile(0.5) <= histogram.bounds[9]
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_snapshot_counts_requests_failures_and_errors():
+    metrics = Metrics()
+    metrics.record_request("calculate", 0.001, True)
+    metrics.record_request("calculate", 0.002, False)
+    metrics.record_error("ZeroDivisionError")
+    metrics.record_phases("sin", (("parse", 0.0001), ("evaluate", 0.0002)))
+    snapshot = metrics.snapshot()
+    assert snapshot["requests"] == {"calculate": 2} and snapshot["failures"] == {"calculate": 1}
+    assert snapshot["errors"] == {"ZeroDivisionError": 1}
+    assert snapshot["latency"]["function"]["sin"]["count"] == 1
+    assert set(snapshot["latency"]["phase"]) == {"parse", "evaluate"}
+
+
+def test_merge_adds_another_registry():
+    first, second = Metrics(), Metrics()
+    first.record_request("ping", 0.001, True)
+    second.record_request("ping", 0.001, True)
+    second.connection_opened()
+    first.merge(second.export(), gauges=False)
+    assert first.requests == {"ping": 2} and first.commands["ping"].count == 2
+    assert first.connections == 1 and first.active_connections == 0
+
+
+def test_prometheus_histograms_are_cumulative():
+    metrics = Metrics()
+    metrics.record_request('say "hi"', 0.001, True)
+    text = metrics.prometheus({"cache_size": 3})
+    assert 'calculator_requests_total{command="say \\"hi\\""} 1' in text
+    assert 'calculator_request_seconds_bucket{command="say \\"hi\\"",le="+Inf"} 1' in text
+    assert "calculator_cache_size 3" in text
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in text.splitlines()
+               if line.startswith("calculator_request_seconds_bucket")]
+    assert buckets == sorted(buckets)
+
+
+def test_stats_command_reports_server_counters():
+    server = CalculatorServer()
+    server.handle_request({"command": "calculate", "expression": "sin(1) + 1"})
+    server.handle_request({"command": "calculate", "expression": "1 / 0"})
+    server.handle_request({"command": "frobnicate"})
+    stats = server.handle_request({"command": "stats"})["stats"]
+    assert stats["requests"] == {"calculate": 2, "unknown": 1}
+    assert stats["errors"] == {"ZeroDivisionError": 1}
+    assert stats["cache"]["misses"] == 2
+    assert "sin" in stats["latency"]["function"]
+
+
+def test_made_up_function_names_share_one_label():
+    server = CalculatorServer(process_workers=1)
+    try:
+        for n in range(5):
+            server.handle_request({"command": "calculate", "expression": f"made_up_{n}(3 ** 100000)"})
+        server.handle_request({"command": "calculate", "expression": "factorial(2000)"})
+        labels = set(server.handle_request({"command": "stats"})["stats"]["latency"]["function"])
+    finally:
+        server.close_resources()
+    assert "factorial" in labels and "other" in labels
+    assert labels <= set(FUNCTIONS) | {"other", "none"}
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    server = CalculatorServer(metrics_port=free_port("localhost"))
+    server.start_metrics_endpoint()
+    try:
+        with urllib.request.urlopen(f"http://localhost:{server.metrics_port}/metrics", timeout=5) as response:
+            assert "calculator_requests_total" in response.read().decode()
+    finally:
+        server.close_resources()
@@ -0,0 +1,70 @@
+import math
+
+import pytest
+
+from expression import (FUNCTIONS, Binary, Call, Num, Var, compile_optimized, compile_tree, hoist_common, parse,
+                        simplify)
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("2 * 3 + x", Binary('+', Num(6), Var('x'))),
+    ("pi * x", Binary('*', Num(math.pi), Var('x'))),
+    ("sqrt(16) - x", Binary('-', Num(4.0), Var('x'))),
+    ("x * 1", Var('x')),
+    ("1 * x ** 1", Var('x')),
+    ("x - 0", Var('x')),
+    ("--x", Var('x')),
+    ("+x", Var('x')),
+    ("x + -y", Binary('-', Var('x'), Var('y'))),
+    ("x - -y", Binary('+', Var('x'), Var('y'))),
+])
+def test_constants_fold_and_exact_identities_drop(source, expected):
+    assert simplify(parse(source)) == expected
+
+
+@pytest.mark.parametrize("source", ["x + 0", "x * 0", "x * 1.0", "2 * x * 3", "1 / 0 + x", "factorial(5000) + x"])
+def test_rewrites_that_could_change_a_result_are_not_made(source):
+    assert simplify(parse(source)) == parse(source)
+
+
+def test_hoisting_binds_each_repeated_subtree_once():
+    bindings, body = hoist_common(parse("sin(x + 1) * sin(x + 1) + (x + 1)"))
+    assert bindings == [("$0", Binary('+', Var('x'), Num(1))), ("$1", Call('sin', (Var('$0'),)))]
+    assert body == Binary('+', Binary('*', Var('$1'), Var('$1')), Var('$0'))
+
+
+@pytest.mark.parametrize("source", ["(x + 1) * (x + 1.0)", "(x * 0.0) + (x * -0.0)", "x * y + y * x"])
+def test_only_identical_subtrees_are_shared(source):
+    assert hoist_common(parse(source)) == ([], parse(source))
+
+
+def test_shared_subexpressions_are_evaluated_once():
+    calls = []
+
+    def traced_sin(value):
+        calls.append(value)
+        return math.sin(value)
+
+    functions = dict(FUNCTIONS, sin=traced_sin)
+    evaluate = compile_optimized(parse("sin(x) ** 2 + sin(x) * 2"), functions)
+    assert evaluate({"x": 0.5}) == pytest.approx(math.sin(0.5) ** 2 + math.sin(0.5) * 2)
+    assert calls == [0.5]
+
+
+@pytest.mark.parametrize("source", [
+    "(x + 1) ** 2 / (x + 1) - sqrt(x + 1)",
+    "-(-x) * 1 + 0 * x",
+    "factorial(3) * x - x * 1.0 + -(-2)",
+    "exp(x) / (1 + exp(x))",
+])
+@pytest.mark.parametrize("x", [0.0, -0.0, 2, 3.5, math.inf])
+def test_optimized_code_agrees_with_the_plain_tree(source, x):
+    tree = parse(source)
+    try:
+        expected = compile_tree(tree)({"x": x})
+    except (ArithmeticError, ValueError) as error:
+        with pytest.raises(type(error)):
+            compile_optimized(tree)({"x": x})
+        return
+    actual = compile_optimized(tree)({"x": x})
+    assert repr(actual) == repr(expected)
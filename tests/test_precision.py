@@ -0,0 +1,52 @@
+import pytest
+
+from server import ScientificCalculator
+
+
+def calculate(expression, mode, precision=None):
+    return ScientificCalculator().calculate(expression, True, mode, precision)
+
+
+@pytest.mark.parametrize("expression, precision, expected", [
+    ("0.1 + 0.2", None, "0.3"),
+    ("1 / 3", 50, "0." + "3" * 50),
+    ("sqrt(2)", 40, "1.41421356237309504880168872420969807857"),
+    ("pi", 40, "3.141592653589793238462643383279502884197"),
+    ("atan(1) * 4", 40, "3.141592653589793238462643383279502884197"),
+    ("exp(1)", 30, "2.71828182845904523536028747135"),
+    ("ln(10)", 30, "2.30258509299404568401799145468"),
+    ("2 * sin(pi / 6)", 30, "1"),
+    ("0.1*3 - 0.3", 15, "0"),
+    ("(1+1e-15)-1", 15, "1E-15"),
+    ("1e16 + 1 - 1e16", 15, "1"),
+])
+def test_decimal_mode_gives_the_requested_digits(expression, precision, expected):
+    assert calculate(expression, "decimal", precision) == {"success": True, "result": expected}
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("1/3 + 1/6", "1/2"),
+    ("0.1 * 3", "3/10"),
+    ("2 ** -2", "1/4"),
+    ("sqrt(9/4)", "3/2"),
+    ("factorial(30) / factorial(28)", "870"),
+])
+def test_fraction_mode_is_exact(expression, expected):
+    assert calculate(expression, "fraction") == {"success": True, "result": expected}
+
+
+@pytest.mark.parametrize("expression, mode, precision, error", [
+    ("sqrt(2)", "fraction", None, "Math error: Result is irrational; use decimal mode"),
+    ("1 / 0", "fraction", None, "Division by zero"),
+    ("1", "decimal", 0, "Precision must be an integer from 1 to 1000"),
+    ("1", "decimal", True, "Precision must be an integer from 1 to 1000"),
+    ("1", "hex", None, "Unknown mode 'hex'; expected one of float, decimal, fraction"),
+])
+def test_mode_errors(expression, mode, precision, error):
+    assert calculate(expression, mode, precision) == {"success": False, "error": error}
+
+
+def test_full_response_names_the_mode():
+    response = ScientificCalculator().calculate("1 / 7", mode="decimal", precision=5)
+    assert response["mode"] == "decimal" and response["precision"] == 5
+    assert response["formatted_result"] == response["result"] == "0.14286"
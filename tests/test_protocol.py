@@ -0,0 +1,115 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from client import CalculatorClient
+from protocol import FrameDecoder, MessageReader, ProtocolError, encode_message
+from server import AsyncCalculatorServer, CalculatorServer
+
+
+def decode_all(decoder):
+    messages = []
+    while (message := decoder.next_message()) is not None:
+        messages.append(message)
+    return messages
+
+
+def test_messages_split_across_reads_are_reassembled():
+    data = encode_message({"command": "ping", "id": 1}) + encode_message({"command": "ping", "id": 2})
+    decoder = FrameDecoder()
+    received = []
+    for index in range(len(data)):
+        decoder.feed(data[index:index + 1])
+        received += decode_all(decoder)
+    assert [message["id"] for message in received] == [1, 2]
+
+
+def test_has_pending_sees_only_complete_messages():
+    decoder = FrameDecoder()
+    decoder.feed(b'{"id": 1}\n{"id"')
+    assert decoder.has_pending()
+    assert decoder.next_message() == {"id": 1}
+    assert not decoder.has_pending()
+
+
+def test_blank_lines_are_skipped():
+    decoder = FrameDecoder()
+    decoder.feed(b'\n\r\n{"id": 3}\n')
+    assert decode_all(decoder) == [{"id": 3}]
+
+
+def test_bare_json_object_without_newline_is_accepted():
+    decoder = FrameDecoder()
+    decoder.feed(b'{"command": "ping", "note": "}"')
+    assert decoder.next_message() is None
+    decoder.feed(b'}')
+    assert decoder.next_message() == {"command": "ping", "note": "}"}
+
+
+def test_oversized_message_is_a_protocol_error():
+    decoder = FrameDecoder(max_message_size=16)
+    decoder.feed(b'{"padding": "' + b"x" * 32)
+    with pytest.raises(ProtocolError):
+        decoder.next_message()
+
+
+def test_malformed_line_is_consumed():
+    decoder = FrameDecoder()
+    decoder.feed(b'{oops\n{"id": 4}\n')
+    with pytest.raises(json.JSONDecodeError):
+        decoder.next_message()
+    assert decoder.next_message() == {"id": 4}
+
+
+@pytest.fixture(params=[CalculatorServer, AsyncCalculatorServer])
+def server(request, tmp_path):
+    if not hasattr(socket, "AF_UNIX"):
+        pytest.skip("needs Unix domain sockets")
+    server = request.param(path=str(tmp_path / "calculator.sock"))
+    threading.Thread(target=server.start, daemon=True).start()
+    assert server.wait_until_ready(5)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def connection(server):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(server.path)
+    yield sock, MessageReader(sock)
+    sock.close()
+
+
+def test_pipelined_requests_are_answered_in_order_with_their_ids(connection):
+    sock, reader = connection
+    requests = [{"command": "calculate", "expression": f"{n} * 2", "id": f"r{n}"} for n in range(20)]
+    sock.sendall(b"".join(encode_message(request) for request in requests))
+    responses = [reader.read() for _ in requests]
+    assert [response["id"] for response in responses] == [request["id"] for request in requests]
+    assert [response["result"] for response in responses] == [n * 2 for n in range(20)]
+
+
+def test_invalid_json_does_not_end_the_connection(connection):
+    sock, reader = connection
+    sock.sendall(b'not json\n{"command": "calculate", "expression": "1 + 1", "id": 1}\n')
+    assert reader.read() == {"success": False, "error": "Invalid JSON format"}
+    assert reader.read()["result"] == 2
+
+
+def test_legacy_client_without_newline_gets_an_answer(connection):
+    sock, reader = connection
+    sock.sendall(json.dumps({"command": "calculate", "expression": "6 * 7"}).encode())
+    assert reader.read()["result"] == 42
+
+
+def test_client_pipeline_keeps_request_order(server):
+    client = CalculatorClient(path=server.path)
+    assert client.connect()
+    try:
+        requests = [{"command": "calculate", "expression": f"{n} ** 2"} for n in range(200)]
+        results = [response["result"] for response in client.pipeline(requests, window=16)]
+    finally:
+        client.disconnect()
+    assert results == [n ** 2 for n in range(200)]
@@ -0,0 +1,81 @@
+import math
+
+import pytest
+
+import quadrature
+import vectorized
+from expression import Expression
+from quadrature import NODES
+from server import ScientificCalculator
+
+
+@pytest.fixture(params=["numpy", "scalar"])
+def integrate(request, monkeypatch):
+    """integrate() with and without the vectorized path"""
+    if request.param == "numpy":
+        if not vectorized.NUMPY_AVAILABLE:
+            pytest.skip("NumPy is not installed")
+    else:
+        monkeypatch.setattr(quadrature, "NUMPY_AVAILABLE", False)
+    return lambda source, lower, upper, **options: quadrature.integrate(Expression(source), lower, upper, **options)
+
+
+@pytest.mark.parametrize("source, lower, upper, expected", [
+    ("x ** 3 - 2 * x", 0, 2, 0.0),
+    ("sin(x)", 0, math.pi, 2.0),
+    ("exp(-x ** 2)", "-inf", "inf", math.sqrt(math.pi)),
+    ("1 / (1 + x ** 2)", 0, float("inf"), math.pi / 2),
+    ("exp(x)", "-inf", 0, 1.0),
+    ("sqrt(x)", 0, 1, 2 / 3),
+    ("sin(x)", math.pi, 0, -2.0),
+])
+def test_integrals_meet_the_tolerance(integrate, source, lower, upper, expected):
+    result = integrate(source, lower, upper)
+    assert result["converged"]
+    assert result["value"] == pytest.approx(expected, rel=1e-9, abs=1e-10)
+    assert result["error_estimate"] <= 1e-10 * max(1.0, abs(expected))
+
+
+def test_polynomials_take_one_interval(integrate):
+    result = integrate("x ** 5 - x", -1, 3)
+    assert (result["intervals"], result["evaluations"]) == (1, len(NODES))
+    assert result["value"] == pytest.approx(3 ** 6 / 6 - 1 / 6 - 4)
+
+
+def test_empty_interval_is_zero(integrate):
+    assert integrate("1 / x", 1, 1)["value"] == 0.0
+
+
+def test_evaluation_budget_stops_early(integrate):
+    result = integrate("sin(1 / x)", 0.001, 1, max_evaluations=200)
+    assert not result["converged"] and result["evaluations"] <= 200
+
+
+def test_integrand_that_is_not_finite_fails(integrate):
+    with pytest.raises(ValueError, match="not finite"):
+        integrate("1 / x", -1, 1)
+
+
+@pytest.mark.parametrize("options", [
+    {"lower": "nan"}, {"lower": True}, {"upper": [1]}, {"abs_tolerance": -1}, {"max_evaluations": 5},
+    {"max_evaluations": 1.5},
+])
+def test_bad_arguments_are_value_errors(options):
+    arguments = dict(lower=0, upper=1)
+    arguments.update(options)
+    with pytest.raises(ValueError):
+        quadrature.integrate(Expression("x"), **arguments)
+
+
+def test_variable_must_be_named_when_ambiguous():
+    with pytest.raises(ValueError):
+        quadrature.integrate(Expression("x * y"), 0, 1)
+    with pytest.raises(NameError):
+        quadrature.integrate(Expression("x * y"), 0, 1, "x")
+
+
+def test_integrate_command_response():
+    response = ScientificCalculator().integrate("x ** 2", 0, 3)
+    assert response["success"] and response["value"] == pytest.approx(9.0)
+    assert response["expression"] == "x ** 2"
+    assert not ScientificCalculator().integrate("x ** 2", 0, "ten")["success"]
@@ -0,0 +1,83 @@
+import asyncio
+
+from server import CalculatorServer
+from sessions import UNKNOWN_SESSION, SessionStore
+from upstream import UpstreamSession
+
+
+def test_unknown_tokens_are_not_created():
+    store = SessionStore(dict)
+    assert store.get("chosen-by-client") is None
+    assert store.stats()["active"] == 0
+    token = store.create()
+    assert store.get(token) is store.get(token)
+
+
+def test_idle_sessions_expire():
+    store = SessionStore(dict, idle_timeout=0)
+    token = store.create()
+    assert store.get(token) is None
+    assert store.stats()["expired"] == 1
+
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore(dict, max_sessions=2)
+    first, second = store.create(), store.create()
+    store.get(first)
+    store.create()
+    assert store.get(second) is None
+    assert store.get(first) is not None
+
+
+def test_server_rejects_tokens_it_did_not_issue():
+    server = CalculatorServer()
+    response = server.handle_request({"command": "memory", "operation": "store", "value": 1,
+                                      "session": "made-up", "id": 7})
+    assert response == {"success": False, "error": UNKNOWN_SESSION, "id": 7}
+    assert server.sessions.stats()["active"] == 0
+    chunks = list(server.tabulate_chunks({"command": "tabulate", "expression": "x", "session": "made-up"}))
+    assert chunks[-1]["done"] and chunks[-1]["error"] == UNKNOWN_SESSION
+
+
+def test_issued_token_shares_state_across_connections():
+    server = CalculatorServer()
+    token = server.handle_request({"command": "session"})["session"]
+    one, other = server.sessions.create(), server.sessions.create()
+    server.handle_request({"command": "memory", "operation": "store", "value": 5, "session": token}, one)
+    response = server.handle_request({"command": "memory", "operation": "recall", "session": token}, other)
+    assert response["success"] and response["memory"] == 5
+
+
+def test_connection_session_is_recreated_after_eviction():
+    server = CalculatorServer()
+    connection = server.sessions.create()
+    server.sessions.remove(connection)
+    assert server.handle_request({"command": "memory", "operation": "recall"}, connection)["success"]
+    assert server.sessions.get(connection) is not None
+
+
+class FakePool:
+    """Answers session requests the way a server that issues numbered tokens would"""
+
+    def __init__(self):
+        self.issued = 0
+
+    async def request(self, request, timeout=None):
+        self.issued += 1
+        return {"success": True, "session": f"token-{self.issued}"}
+
+
+def test_upstream_session_is_opened_once_and_reopened_when_forgotten():
+    async def run():
+        session = UpstreamSession(FakePool())
+        request = await session.attach({"command": "ping"})
+        assert request["session"] == "token-1"
+        assert (await session.attach({"command": "ping"}))["session"] == "token-1"
+        assert not session.forgotten(request, {"success": True})
+        assert session.forgotten(request, {"success": False, "error": UNKNOWN_SESSION})
+        assert (await session.attach(request))["session"] == "token-2"
+        explicit = await session.attach({"command": "ping", "session": "shared"})
+        assert explicit["session"] == "shared"
+        assert not session.forgotten(explicit, {"success": False, "error": UNKNOWN_SESSION})
+
+    asyncio.run(run())
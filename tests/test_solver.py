@@ -0,0 +1,96 @@
+import math
+
+import pytest
+
+import solver
+import vectorized
+from expression import Expression, compile_tree, parse
+from server import ScientificCalculator
+from solver import brent, derivative, solve
+
+
+@pytest.mark.parametrize("source", [
+    "x ** 3 - 2 * x", "sin(x) * cos(x)", "exp(-x ** 2)", "ln(x) / x", "x ** x", "2 ** x", "sqrt(x + 1)",
+    "tan(x) - atan(x)", "pow(x, 2.5)", "-x / (1 + x ** 2)",
+])
+@pytest.mark.parametrize("x", [0.3, 1.7])
+def test_derivative_matches_a_central_difference(source, x):
+    slope = compile_tree(derivative(parse(source), "x"))
+    f = compile_tree(parse(source))
+    h = 1e-6
+    expected = (f({"x": x + h}) - f({"x": x - h})) / (2 * h)
+    assert slope({"x": x}) == pytest.approx(expected, rel=1e-6, abs=1e-8)
+
+
+def test_derivative_of_a_constant_is_zero():
+    assert derivative(parse("y ** 2 + 3"), "x") == parse("0")
+
+
+def test_brent_finds_a_root_inside_the_bracket():
+    root, iterations = brent(lambda x: x ** 3 - x - 2, 1, 2)
+    assert root == pytest.approx(1.5213797068045676, abs=1e-12)
+    assert 0 < iterations < 20
+
+
+def test_brent_accepts_a_root_at_an_end():
+    assert brent(lambda x: x - 1, 1, 2) == (1.0, 0)
+
+
+@pytest.mark.parametrize("options, message", [
+    ({"bracket": [2, 3]}, "change sign"),
+    ({"bracket": [1]}, "pair"),
+    ({}, "bracket, a start"),
+    ({"start": 0.0}, "Derivative is zero"),
+    ({"start": 1.0, "tolerance": 0}, "Tolerance"),
+    ({"start": 1.0, "max_iterations": 0}, "max_iterations"),
+])
+def test_bad_requests_raise_value_error(options, message):
+    with pytest.raises(ValueError, match=message):
+        solve(Expression("x ** 2 - 2"), **options)
+
+
+def test_variable_must_be_named_when_ambiguous():
+    with pytest.raises(ValueError):
+        solve(Expression("x - y"), start=1.0)
+    with pytest.raises(NameError):
+        solve(Expression("x - y"), "x", start=1.0)
+
+
+def test_newton_from_one_start():
+    result = solve(Expression("cos(x) - x"), start=1.0)
+    assert result["method"] == "newton"
+    assert result["root"] == pytest.approx(0.7390851332151607, abs=1e-12)
+    assert abs(result["value"]) < 1e-12
+
+
+@pytest.fixture(params=["numpy", "scalar"])
+def many(request, monkeypatch):
+    """Newton's method from many starts with and without the vectorized path"""
+    if request.param == "numpy":
+        if not vectorized.NUMPY_AVAILABLE:
+            pytest.skip("NumPy is not installed")
+    else:
+        monkeypatch.setattr(solver, "NUMPY_AVAILABLE", False)
+    return lambda source, starts: solve(Expression(source), starts=starts)
+
+
+def test_each_start_converges_to_its_nearest_root(many):
+    result = many("x ** 2 - 4", [1.0, -3.0, 10.0])
+    assert result["roots"] == pytest.approx([2.0, -2.0, 2.0])
+    assert (result["count"], result["converged"]) == (3, 3)
+
+
+def test_failing_starts_yield_none(many):
+    result = many("x ** 2 - 4", [0.0, 3.0, math.nan])
+    assert result["roots"][0] is None and result["roots"][2] is None
+    assert result["roots"][1] == pytest.approx(2.0)
+    assert result["converged"] == 1
+
+
+def test_solve_command_reports_errors_as_responses():
+    calculator = ScientificCalculator()
+    response = calculator.solve("x ** 2 - 2", bracket=[0, 2])
+    assert response["success"] and response["root"] == pytest.approx(math.sqrt(2))
+    assert response["expression"] == "x ** 2 - 2" and response["method"] == "brent"
+    response = calculator.solve("x ** 2 + 1", bracket=[0, 2])
+    assert not response["success"] and "change sign" in response["error"]
@@ -0,0 +1,86 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from client import CalculatorClient
+from server import AsyncCalculatorServer, CalculatorServer
+from sessions import UNKNOWN_SESSION
+from supervisor import SessionRouter, Supervisor
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix domain sockets")
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    """Two workers of a supervised server, started in-process"""
+    peers = [str(tmp_path / f"worker-{index}.sock") for index in range(2)]
+    servers = [CalculatorServer(path=str(tmp_path / f"public-{index}.sock"), shard=index, peers=peers)
+               for index in range(2)]
+    for server in servers:
+        threading.Thread(target=server.start, daemon=True).start()
+        assert server.wait_until_ready(5)
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+def test_tokens_name_the_worker_that_issued_them(cluster):
+    assert cluster[0].sessions.create().startswith("0.")
+    assert cluster[1].sessions.create().startswith("1.")
+
+
+def test_request_for_another_workers_session_is_forwarded(cluster):
+    token = cluster[1].handle_request({"command": "session"})["session"]
+    response = cluster[0].handle_request({"command": "memory", "operation": "store", "value": 42,
+                                          "session": token, "id": 9})
+    assert response == {"success": True, "memory": 42, "operation": "stored", "id": 9}
+    assert cluster[1].sessions.get(token).memory == 42
+    chunks = list(cluster[0].tabulate_chunks({"command": "tabulate", "expression": "x", "stop": 2,
+                                              "session": token}))
+    assert chunks[-1]["done"] and chunks[-1]["count"] == 3
+
+
+def test_forwarded_connections_are_reused(cluster):
+    token = cluster[1].sessions.create()
+    for _ in range(3):
+        assert cluster[0].handle_request({"command": "ping", "session": token})["success"]
+    assert len(cluster[0].router._idle[1]) == 1
+
+
+def test_forwarding_from_the_asyncio_server(cluster, tmp_path):
+    token = cluster[1].sessions.create()
+    cluster[1].handle_request({"command": "memory", "operation": "store", "value": 7, "session": token})
+    server = AsyncCalculatorServer(path=str(tmp_path / "async.sock"), shard=0,
+                                   peers=[str(tmp_path / "async-peer.sock"), cluster[1].router.path])
+    threading.Thread(target=server.start, daemon=True).start()
+    assert server.wait_until_ready(5)
+    try:
+        client = CalculatorClient(path=server.path, session=token)
+        assert client.connect()
+        assert client.memory_operation("recall")["memory"] == 7
+        client.disconnect()
+    finally:
+        server.stop()
+
+
+def test_unreachable_worker_has_lost_its_sessions(tmp_path):
+    router = SessionRouter([str(tmp_path / "0.sock"), str(tmp_path / "1.sock")], 0)
+    request = {"command": "ping", "session": "1.abc"}
+    assert router.owner(request) == 1
+    assert list(router.forward(1, request)) == [{"success": False, "error": UNKNOWN_SESSION}]
+
+
+@pytest.mark.parametrize("token, owner", [("1.abc", 1), ("0.abc", None), ("7.abc", None), ("abc", None),
+                                          ("x.abc", None), (None, None), (12, None)])
+def test_owner_of_a_token(token, owner):
+    assert SessionRouter(["a", "b"], 0).owner({"session": token}) == owner
+
+
+def test_process_pool_budget_is_split_between_workers():
+    assert Supervisor(CalculatorServer, {"process_workers": 8}, workers=4).options["process_workers"] == 2
+    assert Supervisor(CalculatorServer, {"process_workers": 2}, workers=4).options["process_workers"] == 1
+    cores = os.cpu_count() or 1
+    assert Supervisor(CalculatorServer, {"process_workers": 0}, workers=2).options["process_workers"] == max(1, cores // 2)
+    assert "process_workers" not in Supervisor(CalculatorServer, {}, workers=2).options
@@ -0,0 +1,54 @@
+import pytest
+
+from server import ScientificCalculator
+from vectorized import count_points
+
+
+def sweep(expression, start, stop, step, **options):
+    return list(ScientificCalculator().tabulate(expression, "x", start, stop, step, **options))
+
+
+def test_range_is_inclusive_and_tolerates_rounding():
+    assert count_points(0, 10, 1) == 11
+    assert count_points(0, 1, 0.1) == 11
+    assert count_points(5, 0, -1) == 6
+
+
+@pytest.mark.parametrize("start, stop, step", [(0, 1, 0), (0, 1, -1), (0, float("inf"), 1)])
+def test_bad_ranges_are_rejected(start, stop, step):
+    with pytest.raises(ValueError):
+        count_points(start, stop, step)
+
+
+def test_results_arrive_in_chunks_then_a_summary():
+    chunks = sweep("x ** 2", 0, 9, 1, chunk_size=4)
+    assert [chunk["index"] for chunk in chunks[:-1]] == [0, 4, 8]
+    assert [value for chunk in chunks[:-1] for value in chunk["results"]] == [x ** 2 for x in range(10)]
+    assert chunks[0]["x"] == [0.0, 1.0, 2.0, 3.0]
+    assert not any(chunk["done"] for chunk in chunks[:-1])
+    assert chunks[-1] == {"success": True, "command": "tabulate", "done": True, "count": 10}
+
+
+def test_x_values_can_be_left_out():
+    chunk, _ = sweep("x + 1", 0, 2, 1, include_x=False)
+    assert "x" not in chunk and chunk["results"] == [1, 2, 3]
+
+
+def test_failing_points_are_none():
+    chunk, _ = sweep("1 / x", -1, 1, 1)
+    assert chunk["results"] == [-1, None, 1]
+
+
+def test_chunks_are_produced_lazily():
+    chunks = ScientificCalculator().tabulate("x", "x", 0, 10 ** 7, 1, chunk_size=10)
+    assert next(chunks)["results"] == list(range(10))
+
+
+@pytest.mark.parametrize("expression, start, stop, step, error", [
+    ("x +", 0, 1, 1, "Invalid expression"),
+    ("x + y", 0, 1, 1, "Error: name 'y' is not defined"),
+    ("x", 0, 1, 0, "Math error: Range bounds and step must be finite and step must be non-zero"),
+])
+def test_errors_end_the_stream(expression, start, stop, step, error):
+    chunks = sweep(expression, start, stop, step)
+    assert chunks == [{"success": False, "command": "tabulate", "done": True, "error": error}]
@@ -0,0 +1,75 @@
+import asyncio
+import errno
+import os
+import socket
+import threading
+
+import pytest
+
+from client import CalculatorClient
+from server import AsyncCalculatorServer, CalculatorServer
+from upstream import UpstreamPool
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix domain sockets")
+
+
+def test_stale_socket_file_is_replaced(tmp_path):
+    path = str(tmp_path / "stale.sock")
+    leftover = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    leftover.bind(path)
+    leftover.close()
+    assert os.path.exists(path)
+    CalculatorServer.listen_unix(path, 1).close()
+
+
+def test_socket_of_a_live_server_is_not_taken_over(tmp_path):
+    path = str(tmp_path / "live.sock")
+    live = CalculatorServer.listen_unix(path, 1)
+    try:
+        with pytest.raises(OSError) as error:
+            CalculatorServer.listen_unix(path, 1)
+        assert error.value.errno == errno.EADDRINUSE
+    finally:
+        live.close()
+
+
+def test_other_files_are_left_alone(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("keep me")
+    with pytest.raises(FileExistsError):
+        CalculatorServer.listen_unix(str(path), 1)
+    assert path.read_text() == "keep me"
+
+
+@pytest.mark.parametrize("server_class", [CalculatorServer, AsyncCalculatorServer])
+def test_clients_reach_the_server_over_its_socket(server_class, tmp_path):
+    server = server_class(path=str(tmp_path / "calculator.sock"))
+    threading.Thread(target=server.start, daemon=True).start()
+    assert server.wait_until_ready(5)
+    try:
+        client = CalculatorClient(path=server.path)
+        assert client.connect()
+        assert client.calculate("6 * 7")["result"] == 42
+        client.disconnect()
+
+        async def through_pool():
+            pool = UpstreamPool(path=server.path, size=2)
+            try:
+                return await asyncio.gather(*[pool.request({"command": "ping"}, 5) for _ in range(4)])
+            finally:
+                await pool.close()
+        assert all(response["success"] for response in asyncio.run(through_pool()))
+    finally:
+        server.stop()
+
+
+@pytest.mark.parametrize("server_class", [CalculatorServer, AsyncCalculatorServer])
+def test_socket_file_is_removed_when_the_server_stops(server_class, tmp_path):
+    server = server_class(path=str(tmp_path / "calculator.sock"))
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    assert server.wait_until_ready(5)
+    assert os.path.exists(server.path)
+    server.stop()
+    thread.join(5)
+    assert not os.path.exists(server.path)
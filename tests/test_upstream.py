@@ -0,0 +1,162 @@
+import asyncio
+import time
+
+import pytest
+
+from protocol import AsyncMessageReader, encode_message
+from upstream import UpstreamPool
+
+
+class SlowServer:
+    """
+    Answers each connection's requests one after another, as the calculator
+    server does, taking `delay` seconds over an expression "slow"
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.connections = 0
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        messages = AsyncMessageReader(reader)
+        while True:
+            request = await messages.read()
+            if request is None:
+                break
+            if request.get("expression") == "slow":
+                await asyncio.sleep(self.delay)
+            response = {"success": True, "result": request.get("expression"), "id": request["id"]}
+            try:
+                writer.write(encode_message(response))
+                await writer.drain()
+            except ConnectionError:
+                break
+        writer.close()
+
+
+async def serve(delay, test):
+    server_state = SlowServer(delay)
+    server = await asyncio.start_server(server_state.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        async with server:
+            await test(server_state, port)
+    finally:
+        server.close()
+
+
+def calculate(pool, expression, timeout=None):
+    return pool.request({"command": "calculate", "expression": expression}, timeout)
+
+
+def test_fast_request_is_not_held_up_by_a_slow_one():
+    async def test(server, port):
+        pool = UpstreamPool("127.0.0.1", port, size=2)
+        await calculate(pool, "warm")
+        started = time.perf_counter()
+        slow = asyncio.ensure_future(calculate(pool, "slow"))
+        await asyncio.sleep(0.05)
+        assert (await calculate(pool, "fast"))["result"] == "fast"
+        assert time.perf_counter() - started < 0.5
+        assert (await slow)["result"] == "slow"
+        assert pool.stats()["in_flight"] == 0
+        await pool.close()
+
+    asyncio.run(serve(1.0, test))
+
+
+def test_requests_wait_for_a_free_connection():
+    async def test(server, port):
+        pool = UpstreamPool("127.0.0.1", port, size=1)
+        slow = asyncio.ensure_future(calculate(pool, "slow"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await calculate(pool, "fast", timeout=0.1)
+        assert (await calculate(pool, "fast"))["result"] == "fast"
+        assert (await slow)["success"]
+        assert server.connections == 1
+        await pool.close()
+
+    asyncio.run(serve(0.5, test))
+
+
+def test_client_ids_are_kept():
+    async def test(server, port):
+        pool = UpstreamPool("127.0.0.1", port)
+        assert (await pool.request({"command": "calculate", "expression": "1", "id": "abc"}))["id"] == "abc"
+        assert "id" not in await calculate(pool, "1")
+        await pool.close()
+
+    asyncio.run(serve(0, test))
+
+
+def test_slow_request_does_not_make_its_connection_unhealthy():
+    async def test(server, port):
+        pool = UpstreamPool("127.0.0.1", port, size=2, health_check_interval=0)
+        await asyncio.gather(calculate(pool, "a"), calculate(pool, "b"))
+        slow, fast = await asyncio.gather(calculate(pool, "slow"), calculate(pool, "fast"))
+        assert slow["result"] == "slow" and fast["result"] == "fast"
+        assert server.connections == 2
+
+    asyncio.run(serve(0.5, test))
+
+
+def test_abandoned_request_does_not_delay_the_next_one():
+    async def test(server, port):
+        pool = UpstreamPool("127.0.0.1", port, size=1, health_check_interval=0)
+        await calculate(pool, "warm")
+        with pytest.raises(asyncio.TimeoutError):
+            await calculate(pool, "slow", timeout=0.1)
+        started = time.perf_counter()
+        assert (await calculate(pool, "fast"))["result"] == "fast"
+        assert time.perf_counter() - started < 0.5
+        assert pool.stats()["backoff"] == 0
+        await pool.close()
+
+    asyncio.run(serve(2.0, test))
+
+
+class OneReplyServer:
+    """Answers the first request on each connection, then takes the next one and closes without replying"""
+
+    def __init__(self):
+        self.received = []
+
+    async def handle(self, reader, writer):
+        messages = AsyncMessageReader(reader)
+        replied = False
+        while True:
+            request = await messages.read()
+            if request is None:
+                break
+            self.received.append(request)
+            if replied:
+                break
+            writer.write(encode_message({"success": True, "id": request["id"]}))
+            await writer.drain()
+            replied = True
+        writer.close()
+
+
+@pytest.mark.parametrize("message, sends", [
+    ({"command": "calculate", "expression": "1"}, 2),
+    ({"command": "memory", "operation": "add", "value": 1}, 1),
+])
+def test_only_requests_safe_to_repeat_are_resent_after_a_connection_closes(message, sends):
+    async def main():
+        server_state = OneReplyServer()
+        server = await asyncio.start_server(server_state.handle, "127.0.0.1", 0)
+        pool = UpstreamPool("127.0.0.1", server.sockets[0].getsockname()[1], size=1)
+        async with server:
+            await pool.request({"command": "ping"})
+            if sends > 1:
+                assert (await pool.request(message))["success"]
+            else:
+                with pytest.raises(ConnectionError):
+                    await pool.request(message)
+            await pool.close()
+        return [request for request in server_state.received if request["command"] != "ping"]
+
+    received = asyncio.run(main())
+    assert len(received) == sends
@@ -0,0 +1,71 @@
+import pytest
+
+import vectorized
+from expression import Expression
+from protocol import encode_message
+from server import CalculatorServer
+from vectorized import evaluate_batch
+
+
+@pytest.fixture(params=["numpy", "scalar"])
+def batch(request, monkeypatch):
+    """evaluate_batch with and without the vectorized path"""
+    if request.param == "numpy":
+        if not vectorized.NUMPY_AVAILABLE:
+            pytest.skip("NumPy is not installed")
+    else:
+        monkeypatch.setattr(vectorized, "NUMPY_AVAILABLE", False)
+    return lambda source, **columns: evaluate_batch(Expression(source), columns)
+
+
+def test_columns_are_evaluated_row_by_row(batch):
+    assert batch("x * y + 1", x=[1, 2, 3], y=[4, 5, 6]) == [5, 11, 19]
+
+
+def test_scalar_columns_are_broadcast(batch):
+    assert batch("x + y", x=[1, 2], y=10) == [11, 12]
+
+
+def test_failing_rows_are_none(batch):
+    assert batch("sqrt(x)", x=[4, -1]) == [2.0, None]
+    assert batch("1 / x", x=[0, 2]) == [None, 0.5]
+
+
+def test_error_in_a_constant_fails_every_row(batch):
+    assert batch("1/0 + x", x=[1, 2]) == [None, None]
+
+
+def test_overflowing_row_does_not_fail_the_batch(batch):
+    assert batch("factorial(x) + 0.5", x=[3, 200]) == [6.5, None]
+
+
+def test_huge_integers_come_back_as_text(batch):
+    small, huge = batch("factorial(x)", x=[5, 2000])
+    assert small == 120
+    assert isinstance(huge, str) and huge.endswith("e+5735")
+
+
+@pytest.mark.parametrize("source, columns, expected", [
+    ("gcd(x, y, 2)", {"x": [12, 8], "y": [18, 4]}, [2, 2]),
+    ("lcm(x, y, 4)", {"x": [3, 5], "y": [2, 7]}, [12, 140]),
+    ("binomial(x, 2)", {"x": [3, 5]}, [3, 10]),
+])
+def test_integer_functions_take_any_number_of_arguments(batch, source, columns, expected):
+    assert batch(source, **columns) == expected
+
+
+def test_columns_must_have_equal_length(batch):
+    with pytest.raises(ValueError):
+        batch("x + y", x=[1, 2], y=[1, 2, 3])
+
+
+def test_missing_variable_is_a_name_error(batch):
+    with pytest.raises(NameError):
+        batch("x + z", x=[1])
+
+
+def test_batch_response_can_be_encoded():
+    response = CalculatorServer().handle_request(
+        {"command": "calculate_batch", "expression": "factorial(x)", "variables": {"x": [5, 2000]}})
+    assert response["success"] and response["errors"] == 0
+    encode_message(response)
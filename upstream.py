@@ -0,0 +1,310 @@
+"""
+Upstream Connection Pool
+========================
+
+Keeps long-lived asyncio connections from a WebSocket bridge to the
+calculator server, so each message costs one round trip instead of a TCP
+connect and teardown and never blocks the bridge's event loop.
+
+The server answers the requests on one connection strictly in turn, in
+either server mode, so a slow calculation would hold up every request
+queued behind it on the same connection. The pool therefore lends each
+request a connection of its own for the round trip and takes it back
+afterwards: up to `size` requests are in flight at once, and further
+requests wait for a connection to come free, within their timeout. Size the
+pool for the concurrency the bridge needs. Requests carry pool-assigned
+ids, so a reply that does not belong to the current request is never
+mistaken for its answer. A connection whose request timed out or was
+cancelled is closed rather than reused, since the server is still busy with
+that request; a slow calculation therefore never fails a health check or
+delays a later request. A request that fails on a reused connection is sent
+once more on a fresh one, unless it is not safe to repeat (adding to
+memory), since the server may have carried it out before the connection
+closed. Connections are health-checked after sitting idle, replaced when
+they break, and new connections back off exponentially while the server is
+unreachable. With encoding='binary' each connection negotiates the compact
+binary framing from protocol.py right after connecting. Given a path, the
+pool connects over a Unix domain socket instead of TCP.
+
+Bridges share the pool between all their downstream clients, so each client
+gets an UpstreamSession: a session token asked of the server on first use,
+and asked for again if the server has since forgotten it (it restarted, or
+the session sat idle past its timeout).
+"""
+
+import asyncio
+import itertools
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from protocol import AsyncMessageReader, ProtocolError, encode_message
+from sessions import UNKNOWN_SESSION
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_TIMEOUT = 10.0
+HEALTH_CHECK_INTERVAL = 30.0
+HEALTH_CHECK_TIMEOUT = 2.0
+BACKOFF_INITIAL = 0.1
+BACKOFF_MAX = 5.0
+
+
+def retryable(request: Dict[str, Any]) -> bool:
+    """Adding to memory twice is not harmless, so such a request is never resent"""
+    return not (request.get("command") == "memory" and request.get("operation") == "add")
+
+
+class _UpstreamConnection:
+    """One persistent connection, used by one request at a time"""
+
+    def __init__(self, messages: AsyncMessageReader, writer, generation: int = 0):
+        self.messages = messages
+        self.writer = writer
+        self.generation = generation
+        self.last_used = time.monotonic()
+        self.requests = 0
+        self.closed = False
+
+    async def exchange(self, request: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """Send one request and wait for the response with the same id"""
+        if self.closed:
+            raise ConnectionError("Calculator server closed the connection")
+        try:
+            self.writer.write(encode_message(request, self.messages.encoding))
+            await self.writer.drain()
+            response = await asyncio.wait_for(self._receive(request["id"]), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # The server is still working on the abandoned request and would only
+            # get to the next one after it, so the connection is not reused
+            self.closed = True
+            self.writer.close()
+            raise
+        except (OSError, ValueError, ProtocolError, asyncio.IncompleteReadError) as e:
+            self.closed = True
+            if isinstance(e, ConnectionError):
+                raise
+            raise ConnectionError("Calculator server closed the connection") from e
+        self.last_used = time.monotonic()
+        self.requests += 1
+        return response
+
+    async def _receive(self, request_id: int) -> Dict[str, Any]:
+        while True:
+            response = await self.messages.read()
+            if response is None:
+                raise ConnectionError("Calculator server closed the connection")
+            if response.get("id") == request_id:
+                return response
+
+    async def close(self):
+        self.closed = True
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (OSError, asyncio.CancelledError):
+            pass
+
+
+class UpstreamPool:
+    """Pool of persistent asyncio connections to the calculator server, one request on each at a time"""
+
+    def __init__(self, host: str = 'localhost', port: int = 8888, size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_TIMEOUT, health_check_interval: float = HEALTH_CHECK_INTERVAL,
+                 backoff_initial: float = BACKOFF_INITIAL, backoff_max: float = BACKOFF_MAX,
+                 encoding: str = 'json', path: Optional[str] = None):
+        self.host = host
+        self.port = port
+        # Unix domain socket of a server on the same host; used instead of host and port
+        self.path = path
+        self.encoding = encoding
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._idle: List[_UpstreamConnection] = []
+        self._busy = 0
+        self._slots = None
+        # Bumped by close(), so connections lent out at the time are dropped on return
+        self._generation = 0
+        self._ids = itertools.count(1)
+        self._backoff = 0.0
+        self._retry_at = 0.0
+
+    async def _open(self):
+        """Open a stream connection to the calculator server and negotiate its encoding"""
+        if self.path is not None:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        messages = AsyncMessageReader(reader)
+        if self.encoding != 'json':
+            writer.write(encode_message({"command": "hello", "encoding": self.encoding}))
+            response = await messages.read()
+            if response is None:
+                writer.close()
+                raise ConnectionError("Calculator server closed the connection")
+            # A server that does not know the encoding keeps talking JSON
+            if response.get("success"):
+                messages.encoding = self.encoding
+        return messages, writer
+
+    async def _connect(self) -> _UpstreamConnection:
+        """Open a pooled connection, honouring the reconnect backoff"""
+        now = time.monotonic()
+        if now < self._retry_at:
+            raise ConnectionRefusedError("Calculator server unavailable, retrying shortly")
+        try:
+            messages, writer = await asyncio.wait_for(self._open(), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            self._backoff = min(self.backoff_max, self._backoff * 2 or self.backoff_initial)
+            self._retry_at = time.monotonic() + self._backoff
+            raise
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        return _UpstreamConnection(messages, writer, self._generation)
+
+    async def _healthy(self, connection: _UpstreamConnection) -> bool:
+        """Ping a connection that has been idle for a while"""
+        if connection.closed:
+            return False
+        if time.monotonic() - connection.last_used < self.health_check_interval:
+            return True
+        try:
+            response = await connection.exchange({"command": "ping", "id": next(self._ids)}, HEALTH_CHECK_TIMEOUT)
+            return response.get("success", False)
+        except (ConnectionError, asyncio.TimeoutError):
+            return False
+
+    async def _checkout(self, timeout: float) -> _UpstreamConnection:
+        """Take an idle connection, or open one, waiting while all `size` are lent out"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError("Timed out waiting for an upstream connection") from None
+        self._busy += 1
+        try:
+            while self._idle:
+                connection = self._idle.pop()
+                if await self._healthy(connection):
+                    return connection
+                await connection.close()
+            return await self._connect()
+        except BaseException:
+            self._checkin(None)
+            raise
+
+    def _checkin(self, connection: Optional[_UpstreamConnection]):
+        """Take back a lent connection; broken ones are dropped"""
+        if connection is not None and not connection.closed:
+            if connection.generation == self._generation:
+                self._idle.append(connection)
+            else:
+                connection.writer.close()
+        self._busy -= 1
+        self._slots.release()
+
+    async def request(self, request: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Send a request over a pooled connection and return the response"""
+        client_id = request.get("id")
+        request = dict(request, id=next(self._ids))
+        timeout = self.timeout if timeout is None else timeout
+        for attempt in range(2):
+            connection = await self._checkout(timeout)
+            try:
+                response = await connection.exchange(request, timeout)
+            except ConnectionError:
+                # A pooled connection may have been closed by the server while idle, but the
+                # request may also have been carried out before it closed, so only resend
+                # requests that are safe to repeat
+                if attempt == 0 and connection.requests > 0 and retryable(request):
+                    continue
+                raise
+            finally:
+                self._checkin(connection)
+            if client_id is None:
+                response.pop("id", None)
+            else:
+                response["id"] = client_id
+            return response
+        raise ConnectionError("Calculator server closed the connection")
+
+    async def stream(self, request: Dict[str, Any], timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Send a streaming request on a dedicated connection and yield each message
+        until one has "done" set. Long streams do not hold up pooled requests.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        messages, writer = await asyncio.wait_for(self._open(), timeout)
+        try:
+            writer.write(encode_message(request, messages.encoding))
+            await writer.drain()
+            while True:
+                message = await asyncio.wait_for(messages.read(), timeout)
+                if message is None:
+                    raise ConnectionError("Calculator server closed the stream")
+                yield message
+                if message.get("done"):
+                    return
+        finally:
+            writer.close()
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the pool will try to reach the server again after a failure"""
+        return max(0.0, self._retry_at - time.monotonic())
+
+    async def close(self):
+        """Close all pooled connections; ones lent out are closed as they come back"""
+        self._generation += 1
+        connections, self._idle = self._idle, []
+        for connection in connections:
+            await connection.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool counters"""
+        return {
+            "size": self.size,
+            "open": len(self._idle) + self._busy,
+            "in_flight": self._busy,
+            "backoff": self._backoff,
+            "encoding": self.encoding
+        }
+
+class UpstreamSession:
+    """The server session of one downstream client of a shared pool"""
+
+    def __init__(self, pool: UpstreamPool):
+        self.pool = pool
+        self.token: Optional[str] = None
+
+    async def attach(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Name this client's session in a request that names none, opening the
+        session first if needed. If the server cannot be asked, the request
+        goes without one and its own failure is what the client sees.
+        """
+        if request.get("session", self.token) != self.token:
+            return request
+        if self.token is None:
+            try:
+                response = await self.pool.request({"command": "session"})
+            except (OSError, ProtocolError, asyncio.TimeoutError):
+                return request
+            self.token = response.get("session")
+        if self.token is not None:
+            request["session"] = self.token
+        return request
+
+    def forgotten(self, request: Dict[str, Any], response: Dict[str, Any]) -> bool:
+        """
+        Whether the server no longer knew this client's session. If so the
+        token is dropped, from the request too, and the next attach opens a
+        new session.
+        """
+        if self.token is None or request.get("session") != self.token or response.get("error") != UNKNOWN_SESSION:
+            return False
+        self.token = None
+        del request["session"]
+        return True
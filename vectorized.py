@@ -0,0 +1,221 @@
+"""
+Vectorized Evaluation
+=====================
+
+Evaluates one parsed expression over whole columns of input values.
+
+When NumPy is installed the function table is mapped onto NumPy ufuncs so a
+batch is a single vectorized pass; functions without a vectorized form
+(factorial, gcd, lcm, three-argument pow) fall back to scalar math applied
+element by element. Without NumPy every row is evaluated with the scalar
+evaluator instead, as is a batch whose vectorized pass raises (a Python int
+too large for a float, a division by a literal zero), so only the failing
+rows are lost. Integers too long for a JSON number come back as text, as
+they do from calculate.
+"""
+
+import math
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from expression import Expression, FUNCTIONS
+from intmath import format_integer, is_huge
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+MAX_BATCH_SIZE = 1_000_000
+MAX_TABULATE_POINTS = 100_000_000
+DEFAULT_CHUNK_SIZE = 4096
+
+
+def _integral(value):
+    """Turn integral floats into ints so integer-only math functions accept them"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _elementwise(func: Callable, nargs: int = None) -> Callable:
+    """
+    Apply a scalar function element by element, mapping failures to NaN.
+    Without `nargs` the function may be called with any number of arguments.
+    """
+    def safe(*args):
+        try:
+            return func(*[_integral(arg) for arg in args])
+        except (ArithmeticError, ValueError, TypeError):
+            return math.nan
+    if nargs is not None:
+        return np.frompyfunc(safe, nargs, 1)
+    
+    ufuncs = {}
+    
+    def apply(*args):
+        ufunc = ufuncs.get(len(args))
+        if ufunc is None:
+            ufunc = ufuncs[len(args)] = np.frompyfunc(safe, len(args), 1)
+        return ufunc(*args)
+    return apply
+
+
+def _build_numpy_functions() -> Dict[str, Any]:
+    """Map the scalar function table onto NumPy equivalents"""
+    table = {
+        "sin": np.sin,
+        "cos": np.cos,
+        "tan": np.tan,
+        "asin": np.arcsin,
+        "acos": np.arccos,
+        "atan": np.arctan,
+        "sinh": np.sinh,
+        "cosh": np.cosh,
+        "tanh": np.tanh,
+        "log": np.log10,
+        "ln": np.log,
+        "log10": np.log10,
+        "log2": np.log2,
+        "sqrt": np.sqrt,
+        "exp": np.exp,
+        "abs": np.abs,
+        "floor": np.floor,
+        "ceil": np.ceil,
+        "round": lambda x, ndigits=0: np.round(x, ndigits),
+        "degrees": np.degrees,
+        "radians": np.radians,
+    }
+    modular_pow = _elementwise(pow, 3)
+    table["pow"] = lambda x, y, mod=None: np.power(x, y) if mod is None else modular_pow(x, y, mod)
+
+    for name, func in FUNCTIONS.items():
+        if name in table:
+            continue
+        if callable(func):
+            table[name] = _elementwise(func)
+        else:
+            table[name] = func
+    return table
+
+
+NUMPY_FUNCTIONS = MappingProxyType(_build_numpy_functions()) if NUMPY_AVAILABLE else None
+
+
+def _check_columns(columns: Dict[str, Any]) -> int:
+    """Validate input columns and return the batch length"""
+    length = None
+    for name, values in columns.items():
+        if isinstance(values, (list, tuple)) or (NUMPY_AVAILABLE and isinstance(values, np.ndarray)):
+            if length is None:
+                length = len(values)
+            elif len(values) != length:
+                raise ValueError(f"Column '{name}' has {len(values)} values, expected {length}")
+    if length is None:
+        length = 1
+    if length > MAX_BATCH_SIZE:
+        raise ValueError(f"Batch too large: {length} rows (maximum {MAX_BATCH_SIZE})")
+    return length
+
+
+def _cell(value):
+    """One row's result: None for a non-finite float, text for a huge int"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, int) and is_huge(value):
+        return format_integer(value)
+    return value
+
+
+def _evaluate_numpy(expression: Expression, columns: Dict[str, Any], length: int) -> List[Any]:
+    """Single vectorized pass over all rows"""
+    env = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+    evaluate = expression.compile(NUMPY_FUNCTIONS)
+    try:
+        with np.errstate(all='ignore'):
+            result = np.broadcast_to(evaluate(env), (length,))
+    except (ArithmeticError, ValueError, TypeError):
+        # Errors NumPy cannot turn into NaN abort the whole pass; find the failing rows one by one
+        return _evaluate_scalar(expression, {name: values.tolist() for name, values in env.items()}, length)
+
+    if result.dtype == object:
+        return [_cell(value) for value in result.tolist()]
+
+    result = result.astype(np.float64, copy=False)
+    finite = np.isfinite(result)
+    if finite.all():
+        return result.tolist()
+    values = result.astype(object)
+    values[~finite] = None
+    return values.tolist()
+
+
+def _evaluate_scalar(expression: Expression, columns: Dict[str, Any], length: int) -> List[Any]:
+    """Row-by-row fallback used when NumPy is unavailable"""
+    names = list(columns)
+    series = [columns[name] if isinstance(columns[name], (list, tuple)) else [columns[name]] * length
+              for name in names]
+    results = []
+    for row in range(length):
+        env = {name: values[row] for name, values in zip(names, series)}
+        try:
+            value = expression.evaluate(env)
+        except (ArithmeticError, ValueError, TypeError):
+            value = None
+        results.append(_cell(value))
+    return results
+
+
+def evaluate_batch(expression: Expression, columns: Dict[str, Sequence[float]]) -> List[Any]:
+    """
+    Evaluate an expression for every row of the given variable columns.
+    Rows that fail (domain errors, division by zero) yield None.
+    """
+    missing = expression.variables - set(columns)
+    if missing:
+        raise NameError(f"name '{sorted(missing)[0]}' is not defined")
+    length = _check_columns(columns)
+    if NUMPY_AVAILABLE:
+        return _evaluate_numpy(expression, columns, length)
+    return _evaluate_scalar(expression, columns, length)
+
+
+def count_points(start: float, stop: float, step: float) -> int:
+    """Number of points in the inclusive range start..stop"""
+    if step == 0 or not all(math.isfinite(v) for v in (start, stop, step)):
+        raise ValueError("Range bounds and step must be finite and step must be non-zero")
+    span = (stop - start) / step
+    if span < 0:
+        raise ValueError("Step points away from the end of the range")
+    # Tolerate rounding so that 0..10 step 0.1 includes 10
+    points = int(math.floor(span + 1e-9)) + 1
+    if points > MAX_TABULATE_POINTS:
+        raise ValueError(f"Range too large: {points} points (maximum {MAX_TABULATE_POINTS})")
+    return points
+
+
+def tabulate(expression: Expression, variable: str, start: float, stop: float, step: float,
+             chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[int, List[float], List[Any]]]:
+    """
+    Lazily evaluate an expression over an inclusive range of one variable.
+    Yields (first_index, x_values, results) chunks so memory stays bounded
+    by the chunk size no matter how long the sweep is.
+    """
+    extra = expression.variables - {variable}
+    if extra:
+        raise NameError(f"name '{sorted(extra)[0]}' is not defined")
+    points = count_points(start, stop, step)
+    chunk_size = max(1, min(int(chunk_size), MAX_BATCH_SIZE))
+
+    for first in range(0, points, chunk_size):
+        last = min(first + chunk_size, points)
+        if NUMPY_AVAILABLE:
+            xs = start + step * np.arange(first, last, dtype=np.float64)
+            results = _evaluate_numpy(expression, {variable: xs}, last - first)
+            xs = xs.tolist()
+        else:
+            xs = [start + step * index for index in range(first, last)]
+            results = _evaluate_scalar(expression, {variable: xs}, last - first)
+        yield first, xs, results
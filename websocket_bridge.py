@@ -1,128 +1,189 @@
+import argparse
 import asyncio
 import websockets
-import socket
 import json
 import threading
 import logging
-from typing import Dict, Any
+import time
+from typing import Dict, Any, AsyncIterator
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from bridge_logging import DEFAULT_RING_SIZE, MessageLog, configure_logging
+from protocol import json_default
+
+from upstream import DEFAULT_POOL_SIZE, UpstreamPool, UpstreamSession
+
+logger = logging.getLogger(__name__)
 
 class WebSocketToSocketBridge:
     """Bridge between WebSocket clients and Python socket server"""
     
-    def __init__(self, websocket_host='localhost', websocket_port=8080, socket_host='localhost', socket_port=8888):
+    def __init__(self, websocket_host='localhost', websocket_port=8080, socket_host='localhost', socket_port=8888,
+                 pool_size=DEFAULT_POOL_SIZE, upstream_encoding='json', log_sample_rate=1.0,
+                 recent_size=DEFAULT_RING_SIZE, socket_path=None, debug=False):
         self.websocket_host = websocket_host
         self.websocket_port = websocket_port
         self.socket_host = socket_host
         self.socket_port = socket_port
+        # Unix domain socket of a calculator server on the same host, used instead of TCP
+        self.socket_path = socket_path
+        self.upstream = UpstreamPool(socket_host, socket_port, size=pool_size, encoding=upstream_encoding,
+                                     path=socket_path)
         self.clients = set()
+        self.message_log = MessageLog(logger, sample_rate=log_sample_rate, ring_size=recent_size,
+                                      keep_recent=debug)
+        # Answer bridge_stats with recent requests; off by default, as they include other browsers' traffic
+        self.debug = debug
+        self.running = False
+        # Set once the bridge is listening, or once starting it has failed
+        self.ready = threading.Event()
         
     async def handle_websocket_client(self, websocket, path=None):
         """Handle WebSocket client connections"""
         self.clients.add(websocket)
         client_address = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
-        logging.info(f"WebSocket client connected from {client_address}")
+        # Upstream connections are shared, so each browser gets its own calculator session
+        session = UpstreamSession(self.upstream)
+        logger.info("WebSocket client connected from %s", client_address)
         
         try:
             welcome_msg = {"success": True, "message": "Connected to calculator server", "type": "connection"}
             await websocket.send(json.dumps(welcome_msg))
             
             async for message in websocket:
+                started = time.perf_counter()
+                sampled = self.message_log.sample()
                 try:
-                    logging.info(f"Received from {client_address}: {message}")
+                    if sampled:
+                        self.message_log.log("Received from %s: %s", client_address, message)
                     
                     request = json.loads(message)
+                    if self.debug and request.get("command") == "bridge_stats":
+                        await websocket.send(json.dumps(self.bridge_stats(request.get("limit")), default=json_default))
+                        continue
+                    await session.attach(request)
+                    
+                    if request.get("command") == "tabulate":
+                        async for chunk in self.stream_from_socket_server(request):
+                            await websocket.send(json.dumps(chunk, default=json_default))
+                        session.forgotten(request, chunk)
+                        self.message_log.record(client_address, request, chunk, started, len(message))
+                        continue
                     
                     response = await self.forward_to_socket_server(request)
+                    if session.forgotten(request, response):
+                        # The server restarted or dropped the idle session; carry on in a new one
+                        response = await self.forward_to_socket_server(await session.attach(request))
                     
-                    logging.info(f"Sending to {client_address}: {response}")
+                    if sampled:
+                        self.message_log.log("Sending to %s: %s", client_address, response)
                     
-                    await websocket.send(json.dumps(response))
+                    await websocket.send(json.dumps(response, default=json_default))
+                    self.message_log.record(client_address, request, response, started, len(message))
                     
                 except json.JSONDecodeError as e:
                     error_response = {"success": False, "error": f"Invalid JSON format: {str(e)}"}
                     await websocket.send(json.dumps(error_response))
                 except Exception as e:
-                    logging.error(f"Error processing message from {client_address}: {e}")
+                    logger.error("Error processing message from %s: %s", client_address, e)
                     error_response = {"success": False, "error": f"Bridge error: {str(e)}"}
                     await websocket.send(json.dumps(error_response))
                     
         except websockets.exceptions.ConnectionClosed:
-            logging.info(f"WebSocket client {client_address} disconnected normally")
+            logger.info("WebSocket client %s disconnected normally", client_address)
         except websockets.exceptions.ConnectionClosedError:
-            logging.info(f"WebSocket client {client_address} disconnected unexpectedly")
+            logger.info("WebSocket client %s disconnected unexpectedly", client_address)
         except Exception as e:
-            logging.error(f"Error handling WebSocket client {client_address}: {e}")
+            logger.error("Error handling WebSocket client %s: %s", client_address, e)
         finally:
             self.clients.discard(websocket)
-            logging.info(f"Cleaned up connection with {client_address}")
+            logger.info("Cleaned up connection with %s", client_address)
+    
+    def bridge_stats(self, limit=None) -> Dict[str, Any]:
+        """The bridge's own counters and most recent requests"""
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit < 0:
+            limit = None
+        return {"success": True, "type": "bridge_stats", "clients": len(self.clients),
+                "upstream": self.upstream.stats(), "recent": self.message_log.recent_requests(limit)}
     
     async def forward_to_socket_server(self, request: Dict[str, Any]) -> Dict[str, Any]:
         """Forward request to Python socket server and return response"""
         try:
-            logging.info(f"Forwarding to socket server: {request}")
-            
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(10)
-            
-            sock.connect((self.socket_host, self.socket_port))
+            logger.debug("Forwarding to socket server: %s", request)
             
-            request_json = json.dumps(request)
-            sock.send(request_json.encode('utf-8'))
+            response = await self.upstream.request(request)
             
-            response_data = sock.recv(4096).decode('utf-8') 
-            response = json.loads(response_data)
-            
-            sock.close()
-            
-            logging.info(f"Received from socket server: {response}")
+            logger.debug("Received from socket server: %s", response)
             return response
             
-        except socket.timeout:
-            logging.error("Socket server timeout")
+        except asyncio.TimeoutError:
+            logger.error("Socket server timeout")
             return {"success": False, "error": "Calculator server timeout"}
-        except ConnectionRefusedError:
-            logging.error("Socket server connection refused")
+        except (ConnectionRefusedError, FileNotFoundError):
+            logger.error("Socket server connection refused")
             return {"success": False, "error": "Calculator server not available. Make sure server.py is running."}
         except json.JSONDecodeError as e:
-            logging.error(f"Invalid JSON from socket server: {e}")
+            logger.error("Invalid JSON from socket server: %s", e)
             return {"success": False, "error": "Invalid response from calculator server"}
         except Exception as e:
-            logging.error(f"Socket communication error: {e}")
+            logger.error("Socket communication error: %s", e)
             return {"success": False, "error": f"Communication error: {str(e)}"}
     
+    async def stream_from_socket_server(self, request: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Forward a streaming request and yield each newline-delimited chunk as it arrives"""
+        try:
+            logger.debug("Streaming from socket server: %s", request)
+            async for chunk in self.upstream.stream(request):
+                yield chunk
+                    
+        except asyncio.TimeoutError:
+            logger.error("Socket server timeout")
+            yield {"success": False, "done": True, "error": "Calculator server timeout"}
+        except (ConnectionRefusedError, FileNotFoundError):
+            logger.error("Socket server connection refused")
+            yield {"success": False, "done": True, "error": "Calculator server not available. Make sure server.py is running."}
+        except json.JSONDecodeError as e:
+            logger.error("Invalid JSON from socket server: %s", e)
+            yield {"success": False, "done": True, "error": "Invalid response from calculator server"}
+        except Exception as e:
+            logger.error("Socket communication error: %s", e)
+            yield {"success": False, "done": True, "error": f"Communication error: {str(e)}"}
+    
     async def start_websocket_server(self):
         """Start the WebSocket server"""
-        logging.info(f"Starting WebSocket bridge on {self.websocket_host}:{self.websocket_port}")
-        logging.info(f"Connecting to calculator server at {self.socket_host}:{self.socket_port}")
+        logger.info(f"Starting WebSocket bridge on {self.websocket_host}:{self.websocket_port}")
+        logger.info(f"Connecting to calculator server at {self.socket_path or f'{self.socket_host}:{self.socket_port}'}")
         
         try:
-            test_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            test_sock.settimeout(5)
-            test_sock.connect((self.socket_host, self.socket_port))
-            
             test_request = {"command": "ping"}
-            test_sock.send(json.dumps(test_request).encode('utf-8'))
-            test_response = test_sock.recv(1024).decode('utf-8')
-            test_sock.close()
+            await self.upstream.request(test_request, timeout=5)
             
-            logging.info("✓ Calculator server is reachable and responding")
+            logger.info("✓ Calculator server is reachable and responding")
         except Exception as e:
-            logging.warning(f"⚠ Warning: Cannot reach calculator server: {e}")
-            logging.warning("Make sure to run 'python server.py' before connecting clients")
-        
-        server = await websockets.serve(
-            self.handle_websocket_client,
-            self.websocket_host,
-            self.websocket_port
-        )
+            logger.warning(f"⚠ Warning: Cannot reach calculator server: {e}")
+            logger.warning("Make sure to run 'python server.py' before connecting clients")
         
-        logging.info(f"✓ WebSocket bridge running on ws://{self.websocket_host}:{self.websocket_port}")
-        logging.info("Open the calculator.html file in your browser to use the calculator")
-        logging.info("Press Ctrl+C to stop the server")
-        
-        await server.wait_closed()
+        try:
+            server = await websockets.serve(
+                self.handle_websocket_client,
+                self.websocket_host,
+                self.websocket_port
+            )
+            
+            logger.info(f"✓ WebSocket bridge running on ws://{self.websocket_host}:{self.websocket_port}")
+            logger.info("Open the calculator.html file in your browser to use the calculator")
+            logger.info("Press Ctrl+C to stop the server")
+            self.running = True
+            self.ready.set()
+            
+            await server.wait_closed()
+        finally:
+            self.running = False
+            self.ready.set()
+            await self.upstream.close()
+    
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """Block until the bridge is listening; False if it failed to start or timed out"""
+        return self.ready.wait(timeout) and self.running
     
     def run(self):
         """Run the WebSocket bridge"""
@@ -133,6 +194,18 @@ class WebSocketToSocketBridge:
         except Exception as e:
             print(f"Error running WebSocket bridge: {e}")
 
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="WebSocket bridge to the calculator server")
+    parser.add_argument("--unix-socket", metavar="PATH", default=None,
+                        help="reach the calculator server over this Unix domain socket instead of TCP")
+    parser.add_argument("--debug", action="store_true",
+                        help="answer the bridge_stats command with the bridge's recent requests")
+    args = parser.parse_args()
+    configure_logging()
+    
+    bridge = WebSocketToSocketBridge(socket_path=args.unix_socket, debug=args.debug)
+    bridge.run()
+
 if __name__ == "__main__":
-    bridge = WebSocketToSocketBridge()
-    bridge.run()
\ No newline at end of file
+    main()
\ No newline at end of file